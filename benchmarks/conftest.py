@@ -0,0 +1,156 @@
+"""
+Benchmark harness: times the hot and persistence paths and compares them with
+JSON baselines.
+
+    pytest benchmarks                     # fail on a >10% regression
+    pytest benchmarks --update-baselines  # record new baselines
+
+Running `pytest benchmarks` is the required check before merging a change to
+the counting or persistence paths; CI only reports the timings, since shared
+runners are too noisy to gate on.
+
+Each benchmark runs a fixed number of operations per round, with the garbage
+collector paused, and keeps the fastest round. That time is divided by the
+fastest run of a fixed pure-Python reference workload timed between the
+rounds, so baselines recorded on one machine stay meaningful on another and
+a busy machine slows both alike. Baselines are the median of three
+measurements; a benchmark over its limit is measured again up to twice, and
+only fails if every measurement is over. A baseline may carry its own
+`tolerance` for a benchmark too noisy for the default.
+"""
+
+import gc
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+BASELINE_FILE = Path(__file__).parent / "baselines.json"
+
+_results_key = pytest.StashKey[dict]()
+
+DEFAULT_TOLERANCE = 0.10
+DEFAULT_ROUNDS = 15
+# Extra measurements of a benchmark over its limit before it is failed, and
+# of each benchmark when recording baselines
+CONFIRM_ATTEMPTS = 2
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarks")
+    group.addoption("--update-baselines", action="store_true", help="Record the results as the new baselines")
+    group.addoption("--baseline-file", default=str(BASELINE_FILE), help="JSON file holding the baselines")
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="Allowed slowdown against the baseline, as a fraction, for baselines without their own tolerance "
+        "(default 0.10)",
+    )
+
+
+def _reference_workload():
+    total = 0
+    table = {}
+    for i in range(20000):
+        total += i * i % 7
+        table[i & 255] = total
+    return total
+
+
+def _time_once(run, operations):
+    start = time.perf_counter()
+    run(operations)
+    return time.perf_counter() - start
+
+
+class Bench:
+    """Runs benchmarks and checks them against the baselines."""
+
+    def __init__(self, baselines, tolerance, update):
+        self.baselines = baselines
+        self.tolerance = tolerance
+        self.update = update
+        self.results = {}
+
+    def __call__(self, name, run, operations, rounds=DEFAULT_ROUNDS):
+        """Time `run(operations)` and return the seconds per operation.
+
+        Fails if the normalised time is more than the tolerance above the
+        baseline for `name`.
+        """
+        # Warm up caches and lazily built state before timing
+        run(max(1, operations // 10))
+        if self.update:
+            # Record a typical run rather than the luckiest one
+            runs = sorted(self._measure(run, operations, rounds) for _ in range(1 + CONFIRM_ATTEMPTS))
+            best, score = runs[len(runs) // 2]
+        else:
+            best, score = self._measure(run, operations, rounds)
+
+        baseline = self.baselines.get(name)
+        if self.update or baseline is None:
+            limit = None
+        else:
+            limit = baseline["score"] * (1.0 + baseline.get("tolerance", self.tolerance))
+        # A one-off slow measurement is usually the machine, so confirm a regression before failing
+        for _ in range(CONFIRM_ATTEMPTS):
+            if limit is None or score <= limit:
+                break
+            best, score = map(min, zip((best, score), self._measure(run, operations, rounds)))
+
+        self.results[name] = {"seconds_per_op": best, "ops_per_second": 1.0 / best, "score": score}
+        if limit is not None:
+            assert score <= limit, (
+                f"{name} regressed: {best * 1e6:.2f} us/op, score {score:.4g} "
+                f"vs baseline {baseline['score']:.4g} (+{score / baseline['score'] - 1:.1%})"
+            )
+        return best
+
+    @staticmethod
+    def _measure(run, operations, rounds):
+        best = reference = float("inf")
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # The reference is timed between rounds, so both see the same machine load
+            for _ in range(rounds):
+                reference = min(reference, _time_once(lambda n: _reference_workload(), 1))
+                best = min(best, _time_once(run, operations) / operations)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return best, best / reference
+
+
+@pytest.fixture(scope="session")
+def bench(request):
+    config = request.config
+    path = Path(config.getoption("--baseline-file"))
+    update = config.getoption("--update-baselines")
+    baselines = json.loads(path.read_text())["benchmarks"] if path.exists() else {}
+
+    runner = Bench(baselines, config.getoption("--benchmark-tolerance"), update)
+    config.stash[_results_key] = runner.results
+    yield runner
+
+    if update and runner.results:
+        # Re-recording keeps a benchmark's own tolerance
+        merged = {
+            **baselines,
+            **{name: {**baselines.get(name, {}), "score": r["score"]} for name, r in runner.results.items()},
+        }
+        path.write_text(json.dumps({"benchmarks": dict(sorted(merged.items()))}, indent=2) + "\n")
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash.get(_results_key, None)
+    if not results:
+        return
+    terminalreporter.write_sep("-", "benchmarks")
+    for name, result in sorted(results.items()):
+        terminalreporter.write_line(
+            f"{name:30s} {result['seconds_per_op'] * 1e6:10.2f} us/op "
+            f"{result['ops_per_second']:14.0f} ops/s  score {result['score']:.4g}"
+        )
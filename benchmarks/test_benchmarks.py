@@ -0,0 +1,116 @@
+"""
+Benchmarks for the counting hot path and the persistence paths, run against an
+in-process fake platform interface and tag store.
+"""
+
+import asyncio
+
+import pytest
+
+from flow_pulse_counter.acquisition import ACQUISITION_STREAM, ACQUISITION_EVENTS
+from flow_pulse_counter.app_config import FlowPulseCounterConfig
+from flow_pulse_counter.application import FlowPulseCounterApplication
+from flow_pulse_counter.engine import PulseEngine
+from flow_pulse_counter.loadgen import Scenario, run_load
+
+from tests.fakes import FakePlatform, FakeTagStore
+
+
+@pytest.fixture(scope="module")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def app(loop):
+    config = FlowPulseCounterConfig()
+    config._inject_deployment_config({"journal_directory": "", "history_directory": "", "trace_file": ""})
+    store = FakeTagStore({"total_volume": 1234.5, "pulse_count": 555525})
+
+    app = FlowPulseCounterApplication(
+        config=config, app_key="bench_app", is_async=True, platform_iface=FakePlatform(), test_mode=True
+    )
+    app.get_tag = store.get_tag
+    app.tag_writer.write_tags = store.set_tags_async
+    loop.run_until_complete(app.setup())
+    # Benchmarks drive acquisition themselves
+    app.acquisition_task.cancel()
+    yield app
+    loop.run_until_complete(app.tag_writer.stop())
+    loop.run_until_complete(app.alerts.stop())
+    loop.run_until_complete(app.history_uploader.stop())
+    # Let the cancelled acquisition loop finish before the loop closes
+    loop.run_until_complete(asyncio.gather(app.acquisition_task, return_exceptions=True))
+
+
+def test_main_loop(bench, app, loop):
+    engine = app.engines[0]
+
+    async def iterations(n):
+        for i in range(n):
+            engine.flow_rate = 10.0 + (i % 50) * 0.1
+            engine.total_volume += 0.05
+            await app.main_loop()
+
+    bench("main_loop", lambda n: loop.run_until_complete(iterations(n)), 2000)
+
+
+def test_acquire(bench, app, loop):
+    platform = app.platform_iface
+
+    async def iterations(n):
+        for i in range(n):
+            platform.levels[1] = bool(i % 2)
+            await app._acquire()
+
+    bench("acquire", lambda n: loop.run_until_complete(iterations(n)), 5000)
+
+
+@pytest.mark.parametrize("reporting_interval", [10, 60, 900])
+def test_flow_rate_update(bench, reporting_interval):
+    engine = PulseEngine(window_s=reporting_interval, bucket_s=min(1.0, reporting_interval / 10.0))
+    clock = [1_700_000_000.0]
+
+    def updates(n):
+        now = clock[0]
+        for _ in range(n):
+            now += 0.2
+            engine.add_pulses(9, now)
+            engine.update(now)
+        clock[0] = now
+
+    bench(f"flow_rate_update[{reporting_interval}s]", updates, 20000)
+
+
+def test_persist_state(bench, app):
+    def persists(n):
+        for i in range(n):
+            app.last_tag_save_time = 0.0
+            app._persist_state(1_700_000_000.0 + i)
+
+    bench("persist_state", persists, 2000)
+
+
+def test_update_readings(bench, app):
+    def updates(n):
+        for i in range(n):
+            app.ui.update_readings(10.0 + i % 7, 100.0 + i, 45000 + i, "Running")
+
+    bench("update_readings", updates, 5000)
+
+
+@pytest.mark.parametrize("mode", [ACQUISITION_EVENTS, ACQUISITION_STREAM])
+@pytest.mark.parametrize("rate_hz", [100, 1000, 5000])
+def test_edges_per_second(bench, loop, mode, rate_hz):
+    schedule = Scenario.from_dict(
+        {"pins": {"1": [{"type": "constant", "rate_hz": rate_hz, "duration": 20000 / rate_hz}]}}
+    ).schedule(start=1_700_000_000.0)
+
+    def play(n):
+        report = loop.run_until_complete(run_load(schedule, mode, debounce_ms=0))
+        assert report["channels"][0]["count_error"] == 0
+
+    # One operation is one edge
+    bench(f"edges[{mode},{rate_hz}Hz]", play, schedule.edges(1))
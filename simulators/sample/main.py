@@ -1,65 +1,91 @@
-import random
+import asyncio
+import json
+import logging
+import os
 import time
 
 from pydoover.docker import Application, run_app
 from pydoover.config import Schema
 
+from flow_pulse_counter.loadgen import Scenario
+
+log = logging.getLogger(__name__)
+
+SCENARIO_FILE = os.environ.get("SCENARIO_FILE", os.path.join(os.path.dirname(__file__), "scenarios", "default.json"))
+TRUTH_FILE = os.environ.get("TRUTH_FILE", "/tmp/flow_simulator_truth.json")
+
 
 class FlowPulseSimulator(Application):
-    """Simulates a flow meter by toggling a digital output to generate pulses.
+    """Plays a load scenario on the digital outputs to generate pulses.
 
-    Cycles through different flow rate scenarios:
-    - Idle (no flow): 10s
-    - Low flow (~2 L/min at 450 pulses/L = ~15 Hz): 20s
-    - Normal flow (~10 L/min at 450 pulses/L = ~75 Hz): 30s
-    - High flow (~25 L/min at 450 pulses/L = ~187 Hz): 15s
+    The scenario (see `flow_pulse_counter.loadgen`) is compiled once into a
+    schedule of exactly timed transitions. Each transition is written at its
+    scheduled time, measured from the start of the pass rather than from the
+    previous write, so timing errors don't accumulate. After every pass the
+    pulses actually emitted are appended to the ground truth log, together
+    with how late the writes were, so the counter's loss can be measured
+    against it.
     """
 
-    loop_target_period = 0.05  # 50ms for fast pulse generation
+    loop_target_period = 1
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.pin_state = False
-        self.cycle_start = 0
-        self.pulse_interval = 0  # seconds between pulses (0 = no pulses)
-        self.last_pulse_time = 0
+        self.scenario = None
+        self.player = None
+        self.passes = 0
 
     async def setup(self):
-        self.cycle_start = time.time()
-        self.last_pulse_time = time.time()
+        self.scenario = Scenario.load(SCENARIO_FILE)
+        log.info("Playing scenario %r from %s", self.scenario.name, SCENARIO_FILE)
+        self.player = asyncio.create_task(self.play())
 
     async def main_loop(self):
-        now = time.time()
-        elapsed = now - self.cycle_start
-
-        # Cycle through flow scenarios
-        if elapsed < 10:
-            # Idle - no flow
-            self.pulse_interval = 0
-        elif elapsed < 30:
-            # Low flow (~2 L/min)
-            self.pulse_interval = 1.0 / 15.0
-        elif elapsed < 60:
-            # Normal flow (~10 L/min)
-            self.pulse_interval = 1.0 / 75.0
-        elif elapsed < 75:
-            # High flow (~25 L/min)
-            self.pulse_interval = 1.0 / 187.0
-        else:
-            # Reset cycle
-            self.cycle_start = now
-            self.pulse_interval = 0
-
-        # Generate pulses by toggling digital output
-        if self.pulse_interval > 0:
-            if now - self.last_pulse_time >= self.pulse_interval:
-                self.pin_state = not self.pin_state
-                await self.platform_iface.set_do_async(pin=1, value=self.pin_state)
-                self.last_pulse_time = now
-        else:
-            if self.pin_state:
-                self.pin_state = False
-                await self.platform_iface.set_do_async(pin=1, value=False)
+        if self.player is not None and self.player.done() and not self.player.cancelled():
+            # Surface a crashed player instead of silently generating nothing
+            self.player.result()
+
+    async def play(self):
+        schedule = self.scenario.schedule()
+        while True:
+            start = time.monotonic()
+            emitted = {pin: 0 for pin in schedule.pins}
+            late = 0
+            max_late = 0.0
+
+            for timestamp, pin, level in schedule.transitions():
+                delay = start + timestamp - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    late += 1
+                    max_late = max(max_late, -delay)
+                await self.platform_iface.set_do_async(pin, level)
+                if level:
+                    emitted[pin] += 1
+
+            for pin in schedule.pins:
+                await self.platform_iface.set_do_async(pin, False)
+            await asyncio.sleep(max(0.0, start + schedule.end - time.monotonic()))
+
+            self.passes += 1
+            self.log_truth(schedule, emitted, late, max_late)
+
+    def log_truth(self, schedule, emitted, late, max_late):
+        truth = schedule.truth()
+        truth.update(pass_number=self.passes, late_transitions=late, max_late_s=max_late, finished=time.time())
+        for pin, edges in emitted.items():
+            truth["pins"][str(pin)]["emitted_edges"] = edges
+        log.info(
+            "Pass %d of %r: %s pulses, %d late transitions (max %.1f ms)",
+            self.passes,
+            schedule.scenario.name,
+            {pin: schedule.pulses[pin] for pin in schedule.pins},
+            late,
+            max_late * 1000,
+        )
+        with open(TRUTH_FILE, "a") as f:
+            f.write(json.dumps(truth) + "\n")
 
 
 def main():
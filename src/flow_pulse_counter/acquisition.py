@@ -0,0 +1,365 @@
+import asyncio
+import logging
+import time
+from array import array
+
+from .platform_client import start_pulse_listener, stop_pulse_listeners
+
+log = logging.getLogger(__name__)
+
+ACQUISITION_POLLING = "Polling"
+ACQUISITION_STREAM = "Pulse Stream"
+ACQUISITION_EVENTS = "Events"
+
+ACQUISITION_MODES = [ACQUISITION_POLLING, ACQUISITION_STREAM, ACQUISITION_EVENTS]
+
+# Earlier names of the modes, still accepted from existing configs. `Pulse
+# Stream` was `Counter`, though it never read a hardware counter.
+LEGACY_ACQUISITION_MODES = {"Counter": ACQUISITION_STREAM}
+
+DEFAULT_EVENT_QUEUE_SIZE = 1024
+
+# Sentinel for a pin whose previous level has not been read yet
+_UNKNOWN_LEVEL = 2
+
+
+def pin_states(values, pins):
+    """Extract pin states from a `get_di_async` response, in the order of `pins`.
+
+    The platform interface returns a bare bool when one pin is requested and a
+    list when several are, while some versions return a dict keyed by pin.
+    """
+    if values is None:
+        return [False] * len(pins)
+    if isinstance(values, dict):
+        return [bool(values.get(pin, False)) for pin in pins]
+    if isinstance(values, (list, tuple)):
+        states = [bool(v) for v in values[: len(pins)]]
+        return states + [False] * (len(pins) - len(states))
+    return [bool(values)] * len(pins)
+
+
+def counter_delta(previous, current, modulus):
+    """Return the number of pulses between two cumulative counter readings.
+
+    A reading lower than the previous one is either a wraparound (the counter
+    overflowed `modulus`) or a reset (the counter restarted from zero). A
+    forward step of more than half the counter range is implausible within one
+    iteration, so that case is treated as a reset and `current` is returned.
+    """
+    if current >= previous:
+        return current - previous
+
+    wrapped = (current - previous) % modulus
+    if wrapped <= modulus // 2:
+        return wrapped
+
+    log.warning("Pulse counter reset detected (%d -> %d)", previous, current)
+    return current
+
+
+class AcquisitionBackend:
+    """Base class for the pulse acquisition backends.
+
+    A backend serves every meter channel and is polled once per main loop
+    iteration through `read()`, which returns the number of valid pulses seen
+    on each channel since the previous call, indexed by channel.
+    `last_edge_time` holds the timestamp of each channel's latest valid pulse.
+    Backends that see individual edges also report them, before the
+    debounce, to `edge_stats` (one `EdgeStatistics` per channel) when it is set.
+    """
+
+    name = None
+
+    def __init__(self, platform_iface, channels):
+        self.platform_iface = platform_iface
+        self.pins = [c.pin for c in channels]
+        self.debounce_s = array("d", (c.debounce_s for c in channels))
+        self.last_edge_time = array("d", bytes(8 * len(channels)))
+        self._pulses = array("q", bytes(8 * len(channels)))
+        self.edge_stats = None
+
+    async def start(self):
+        """Prepare the backend before the first `read()`."""
+
+    async def stop(self):
+        """Release any resources held by the backend."""
+
+    async def read(self, now):
+        raise NotImplementedError
+
+    def stats(self):
+        """Backend-specific diagnostics."""
+        return {}
+
+    @staticmethod
+    async def _close_counters(counters):
+        """Stop the listeners feeding pulse counters, for counters that have one."""
+        for counter in counters:
+            close = getattr(counter, "close", None)
+            if close is not None:
+                await close()
+
+    def _take_pulses(self):
+        pulses = self._pulses.tolist()
+        for i in range(len(self._pulses)):
+            self._pulses[i] = 0
+        return pulses
+
+
+class PollingBackend(AcquisitionBackend):
+    """Detect rising edges by sampling the digital inputs every iteration.
+
+    All pins are read in one batched `get_di_async` call. This can only see
+    edges slower than twice the loop period, but needs nothing from the
+    platform beyond digital input reads.
+
+    Edges are missed while the inputs can't be read. With `resync_counters`
+    the backend also opens pulse counters on the platform's pulse stream,
+    and the first read after a failed one counts the counters' advance since
+    the last good read instead of comparing levels across the gap. That only
+    recovers the edges the stream still delivered while the reads failed;
+    the counters live in this process and miss whatever the stream misses.
+    Between good reads the counters' advance is compared with the rising
+    edges the reads saw, giving `missed_edges`, the edges polling was too
+    slow for.
+    """
+
+    name = ACQUISITION_POLLING
+
+    def __init__(self, platform_iface, channels, counter_bits=32, resync_counters=False):
+        super().__init__(platform_iface, channels)
+        self.prev_pin_state = bytearray([_UNKNOWN_LEVEL]) * len(self.pins)
+        self.resync_counters = resync_counters
+        self.modulus = 1 << counter_bits
+        self.counters = []
+        self.counter_marks = [None] * len(self.pins)
+        self.interrupted = False
+        self.resynced_pulses = 0
+        # Edges the counters and the reads saw between good reads, while counters are open
+        self.counter_edges = 0
+        self.seen_edges = 0
+
+    async def start(self):
+        if self.resync_counters:
+            self.counters = [self.platform_iface.get_new_pulse_counter(pin, "rising") for pin in self.pins]
+
+    async def stop(self):
+        counters, self.counters = self.counters, []
+        self.counter_marks = [None] * len(self.pins)
+        await self._close_counters(counters)
+
+    async def read(self, now):
+        try:
+            values = await self.platform_iface.get_di_async(self.pins)
+        except Exception:
+            self.interrupted = True
+            raise
+
+        states = pin_states(values, self.pins)
+        resync = self.interrupted and self.counters
+        if resync:
+            self._resync(now, states)
+        else:
+            self._detect_edges(now, states)
+        self.interrupted = False
+
+        for i, counter in enumerate(self.counters):
+            mark = int(counter.get_counter()) % self.modulus
+            previous = self.counter_marks[i]
+            if not resync and previous is not None:
+                self.counter_edges += counter_delta(previous, mark, self.modulus)
+            self.counter_marks[i] = mark
+
+        return self._take_pulses()
+
+    @property
+    def missed_edges(self):
+        """Edges the counters saw and the reads didn't, or None without counters."""
+        if not self.counters:
+            return None
+        return max(0, self.counter_edges - self.seen_edges)
+
+    def _detect_edges(self, now, states):
+        pulses = self._pulses
+        edge_stats = self.edge_stats
+        for i, current_state in enumerate(states):
+            previous_state = self.prev_pin_state[i]
+            if current_state and previous_state == 0:
+                self.seen_edges += 1
+                if edge_stats is not None:
+                    edge_stats[i].rise(now)
+                # Rising edge detected, only count it once the debounce has elapsed
+                if (now - self.last_edge_time[i]) >= self.debounce_s[i]:
+                    pulses[i] += 1
+                    self.last_edge_time[i] = now
+            elif not current_state and previous_state == 1 and edge_stats is not None:
+                edge_stats[i].fall(now)
+            self.prev_pin_state[i] = current_state
+
+    def _resync(self, now, states):
+        """Count the pulses the counters saw while the inputs couldn't be read."""
+        for i, counter in enumerate(self.counters):
+            mark = self.counter_marks[i]
+            if mark is not None:
+                delta = counter_delta(mark, int(counter.get_counter()) % self.modulus, self.modulus)
+                if delta:
+                    self._pulses[i] += delta
+                    self.last_edge_time[i] = now
+                    self.resynced_pulses += delta
+            # The counters already cover any edge across the gap
+            self.prev_pin_state[i] = states[i]
+        log.info("Resynced polling from the pulse counters")
+
+    def stats(self):
+        if not self.counters:
+            return {}
+        return {"resynced_pulses": self.resynced_pulses}
+
+
+class StreamBackend(AcquisitionBackend):
+    """Count the platform's pulse stream into cumulative counters and read their deltas.
+
+    The counters are software counts fed by the platform interface's pulse
+    stream (see `ListenerCounter`), not hardware counters, so throughput
+    doesn't depend on the loop period.
+    The platform doesn't debounce the stream, and edges are timestamped with
+    the time of the read that saw them. The counts are kept in this process
+    and start from zero, so edges while the stream or the app is down are
+    missed; a count that restarts is taken as a counter reset.
+    """
+
+    name = ACQUISITION_STREAM
+
+    def __init__(self, platform_iface, channels, counter_bits=32):
+        super().__init__(platform_iface, channels)
+        self.modulus = 1 << counter_bits
+        self.counters = []
+        self.prev_count = [None] * len(self.pins)
+
+    async def start(self):
+        self.counters = [self.platform_iface.get_new_pulse_counter(pin, "rising") for pin in self.pins]
+
+    async def stop(self):
+        counters, self.counters = self.counters, []
+        self.prev_count = [None] * len(self.pins)
+        await self._close_counters(counters)
+
+    async def read(self, now):
+        pulses = self._pulses
+        for i, counter in enumerate(self.counters):
+            current = int(counter.get_counter()) % self.modulus
+            previous = self.prev_count[i]
+            self.prev_count[i] = current
+            if previous is not None:
+                # The first reading only establishes the baseline
+                delta = counter_delta(previous, current, self.modulus)
+                if delta:
+                    pulses[i] += delta
+                    self.last_edge_time[i] = now
+
+        return self._take_pulses()
+
+
+class EventBackend(AcquisitionBackend):
+    """Subscribe to digital input edge events instead of polling the pins.
+
+    The platform interface streams each rising edge to a per-pin callback,
+    which timestamps it on arrival and hands it to a bounded queue shared by
+    all channels. A consumer task applies the debounce as edges arrive, so
+    nothing runs while there is no flow. Edges arriving while the queue is
+    full are dropped and counted in `dropped_events`. `clock` timestamps the
+    edges (`time.time` by default), so a replay can run on the trace's own time.
+    """
+
+    name = ACQUISITION_EVENTS
+
+    def __init__(self, platform_iface, channels, queue_size=DEFAULT_EVENT_QUEUE_SIZE, clock=None):
+        super().__init__(platform_iface, channels)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.clock = clock
+
+        self.received_events = 0
+        self.dropped_events = 0
+        self.queue_high_water = 0
+
+        self._reported_drops = 0
+        self._consumer = None
+        self._listeners = []
+
+    async def start(self):
+        self._consumer = asyncio.create_task(self._consume())
+        for index, pin in enumerate(self.pins):
+            listener = start_pulse_listener(self.platform_iface, pin, self._edge_callback(index), edge="rising")
+            if listener is not None:
+                self._listeners.append(listener)
+
+    async def stop(self):
+        listeners, self._listeners = self._listeners, []
+        await stop_pulse_listeners(listeners)
+        if self._consumer is not None:
+            self._consumer.cancel()
+            self._consumer = None
+
+    def _edge_callback(self, index):
+        async def on_edge(di, di_value, dt_secs, counter, edge):
+            self.push_edge(index, self.clock() if self.clock is not None else time.time())
+
+        return on_edge
+
+    def push_edge(self, index, timestamp):
+        """Queue an edge for the consumer, dropping it if the queue is full."""
+        self.received_events += 1
+        try:
+            self.queue.put_nowait((index, timestamp))
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            return
+        self.queue_high_water = max(self.queue_high_water, self.queue.qsize())
+
+    def _accept_edge(self, edge):
+        index, timestamp = edge
+        if self.edge_stats is not None:
+            self.edge_stats[index].rise(timestamp)
+        if (timestamp - self.last_edge_time[index]) >= self.debounce_s[index]:
+            self._pulses[index] += 1
+            self.last_edge_time[index] = timestamp
+
+    async def _consume(self):
+        while True:
+            self._accept_edge(await self.queue.get())
+
+    def drain(self):
+        """Process any queued edges without waiting for the consumer task."""
+        while True:
+            try:
+                self._accept_edge(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def read(self, now):
+        self.drain()
+
+        if self.dropped_events > self._reported_drops:
+            log.warning(
+                "Event queue overflowed: %d of %d edges dropped",
+                self.dropped_events,
+                self.received_events,
+            )
+            self._reported_drops = self.dropped_events
+
+        return self._take_pulses()
+
+
+def create_backend(mode, platform_iface, channels, counter_bits=32, clock=None, resync_counters=False):
+    """Build the acquisition backend for the configured mode.
+
+    `resync_counters` only applies to polling; the other modes don't sample the inputs.
+    """
+    if mode == ACQUISITION_STREAM:
+        return StreamBackend(platform_iface, channels, counter_bits=counter_bits)
+    if mode == ACQUISITION_EVENTS:
+        return EventBackend(platform_iface, channels, clock=clock)
+    if mode != ACQUISITION_POLLING:
+        log.warning("Unknown acquisition mode %r, falling back to polling", mode)
+    return PollingBackend(platform_iface, channels, counter_bits=counter_bits, resync_counters=resync_counters)
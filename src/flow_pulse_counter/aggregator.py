@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+
+from pydoover.docker import Application, run_app
+from pydoover import ui
+
+from .aggregator_config import SiteAggregatorConfig
+from .aggregator_ui import SiteAggregatorUI
+from .alert_rules import AlertEngine
+from .publisher import ChangeFilter
+from .rollup import BALANCE_CHANNEL, RULE_GAIN, RULE_LOSS, SiteRollup, build_sources, imbalance_rules
+from .writers import AlertDispatcher, TagWriter
+
+log = logging.getLogger(__name__)
+
+# Channel the device agent publishes every app's tags on, as {app_key: {tag: value}}
+TAG_CHANNEL = "tag_values"
+
+
+class SiteAggregatorApplication(Application):
+    """Roll up the totals of many Flow Pulse Counter meters into site totals and an inlet/outlet balance.
+
+    The counters' tag updates are applied to a `SiteRollup` as they arrive,
+    and the publish loop only evaluates the balance and updates the UI.
+    """
+
+    config: SiteAggregatorConfig  # Type hint for IDE autocomplete
+
+    publish_period = 1.0
+
+    # Changes below these aren't worth a UI update
+    FLOW_DEADBAND = 0.02
+    VOLUME_DEADBAND = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop_target_period = self.publish_period
+
+        self.ui: SiteAggregatorUI = None
+        self.rollup: SiteRollup = None
+        self.alert_engine: AlertEngine = None
+        self.change_filter = ChangeFilter()
+
+        # Tag persistence throttle
+        self.last_tag_save_time = 0.0
+        self.TAG_SAVE_INTERVAL = 60.0  # seconds
+
+        self.tag_writer = TagWriter(self.set_tags_async)
+        self.alerts: AlertDispatcher = None
+
+    async def setup(self):
+        """Initialize the UI, seed the rollup from the counters' current tags and subscribe to their updates."""
+        config = self.config
+        self.rollup = SiteRollup(build_sources(config))
+        self.alert_engine = AlertEngine(
+            imbalance_rules(
+                config.imbalance_threshold.value,
+                config.imbalance_hysteresis.value / 100.0,
+                config.imbalance_on_delay.value,
+                config.imbalance_off_delay.value,
+                config.alert_cooldown.value,
+            )
+        )
+
+        self.ui = SiteAggregatorUI()
+        self.ui_manager.add_children(*self.ui.fetch())
+        self.ui_manager.set_display_name(config.app_display_name.value)
+
+        self.alerts = AlertDispatcher(self._deliver_alert)
+        self.tag_writer.start()
+        self.alerts.start()
+
+        if not self.test_mode:
+            # The base app's own handler collects the tags `get_tag` reads, once the channel has synced
+            await self.device_agent.wait_for_channels_sync_async([TAG_CHANNEL])
+            await asyncio.sleep(0)
+
+        # Site volumes carry on from the last run; each source's baseline is its current total
+        self.rollup.restore(
+            float(self.get_tag("site_total_volume") or 0.0),
+            float(self.get_tag("inlet_volume") or 0.0),
+            float(self.get_tag("outlet_volume") or 0.0),
+        )
+        current = {}
+        for app_key, indexes in self.rollup.by_app.items():
+            tags = current[app_key] = {}
+            for index in indexes:
+                for tag in self.rollup.tags[index]:
+                    value = self.get_tag(tag, app_key)
+                    if value is not None:
+                        tags[tag] = value
+        self.rollup.apply(current)
+
+        if not self.rollup.has_balance:
+            log.info("No inlet and outlet meters configured, the flow balance isn't checked")
+        log.info(
+            "Site Flow Aggregator started - %d source(s) from %d app(s)",
+            len(self.rollup.sources),
+            len(self.rollup.by_app),
+        )
+
+        # Alongside, not in place of, the base app's `_on_tag_update`
+        self.device_agent.add_subscription(TAG_CHANNEL, self._on_counter_tags)
+
+    def _on_counter_tags(self, _, tag_values):
+        if not isinstance(tag_values, dict):
+            return
+        try:
+            self.rollup.apply(tag_values)
+        except (TypeError, ValueError) as e:
+            log.error("Ignoring malformed counter tags: %s", e)
+
+    async def main_loop(self):
+        """Publish loop: evaluate the flow balance, update the UI and persist the site totals."""
+        try:
+            now = time.time()
+            rollup = self.rollup
+            self._check_balance(now)
+            self.ui.publish_readings(
+                self.change_filter,
+                now,
+                rollup,
+                self._get_status_text(),
+                flow_deadband=self.FLOW_DEADBAND,
+                volume_deadband=self.VOLUME_DEADBAND,
+            )
+            self._persist_state(now)
+        except Exception as e:
+            log.error("Error in main loop: %s", e, exc_info=True)
+            self.ui.status.update(f"Error: {e}")
+
+    def _check_balance(self, now):
+        changes = self.alert_engine.evaluate(BALANCE_CHANNEL, now, self.rollup.imbalance)
+        for kind, active, message in changes:
+            self.ui.imbalance_warning.hidden = not self.alert_engine.active_alerts()
+            if message is not None:
+                self.alerts.send(message)
+            log.info("%s alert %s", kind, "raised" if active else "cleared")
+
+    def _get_status_text(self):
+        rollup = self.rollup
+        if self.alert_engine.is_active(BALANCE_CHANNEL, RULE_LOSS):
+            return "Imbalance (Loss)"
+        if self.alert_engine.is_active(BALANCE_CHANNEL, RULE_GAIN):
+            return "Imbalance (Gain)"
+        if rollup.has_balance and not rollup.balanced:
+            return "Waiting for Meters"
+        if rollup.total_rate <= 0.01:
+            return "No Flow"
+        return "Running"
+
+    async def _deliver_alert(self, message):
+        await self.ui.notifications.send_alert(message)
+
+    def _persist_state(self, now):
+        """Periodically queue the site totals for external consumption and restart recovery."""
+        if (now - self.last_tag_save_time) < self.TAG_SAVE_INTERVAL:
+            return
+        rollup = self.rollup
+        diagnostics = {**self.tag_writer.stats(), **self.alerts.stats(), **rollup.stats()}
+        diagnostics["alerts_suppressed"] = self.alert_engine.suppressed
+        self.tag_writer.write_many(
+            {
+                "site_flow_rate": round(rollup.total_rate, 4),
+                "inlet_flow_rate": round(rollup.inlet_rate, 4),
+                "outlet_flow_rate": round(rollup.outlet_rate, 4),
+                "imbalance": round(rollup.imbalance, 2),
+                "site_total_volume": round(rollup.total_volume, 4),
+                "inlet_volume": round(rollup.inlet_volume, 4),
+                "outlet_volume": round(rollup.outlet_volume, 4),
+                "unaccounted_volume": round(rollup.unaccounted_volume, 4),
+                "status": self._get_status_text(),
+                "diagnostics": diagnostics,
+            }
+        )
+        self.last_tag_save_time = now
+
+    # ---- UI Callbacks ----
+
+    @ui.callback("reset_totals")
+    async def on_reset_totals(self, new_value):
+        """Reset the site volumes, e.g. at the start of a billing period."""
+        log.info("Resetting site totals")
+        self.rollup.reset_volumes()
+        self.last_tag_save_time = 0.0
+        self._persist_state(time.time())
+        self.tag_writer.request_flush()
+        self.change_filter.invalidate()
+        self.ui.reset_totals.coerce(None)
+
+
+def main():
+    """Run the Site Flow Aggregator application."""
+    run_app(SiteAggregatorApplication(config=SiteAggregatorConfig()))
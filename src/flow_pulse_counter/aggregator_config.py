@@ -0,0 +1,82 @@
+from pathlib import Path
+
+from pydoover import config
+
+from .rollup import ROLE_INLET, ROLES
+
+
+class SiteAggregatorConfig(config.Schema):
+    def __init__(self):
+        self.app_display_name = config.String(
+            "App Display Name",
+            description="Display name shown in the Doover UI",
+            default="Site Flow Aggregator",
+        )
+
+        self.imbalance_threshold = config.Number(
+            "Imbalance Threshold",
+            description="Percent difference between the inlet and outlet flow rates that flags a "
+            "mass-balance discrepancy (0 = disabled)",
+            default=5.0,
+        )
+
+        self.imbalance_hysteresis = config.Number(
+            "Imbalance Hysteresis",
+            description="Percent of the imbalance threshold the difference must fall back past before the "
+            "discrepancy clears",
+            default=20.0,
+        )
+
+        self.imbalance_on_delay = config.Number(
+            "Imbalance On Delay",
+            description="Seconds the imbalance must last before it is flagged. Counters publish their tags "
+            "about once a minute, so this should span a few of those",
+            default=300.0,
+        )
+
+        self.imbalance_off_delay = config.Number(
+            "Imbalance Off Delay",
+            description="Seconds the flows must stay balanced before a flagged discrepancy clears",
+            default=120.0,
+        )
+
+        self.alert_cooldown = config.Number(
+            "Alert Cooldown",
+            description="Minimum seconds between repeated imbalance notifications",
+            default=3600.0,
+        )
+
+        source = config.Object("Source")
+        source.add_elements(
+            config.String("Source Name", description="Name used for this meter in the aggregator's logs"),
+            config.String("App Key", description="App key of the Flow Pulse Counter app counting this meter"),
+            config.String(
+                "Meter Key",
+                description="Tag prefix of the meter in a multi-meter counter app, e.g. 'inlet' for 'inlet_flow_rate' "
+                "(empty for a single-meter app)",
+                default="",
+            ),
+            config.Enum(
+                "Role",
+                description="'Inlet' and 'Outlet' meters are balanced against each other, "
+                "'Monitor' meters only count towards the site totals",
+                choices=ROLES,
+                default=ROLE_INLET,
+            ),
+        )
+        self.sources = config.Array(
+            "Sources",
+            element=source,
+            description="Counter meters rolled up into the site totals",
+        )
+        self.sources.default = []
+
+
+def export():
+    SiteAggregatorConfig().export(
+        Path(__file__).parents[2] / "doover_config.json", "flow_pulse_aggregator"
+    )
+
+
+if __name__ == "__main__":
+    export()
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+from pydoover import ui
+
+
+class SiteAggregatorUI:
+    def __init__(self):
+        self.site_flow_rate = ui.NumericVariable(
+            "site_flow_rate",
+            "Site Flow Rate",
+            precision=2,
+            unit="L/min",
+            ranges=[
+                ui.Range("No Flow", 0, 0.01, ui.Colour.grey),
+                ui.Range("Normal", 0.01, 99999, ui.Colour.green),
+            ],
+        )
+
+        self.inlet_flow_rate = ui.NumericVariable("inlet_flow_rate", "Inlet Flow Rate", precision=2, unit="L/min")
+        self.outlet_flow_rate = ui.NumericVariable("outlet_flow_rate", "Outlet Flow Rate", precision=2, unit="L/min")
+        self.imbalance = ui.NumericVariable("imbalance", "Flow Imbalance", precision=1, unit="%")
+
+        self.site_total_volume = ui.NumericVariable("site_total_volume", "Site Total Volume", precision=2, unit="L")
+        self.unaccounted_volume = ui.NumericVariable(
+            "unaccounted_volume",
+            "Unaccounted Volume",
+            precision=2,
+            unit="L",
+        )
+
+        self.status = ui.TextVariable("status", "Status")
+        self.last_update = ui.DateTimeVariable("last_update", "Last Update")
+
+        self.imbalance_warning = ui.WarningIndicator(
+            "imbalance_warning",
+            "Flow Imbalance Warning",
+            hidden=True,
+        )
+
+        # Alert stream for push notifications
+        self.notifications = ui.AlertStream()
+
+        self.reset_totals = ui.Action(
+            "reset_totals",
+            "Reset Site Totals",
+            colour=ui.Colour.red,
+            requires_confirm=True,
+            position=1,
+        )
+
+    def fetch(self):
+        return (
+            self.site_flow_rate,
+            self.inlet_flow_rate,
+            self.outlet_flow_rate,
+            self.imbalance,
+            self.site_total_volume,
+            self.unaccounted_volume,
+            self.status,
+            self.last_update,
+            self.imbalance_warning,
+            self.notifications,
+            self.reset_totals,
+        )
+
+    def publish_readings(self, change_filter, now, rollup, status_text, flow_deadband=0.0, volume_deadband=0.0):
+        """Update the display variables that moved beyond their deadband. Returns True if any were."""
+        changed = False
+        for variable, value in (
+            (self.site_flow_rate, rollup.total_rate),
+            (self.inlet_flow_rate, rollup.inlet_rate),
+            (self.outlet_flow_rate, rollup.outlet_rate),
+        ):
+            if change_filter.should_publish(variable.name, value, now, absolute=0.01, relative=flow_deadband):
+                variable.update(value)
+                changed = True
+
+        imbalance = rollup.imbalance
+        if change_filter.should_publish(self.imbalance.name, imbalance, now, absolute=0.1):
+            self.imbalance.update(imbalance)
+            changed = True
+
+        for variable, value in (
+            (self.site_total_volume, rollup.total_volume),
+            (self.unaccounted_volume, rollup.unaccounted_volume),
+        ):
+            if change_filter.should_publish(variable.name, value, now, absolute=volume_deadband):
+                variable.update(value)
+                changed = True
+
+        if change_filter.should_publish(self.status.name, status_text, now):
+            self.status.update(status_text)
+            changed = True
+
+        if changed:
+            self.last_update.update(datetime.now())
+        return changed
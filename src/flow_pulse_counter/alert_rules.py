@@ -0,0 +1,185 @@
+import math
+from array import array
+from collections import namedtuple
+
+RULE_LOW_FLOW = "low_flow"
+RULE_HIGH_FLOW = "high_flow"
+RULE_CONTINUOUS_FLOW = "continuous_flow"
+RULE_NO_FLOW = "no_flow"
+
+# Flow rates at or below this (L/min) count as no flow, as in the status text
+NO_FLOW_RATE = 0.01
+
+# One alert rule before compilation. The rule becomes active once the value
+# has stayed inside (on_low, on_high) for `min_on_s`, and clears once it has
+# stayed outside (off_low, off_high) for `min_off_s`. The off band contains
+# the on band, and the gap between them is the hysteresis. `message` is
+# formatted with the value when the rule activates.
+AlertRule = namedtuple(
+    "AlertRule",
+    ["channel", "kind", "on_low", "on_high", "off_low", "off_high", "min_on_s", "min_off_s", "cooldown_s", "message"],
+)
+
+
+def threshold_rules(channel, low_threshold, high_threshold, hysteresis, min_on_s, min_off_s, cooldown_s, prefix=""):
+    """Rules for the low and high flow thresholds; `hysteresis` is a fraction of each threshold."""
+    rules = []
+    if low_threshold > 0:
+        rules.append(
+            AlertRule(
+                channel,
+                RULE_LOW_FLOW,
+                NO_FLOW_RATE,
+                low_threshold,
+                NO_FLOW_RATE,
+                low_threshold * (1.0 + hysteresis),
+                min_on_s,
+                min_off_s,
+                cooldown_s,
+                prefix + "Low flow detected: {value:.2f} {unit}",
+            )
+        )
+    if high_threshold > 0:
+        rules.append(
+            AlertRule(
+                channel,
+                RULE_HIGH_FLOW,
+                high_threshold,
+                math.inf,
+                high_threshold * (1.0 - hysteresis),
+                math.inf,
+                min_on_s,
+                min_off_s,
+                cooldown_s,
+                prefix + "High flow detected: {value:.2f} {unit}",
+            )
+        )
+    return rules
+
+
+def duration_rules(channel, continuous_flow_hours, no_flow_hours, min_off_s, cooldown_s, prefix=""):
+    """Rules for flow that never stops (e.g. a leak) and for flow that never starts."""
+    rules = []
+    if continuous_flow_hours > 0:
+        rules.append(
+            AlertRule(
+                channel,
+                RULE_CONTINUOUS_FLOW,
+                NO_FLOW_RATE,
+                math.inf,
+                NO_FLOW_RATE,
+                math.inf,
+                continuous_flow_hours * 3600.0,
+                min_off_s,
+                cooldown_s,
+                prefix + f"Continuous flow for {continuous_flow_hours:g} hours, possible leak: {{value:.2f}} {{unit}}",
+            )
+        )
+    if no_flow_hours > 0:
+        rules.append(
+            AlertRule(
+                channel,
+                RULE_NO_FLOW,
+                -math.inf,
+                NO_FLOW_RATE,
+                -math.inf,
+                NO_FLOW_RATE,
+                no_flow_hours * 3600.0,
+                0.0,
+                cooldown_s,
+                prefix + f"No flow for {no_flow_hours:g} hours",
+            )
+        )
+    return rules
+
+
+class AlertEngine:
+    """Evaluates alert rules with hysteresis, minimum on/off times and cooldowns.
+
+    The rules are compiled once into flat arrays, grouped by channel, so
+    each tick costs a fixed amount of work per rule and no allocation
+    unless a rule changes state. Duration rules (continuous flow, no flow)
+    only keep the time their condition started, so they run in constant
+    memory however long the duration is.
+
+    An alert message is only sent when a rule activates and its previous
+    message is older than the rule's cooldown; activations inside the
+    cooldown are counted in `suppressed`.
+    """
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=lambda r: r.channel)
+        self.kinds = [r.kind for r in rules]
+        self.messages = [r.message for r in rules]
+        self.on_low = array("d", (r.on_low for r in rules))
+        self.on_high = array("d", (r.on_high for r in rules))
+        self.off_low = array("d", (r.off_low for r in rules))
+        self.off_high = array("d", (r.off_high for r in rules))
+        self.min_on = array("d", (r.min_on_s for r in rules))
+        self.min_off = array("d", (r.min_off_s for r in rules))
+        self.cooldown = array("d", (r.cooldown_s for r in rules))
+
+        n = len(rules)
+        self.active = bytearray(n)
+        # Time the pending transition's condition started to hold, NaN while there is none
+        self.pending_since = array("d", [math.nan]) * n
+        self.last_sent = array("d", [-math.inf]) * n
+        self.suppressed = 0
+
+        self.ranges = {}
+        for i, rule in enumerate(rules):
+            start, _ = self.ranges.get(rule.channel, (i, i))
+            self.ranges[rule.channel] = (start, i + 1)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def evaluate(self, channel, now, value, unit="", scale=1.0):
+        """Evaluate a channel's rules against `value`.
+
+        Returns a list of (kind, active, message) for rules that changed
+        state. `message` is None unless an alert should be sent; the value
+        in it is multiplied by `scale`, e.g. to show an L/min rate in `unit`.
+        """
+        start, end = self.ranges.get(channel, (0, 0))
+        changes = None
+        for i in range(start, end):
+            if self.active[i]:
+                holding = not (self.off_low[i] < value < self.off_high[i])
+                duration = self.min_off[i]
+            else:
+                holding = self.on_low[i] < value < self.on_high[i]
+                duration = self.min_on[i]
+
+            if not holding:
+                self.pending_since[i] = math.nan
+                continue
+            since = self.pending_since[i]
+            if since != since:  # NaN, the condition just started holding
+                self.pending_since[i] = since = now
+            if now - since < duration:
+                continue
+
+            self.pending_since[i] = math.nan
+            self.active[i] = not self.active[i]
+            message = None
+            if self.active[i]:
+                if now - self.last_sent[i] >= self.cooldown[i]:
+                    message = self.messages[i].format(value=value * scale, unit=unit)
+                    self.last_sent[i] = now
+                else:
+                    self.suppressed += 1
+            if changes is None:
+                changes = []
+            changes.append((self.kinds[i], bool(self.active[i]), message))
+        return changes or ()
+
+    def is_active(self, channel, kind):
+        start, end = self.ranges.get(channel, (0, 0))
+        for i in range(start, end):
+            if self.kinds[i] == kind:
+                return bool(self.active[i])
+        return False
+
+    def active_alerts(self):
+        return sum(self.active)
@@ -2,6 +2,13 @@ from pathlib import Path
 
 from pydoover import config
 
+from .acquisition import ACQUISITION_MODES, ACQUISITION_POLLING
+from .engine import FLOW_RATE_UNITS
+from .history import TIER_NAMES
+from .scheduler import MIN_ACQUISITION_PERIOD
+
+HISTORY_RESOLUTIONS = list(TIER_NAMES.values())
+
 
 class FlowPulseCounterConfig(config.Schema):
     def __init__(self):
@@ -17,16 +24,78 @@ class FlowPulseCounterConfig(config.Schema):
             default=1,
         )
 
+        self.acquisition_mode = config.Enum(
+            "Acquisition Mode",
+            description="How pulses are acquired: 'Polling' samples the input every loop iteration, "
+            "'Pulse Stream' counts the pulses the platform streams to the app, in the app itself (not a hardware "
+            "counter), and is not limited by the loop rate, "
+            "'Events' subscribes to edge events from the platform and timestamps each edge as it arrives",
+            choices=ACQUISITION_MODES,
+            default=ACQUISITION_POLLING,
+        )
+
+        self.counter_bits = config.Integer(
+            "Counter Bits",
+            description="Width in bits at which the pulse stream counts wrap around, in 'Pulse Stream' mode "
+            "and with Resync Counters",
+            default=32,
+        )
+
+        self.acquisition_shards = config.Integer(
+            "Acquisition Shards",
+            description="Number of worker processes to split the meters between, each acquiring its own group "
+            "of inputs into shared memory. 0 acquires every meter in the app's own process",
+            default=0,
+        )
+
+        self.resync_counters = config.Boolean(
+            "Resync Counters",
+            description="In 'Polling' mode, also count each input's pulse stream and use it to count the pulses "
+            "missed while digital input reads failed. Edges the stream itself missed are not recovered",
+            default=False,
+        )
+
+        self.min_acquisition_period = config.Number(
+            "Min Acquisition Period",
+            description="Shortest time in seconds between acquisition reads. "
+            "In 'Polling' mode the period tightens towards this as the pulse frequency rises",
+            default=0.02,
+            minimum=MIN_ACQUISITION_PERIOD,
+        )
+
+        self.idle_acquisition_period = config.Number(
+            "Idle Acquisition Period",
+            description="Time in seconds between acquisition reads once no pulses have arrived for a while",
+            default=1.0,
+            minimum=MIN_ACQUISITION_PERIOD,
+        )
+
+        self.acquisition_cpu_budget = config.Number(
+            "Acquisition CPU Budget",
+            description="Maximum percentage of time spent on acquisition reads. "
+            "Limits how far the acquisition period can tighten",
+            default=20.0,
+            minimum=1.0,
+            maximum=100.0,
+        )
+
         self.pulses_per_litre = config.Number(
             "Pulses Per Litre",
             description="Calibration factor: number of pulses the meter produces per litre of flow",
             default=450.0,
         )
 
+        self.k_factor_points = config.String(
+            "K Factor Points",
+            description="Pulses per litre by pulse frequency for meters that read differently across their range, "
+            "as 'Hz:pulses/L' pairs, e.g. '5:452, 20:450, 80:447'. Overrides Pulses Per Litre (empty = disabled)",
+            default="",
+        )
+
         self.flow_rate_unit = config.Enum(
             "Flow Rate Unit",
             description="Unit for flow rate display",
-            choices=["L/min", "L/hr", "m3/hr"],
+            choices=FLOW_RATE_UNITS,
             default="L/min",
         )
 
@@ -36,12 +105,26 @@ class FlowPulseCounterConfig(config.Schema):
             default=50,
         )
 
+        self.auto_debounce = config.Boolean(
+            "Auto Debounce",
+            description="Tune each meter's debounce from the bounce seen on its input, "
+            "starting from its Debounce ms. Needs 'Polling' or 'Events' mode",
+            default=False,
+        )
+
         self.reporting_interval = config.Integer(
             "Reporting Interval",
             description="Interval in seconds between flow rate calculations (rolling window size)",
             default=10,
         )
 
+        self.no_flow_periods = config.Number(
+            "No Flow Periods",
+            description="At low flow the rate is measured from the time between pulses. "
+            "Flow is reported as stopped when no pulse arrives within this many of those periods",
+            default=3.0,
+        )
+
         self.low_flow_threshold = config.Number(
             "Low Flow Threshold",
             description="Flow rate below this value triggers a low-flow warning (0 = disabled)",
@@ -54,6 +137,190 @@ class FlowPulseCounterConfig(config.Schema):
             default=0.0,
         )
 
+        self.alert_hysteresis = config.Number(
+            "Alert Hysteresis",
+            description="Percent of a flow threshold the rate must move back past before its warning clears",
+            default=5.0,
+        )
+
+        self.alert_on_delay = config.Number(
+            "Alert On Delay",
+            description="Seconds a threshold must stay crossed before its warning is shown and alerted",
+            default=10.0,
+        )
+
+        self.alert_off_delay = config.Number(
+            "Alert Off Delay",
+            description="Seconds the flow rate must stay back inside its hysteresis band before a warning clears",
+            default=30.0,
+        )
+
+        self.alert_cooldown = config.Number(
+            "Alert Cooldown",
+            description="Minimum seconds between two alert messages for the same warning",
+            default=600.0,
+        )
+
+        self.continuous_flow_alert_hours = config.Number(
+            "Continuous Flow Alert Hours",
+            description="Alert when flow has not stopped for this many hours, e.g. a leak (0 = disabled)",
+            default=0.0,
+        )
+
+        self.no_flow_alert_hours = config.Number(
+            "No Flow Alert Hours",
+            description="Alert when no flow has been seen for this many hours, for meters expected to flow "
+            "regularly (0 = disabled)",
+            default=0.0,
+        )
+
+        self.batch_output_pin = config.Integer(
+            "Batch Output Pin",
+            description="Digital output that runs the pump or valve for batch dosing, "
+            "energised while a batch is filling (-1 = batch dosing disabled)",
+            default=-1,
+        )
+
+        self.batch_meter = config.String(
+            "Batch Meter",
+            description="Name of the meter that measures batches (empty = the first meter)",
+            default="",
+        )
+
+        self.batch_initial_latency = config.Number(
+            "Batch Initial Latency",
+            description="Starting estimate of the seconds flow continues after the batch output is shut off. "
+            "Refined after every batch",
+            default=0.5,
+        )
+
+        self.batch_settle_time = config.Number(
+            "Batch Settle Time",
+            description="Seconds without flow after the shut-off before a batch's final volume is measured",
+            default=5.0,
+        )
+
+        self.ui_flow_deadband = config.Number(
+            "UI Flow Deadband",
+            description="Percent change in flow rate needed before the displayed flow rate is updated",
+            default=2.0,
+        )
+
+        self.ui_volume_deadband = config.Number(
+            "UI Volume Deadband",
+            description="Change in litres needed before the displayed total volume and pulse count are updated",
+            default=1.0,
+        )
+
+        self.ui_max_staleness = config.Integer(
+            "UI Max Staleness",
+            description="Maximum seconds between UI updates of a reading, even if it has not moved beyond its deadband",
+            default=60,
+        )
+
+        self.journal_directory = config.String(
+            "Journal Directory",
+            description="Directory on persistent storage for the local totalizer journal, "
+            "used to restore totals after a restart without waiting on tags (empty = disabled)",
+            default="/data/flow_pulse_counter",
+        )
+
+        self.journal_sync_interval = config.Number(
+            "Journal Sync Interval",
+            description="Seconds between journal writes to disk. At most this much counted volume is lost on power failure",
+            default=0.5,
+        )
+
+        self.history_directory = config.String(
+            "History Directory",
+            description="Directory on persistent storage for the 1 s / 1 min / 1 h flow history and the buckets "
+            "waiting to upload, saved every minute (empty = kept in memory only)",
+            default="/data/flow_pulse_counter",
+        )
+
+        self.history_upload_interval = config.Number(
+            "History Upload Interval",
+            description="Seconds between uploads of completed history buckets to the history channel (0 = disabled)",
+            default=300.0,
+        )
+
+        self.history_upload_resolution = config.Enum(
+            "History Upload Resolution",
+            description="Shortest history buckets uploaded. Longer tiers are always uploaded as well",
+            choices=HISTORY_RESOLUTIONS,
+            default="1m",
+        )
+
+        self.history_channel = config.String(
+            "History Channel",
+            description="Channel the compressed history batches are published to",
+            default="flow_history",
+        )
+
+        self.trace_file = config.String(
+            "Trace File",
+            description="Record every DI sample and edge to this file for offline replay (empty = disabled)",
+            default="",
+        )
+
+        self.instrumentation = config.Boolean(
+            "Instrumentation",
+            description="Record stage latency and loop jitter histograms and estimate missed edges, "
+            "published in the diagnostics tag",
+            default=True,
+        )
+
+        self.metrics_port = config.Integer(
+            "Metrics Port",
+            description="Local port serving the instrumentation in Prometheus text format (0 = disabled)",
+            default=0,
+        )
+
+        self.profile_directory = config.String(
+            "Profile Directory",
+            description="Directory for cProfile and tracemalloc reports from the Run Profiler action "
+            "or the FLOW_PULSE_PROFILE environment variable. Oldest reports are deleted past 5 MB",
+            default="/data/flow_pulse_counter/profiles",
+        )
+
+        meter = config.Object("Meter")
+        meter.add_elements(
+            config.String("Meter Name", description="Name used for this meter's UI section and tags"),
+            config.Integer("Input Pin", description="Digital input pin connected to this meter's pulse output"),
+            config.Number(
+                "Pulses Per Litre",
+                description="Calibration factor for this meter",
+                default=450.0,
+            ),
+            config.String(
+                "K Factor Points",
+                description="Pulses per litre by pulse frequency for this meter, as 'Hz:pulses/L' pairs (empty = disabled)",
+                default="",
+            ),
+            config.Integer(
+                "Debounce ms",
+                description="Debounce time in milliseconds for this meter's input",
+                default=50,
+            ),
+            config.Number(
+                "Low Flow Threshold",
+                description="Low-flow warning threshold for this meter (0 = disabled)",
+                default=0.0,
+            ),
+            config.Number(
+                "High Flow Threshold",
+                description="High-flow warning threshold for this meter (0 = disabled)",
+                default=0.0,
+            ),
+        )
+        self.meters = config.Array(
+            "Meters",
+            element=meter,
+            description="Count several meters from one app. Leave empty to use the single-meter settings above",
+        )
+        # Arrays can't take a default, but an empty list keeps single-meter configs valid
+        self.meters.default = []
+
 
 def export():
     FlowPulseCounterConfig().export(
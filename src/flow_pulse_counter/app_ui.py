@@ -2,12 +2,38 @@ from datetime import datetime
 
 from pydoover import ui
 
+# Calibration modes: a run either sets the single factor or adds a point to the K-factor table
+CALIBRATION_SINGLE = "single"
+CALIBRATION_ADD_POINT = "add_point"
+
+
+def _flow_rate_ranges(low_threshold, high_threshold):
+    ranges = [ui.Range("No Flow", 0, 0.01, ui.Colour.grey)]
+
+    if low_threshold > 0 and high_threshold > 0:
+        ranges.append(ui.Range("Low", 0.01, low_threshold, ui.Colour.yellow))
+        ranges.append(ui.Range("Normal", low_threshold, high_threshold, ui.Colour.green))
+        ranges.append(ui.Range("High", high_threshold, 99999, ui.Colour.red))
+    elif low_threshold > 0:
+        ranges.append(ui.Range("Low", 0.01, low_threshold, ui.Colour.yellow))
+        ranges.append(ui.Range("Normal", low_threshold, 99999, ui.Colour.green))
+    elif high_threshold > 0:
+        ranges.append(ui.Range("Normal", 0.01, high_threshold, ui.Colour.green))
+        ranges.append(ui.Range("High", high_threshold, 99999, ui.Colour.red))
+    else:
+        ranges.append(ui.Range("Normal", 0.01, 99999, ui.Colour.green))
+
+    return ranges
+
+
+class MeterUI:
+    """Display elements for a single meter channel."""
+
+    def __init__(self, channel=None):
+        name = channel.tag if channel is not None else (lambda n: n)
 
-class FlowPulseCounterUI:
-    def __init__(self):
-        # Variables (Display)
         self.flow_rate = ui.NumericVariable(
-            "flow_rate",
+            name("flow_rate"),
             "Flow Rate",
             precision=2,
             unit="L/min",
@@ -18,39 +44,92 @@ class FlowPulseCounterUI:
         )
 
         self.total_volume = ui.NumericVariable(
-            "total_volume",
+            name("total_volume"),
             "Total Volume",
             precision=2,
             unit="L",
         )
 
         self.pulse_count = ui.NumericVariable(
-            "pulse_count",
+            name("pulse_count"),
             "Pulse Count",
             precision=0,
         )
 
-        self.status = ui.TextVariable("status", "Status")
-
-        self.last_update = ui.DateTimeVariable("last_update", "Last Update")
+        self.status = ui.TextVariable(name("status"), "Status")
 
         # Warning indicators
         self.low_flow_warning = ui.WarningIndicator(
-            "low_flow_warning",
+            name("low_flow_warning"),
             "Low Flow Warning",
             hidden=True,
         )
 
         self.high_flow_warning = ui.WarningIndicator(
-            "high_flow_warning",
+            name("high_flow_warning"),
             "High Flow Warning",
             hidden=True,
         )
 
+    def fetch(self):
+        return (
+            self.flow_rate,
+            self.total_volume,
+            self.pulse_count,
+            self.status,
+            self.low_flow_warning,
+            self.high_flow_warning,
+        )
+
+
+class FlowPulseCounterUI:
+    def __init__(self, channels=None, batching=False):
+        # One set of display elements per meter. A single meter keeps the
+        # original top-level layout, several meters get a submodule each.
+        if channels is None or len(channels) <= 1:
+            self.meters = [MeterUI()]
+            self.meter_sections = None
+        else:
+            self.meters = [MeterUI(c) for c in channels]
+            self.meter_sections = [
+                ui.Submodule(c.tag("meter"), c.name, children=list(m.fetch()))
+                for c, m in zip(channels, self.meters)
+            ]
+
+        # Variables (Display) of the first meter, kept for single-meter use
+        primary = self.meters[0]
+        self.flow_rate = primary.flow_rate
+        self.total_volume = primary.total_volume
+        self.pulse_count = primary.pulse_count
+        self.status = primary.status
+        self.low_flow_warning = primary.low_flow_warning
+        self.high_flow_warning = primary.high_flow_warning
+
+        self.last_update = ui.DateTimeVariable("last_update", "Last Update")
+
         # Alert stream for push notifications
         self.notifications = ui.AlertStream()
 
         # Parameters (User Input)
+        self.calibration_meter = None
+        if self.meter_sections is not None:
+            self.calibration_meter = ui.StateCommand(
+                "calibration_meter",
+                "Calibration Meter",
+                user_options=[ui.Option(c.key, c.name) for c in channels],
+                default=channels[0].key,
+            )
+
+        self.calibration_mode = ui.StateCommand(
+            "calibration_mode",
+            "Calibration Mode",
+            user_options=[
+                ui.Option(CALIBRATION_SINGLE, "Single Factor"),
+                ui.Option(CALIBRATION_ADD_POINT, "Add K-Factor Point"),
+            ],
+            default=CALIBRATION_SINGLE,
+        )
+
         self.calibration_factor = ui.NumericParameter(
             "calibration_factor",
             "Calibration Factor (pulses/L)",
@@ -87,47 +166,133 @@ class FlowPulseCounterUI:
             position=3,
         )
 
+        self.run_profiler = ui.Action(
+            "run_profiler",
+            "Run Profiler",
+            colour=ui.Colour.grey,
+            position=4,
+        )
+
+        # Batch dosing, only shown when a batch output is configured
+        self.batching = batching
+        self.batch_target = ui.NumericParameter(
+            "batch_target",
+            "Batch Target (L)",
+            precision=2,
+        )
+
+        self.batch_volume = ui.NumericVariable(
+            "batch_volume",
+            "Batch Volume",
+            precision=2,
+            unit="L",
+        )
+
+        self.start_batch = ui.Action(
+            "start_batch",
+            "Start Batch",
+            colour=ui.Colour.green,
+            position=5,
+        )
+
+        self.stop_batch = ui.Action(
+            "stop_batch",
+            "Stop Batch",
+            colour=ui.Colour.red,
+            hidden=True,
+            position=6,
+        )
+
     def fetch(self):
+        if self.meter_sections is None:
+            readings = (
+                self.flow_rate,
+                self.total_volume,
+                self.pulse_count,
+                self.status,
+                self.last_update,
+                self.low_flow_warning,
+                self.high_flow_warning,
+            )
+        else:
+            readings = (*self.meter_sections, self.last_update)
+
+        parameters = (self.calibration_mode, self.calibration_factor, self.known_volume)
+        if self.calibration_meter is not None:
+            parameters = (self.calibration_meter,) + parameters
+
+        batch = ()
+        if self.batching:
+            readings = (*readings, self.batch_volume)
+            parameters = (*parameters, self.batch_target)
+            batch = (self.start_batch, self.stop_batch)
+
         return (
-            self.flow_rate,
-            self.total_volume,
-            self.pulse_count,
-            self.status,
-            self.last_update,
-            self.low_flow_warning,
-            self.high_flow_warning,
+            *readings,
             self.notifications,
-            self.calibration_factor,
-            self.known_volume,
+            *parameters,
             self.reset_totals,
             self.calibrate,
             self.stop_calibration,
+            self.run_profiler,
+            *batch,
         )
 
-    def update_readings(self, flow_rate, total_volume, pulse_count, status_text, unit="L/min"):
+    def update_readings(self, flow_rate, total_volume, pulse_count, status_text, unit="L/min", channel=0):
         """Update display variables with current readings."""
-        self.flow_rate.update(flow_rate)
-        self.flow_rate.unit = unit
-        self.total_volume.update(total_volume)
-        self.pulse_count.update(pulse_count)
-        self.status.update(status_text)
+        meter = self.meters[channel]
+        meter.flow_rate.update(flow_rate)
+        self.set_flow_rate_unit(unit, channel=channel)
+        meter.total_volume.update(total_volume)
+        meter.pulse_count.update(pulse_count)
+        meter.status.update(status_text)
         self.last_update.update(datetime.now())
 
-    def set_flow_rate_ranges(self, low_threshold, high_threshold):
-        """Update flow rate ranges based on configured thresholds."""
-        ranges = [ui.Range("No Flow", 0, 0.01, ui.Colour.grey)]
-
-        if low_threshold > 0 and high_threshold > 0:
-            ranges.append(ui.Range("Low", 0.01, low_threshold, ui.Colour.yellow))
-            ranges.append(ui.Range("Normal", low_threshold, high_threshold, ui.Colour.green))
-            ranges.append(ui.Range("High", high_threshold, 99999, ui.Colour.red))
-        elif low_threshold > 0:
-            ranges.append(ui.Range("Low", 0.01, low_threshold, ui.Colour.yellow))
-            ranges.append(ui.Range("Normal", low_threshold, 99999, ui.Colour.green))
-        elif high_threshold > 0:
-            ranges.append(ui.Range("Normal", 0.01, high_threshold, ui.Colour.green))
-            ranges.append(ui.Range("High", high_threshold, 99999, ui.Colour.red))
-        else:
-            ranges.append(ui.Range("Normal", 0.01, 99999, ui.Colour.green))
+    def publish_readings(
+        self,
+        change_filter,
+        now,
+        flow_rate,
+        total_volume,
+        pulse_count,
+        status_text,
+        flow_deadband=0.0,
+        volume_deadband=0.0,
+        channel=0,
+    ):
+        """Update only the display variables that moved beyond their deadband.
+
+        `flow_deadband` is a fraction of the last published flow rate and
+        `volume_deadband` is in litres. Returns True if anything was updated.
+        """
+        meter = self.meters[channel]
+        name = meter.flow_rate.name
+        changed = False
+
+        if change_filter.should_publish(name, flow_rate, now, absolute=0.01, relative=flow_deadband):
+            meter.flow_rate.update(flow_rate)
+            changed = True
+
+        if change_filter.should_publish(meter.total_volume.name, total_volume, now, absolute=volume_deadband):
+            meter.total_volume.update(total_volume)
+            meter.pulse_count.update(pulse_count)
+            changed = True
 
-        self.flow_rate.ranges = ranges
+        if change_filter.should_publish(meter.status.name, status_text, now):
+            meter.status.update(status_text)
+            changed = True
+
+        if changed:
+            self.last_update.update(datetime.now())
+        return changed
+
+    def set_flow_rate_unit(self, unit, channel=None):
+        """Set the flow rate unit on one meter, or all meters if `channel` is None."""
+        meters = self.meters if channel is None else (self.meters[channel],)
+        for meter in meters:
+            if meter.flow_rate.unit != unit:
+                meter.flow_rate.unit = unit
+
+    def set_flow_rate_ranges(self, low_threshold, high_threshold, channel=0):
+        """Update flow rate ranges based on configured thresholds."""
+        self.meters[channel].flow_rate.ranges = _flow_rate_ranges(low_threshold, high_threshold)
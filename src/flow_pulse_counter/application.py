@@ -1,13 +1,47 @@
+import asyncio
 import logging
+import os
 import time
-from collections import deque
-from datetime import datetime
 
 from pydoover.docker import Application
 from pydoover import ui
 
+from .acquisition import ACQUISITION_STREAM, ACQUISITION_POLLING, create_backend
+from .alert_rules import RULE_HIGH_FLOW, RULE_LOW_FLOW, AlertEngine, duration_rules, threshold_rules
 from .app_config import FlowPulseCounterConfig
-from .app_ui import FlowPulseCounterUI
+from .app_ui import CALIBRATION_ADD_POINT, CALIBRATION_SINGLE, FlowPulseCounterUI
+from .debounce import DebounceTuner
+from .dosing import ACTION_DONE, ACTION_STOP, BatchController
+from .engine import PulseEngine
+from .instrumentation import (
+    STAGE_ACQUIRE,
+    STAGE_MAIN_LOOP,
+    STAGE_PERSIST,
+    STAGE_PUBLISH,
+    STAGE_READ,
+    Instrumentation,
+    MetricsServer,
+)
+from .history import HISTORY_FILE, HistoryStore, HistoryUploader
+from .journal import TotalizerJournal
+from .kfactor import KFactorTable, format_k_factor_points
+from .platform_client import PlatformClient, PlatformUnavailable
+from .profiling import (
+    DEFAULT_PROFILE_ITERATIONS,
+    DEFAULT_TRACEMALLOC_SECONDS,
+    PROFILE_CPROFILE,
+    PROFILE_ENV,
+    PROFILE_TRACEMALLOC,
+    Profiler,
+    ProfileStore,
+    parse_profile_spec,
+)
+from .publisher import ChangeFilter
+from .scheduler import AdaptiveScheduler
+from .settings import ALERT_FIELDS, RESTART_FIELDS, RuntimeSettings, compile_settings
+from .sharding import ShardedBackend, platform_factory
+from .trace import RecordingPlatform, TraceWriter
+from .writers import AlertDispatcher, TagWriter
 
 log = logging.getLogger(__name__)
 
@@ -15,232 +49,835 @@ log = logging.getLogger(__name__)
 class FlowPulseCounterApplication(Application):
     config: FlowPulseCounterConfig  # Type hint for IDE autocomplete
 
-    loop_target_period = 0.2  # 200ms for reliable pulse detection
+    acquisition_period = 0.2  # 200ms while flowing, retuned by the adaptive scheduler
+    publish_period = 1.0  # UI, warnings and persistence run in the slower main loop
+
+    # Below this many pulses per reporting interval the flow rate is taken from pulse periods
+    PERIOD_ESTIMATE_MAX_PULSES = 20
+
+    # Longer averaging windows (seconds) published alongside the reporting-interval rate
+    AVERAGE_WINDOWS = {"flow_rate_1m": 60, "flow_rate_15m": 900}
+
+    # Seconds between auto debounce retunes
+    DEBOUNCE_TUNE_INTERVAL = 30.0
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # The main loop is the publish scheduler; acquisition runs in its own task
+        self.loop_target_period = self.publish_period
+
         self.ui: FlowPulseCounterUI = None
 
-        # Pulse counting state
-        self.prev_pin_state = None
-        self.last_edge_time = 0.0
-        self.pulse_count = 0
-        self.total_volume = 0.0
+        # Compiled config read by the loops, swapped for a new one when the deployment config changes
+        self.settings: RuntimeSettings = None
+        self.config_changed = False
+
+        # Meter channels and the pulse counting engine for each
+        self.channels = []
+        self.engines: list[PulseEngine] = []
+
+        # Long-lived connection to the platform interface the IO requests go through
+        self.platform: PlatformClient = None
+
+        # Pulse acquisition backend (polling edge detector or hardware counter)
+        self.acquisition = None
+        self.acquisition_task = None
+        self.acquisition_error = None
+        # Acquisition ticks without an input read, while the platform was unavailable or reads overran
+        self.missed_ticks = 0
+
+        # Retunes the acquisition period from the observed pulse frequency
+        self.scheduler: AdaptiveScheduler = None
+        self.last_read_time = None
+
+        # Per-channel debounce tuners fed the raw edges, when auto debounce is on
+        self.debounce_tuners: list[DebounceTuner] = None
+        self.last_debounce_tune = 0.0
+
+        # Optional latency histograms and missed-edge estimate, and their HTTP endpoint
+        self.metrics: Instrumentation = None
+        self.metrics_server: MetricsServer = None
+        self.reported_dropped_events = 0
+        self.reported_missed_edges = 0
 
-        # Rolling window for flow rate calculation: deque of (timestamp, cumulative_pulse_count)
-        self.pulse_history = deque()
+        # On-demand cProfile / tracemalloc runs, only created once requested
+        self.profiler: Profiler = None
 
-        # Current flow rate
-        self.flow_rate = 0.0
+        # Downsampled flow history, saved locally and uploaded in compressed batches
+        self.history: HistoryStore = None
+        self.history_uploader: HistoryUploader = None
 
-        # Active calibration factor (may differ from config if adjusted at runtime)
-        self.pulses_per_litre = 450.0
+        # Optional recording of DI samples and edges for offline replay
+        self.trace_writer: TraceWriter = None
+
+        # Deadband / staleness filter for UI updates
+        self.change_filter = ChangeFilter()
 
         # Calibration mode state
         self.calibrating = False
+        self.calibration_channel = 0
+        self.calibration_mode = CALIBRATION_SINGLE
         self.calibration_start_pulses = 0
+        self.calibration_start_time = 0.0
+
+        # Batch dosing on one meter, switching a digital output
+        self.batch: BatchController = None
+        self.batch_channel = 0
+        self.batch_output_on = False
+        self.batch_last_volume = 0.0
+
+        # Local crash-safe journal of the totals, synced far more often than tags
+        self.journal: TotalizerJournal = None
+        self.journal_task = None
 
         # Tag persistence throttle
         self.last_tag_save_time = 0.0
         self.TAG_SAVE_INTERVAL = 60.0  # seconds
 
-        # Alert deduplication
-        self.active_alerts = set()
+        # Hysteresis, on/off delays and cooldowns for the flow warnings and alerts
+        self.alert_engine: AlertEngine = None
+
+        # Tag writes and alerts are sent by background tasks, off the sampling path
+        self.tag_writer = TagWriter(self.set_tags_async)
+        self.alerts: AlertDispatcher = None
 
     async def setup(self):
         """Initialize UI and restore persisted state."""
-        self.ui = FlowPulseCounterUI()
+        self.settings = settings = compile_settings(self.config)
+        self.channels = list(settings.channels)
+        reporting_interval = settings.reporting_interval
+        self.engines = [
+            PulseEngine(
+                pulses_per_litre=channel.pulses_per_litre,
+                debounce_s=channel.debounce_s,
+                window_s=reporting_interval,
+                max_window_s=max(self.AVERAGE_WINDOWS.values()),
+                bucket_s=min(1.0, reporting_interval / 10.0),
+                no_flow_periods=settings.no_flow_periods,
+                period_max_pulses=self.PERIOD_ESTIMATE_MAX_PULSES,
+                k_factor=KFactorTable(channel.k_factor_points) if channel.k_factor_points else None,
+            )
+            for channel in self.channels
+        ]
+
+        self.ui = FlowPulseCounterUI(self.channels, batching=settings.batching)
         self.ui_manager.add_children(*self.ui.fetch())
-        self.ui_manager.set_display_name(self.config.app_display_name.value)
+        self.ui_manager.set_display_name(settings.display_name)
+
+        self.alert_engine = self._build_alert_engine()
+        self.alerts = AlertDispatcher(self._deliver_alert)
+        self.tag_writer.start()
+        self.alerts.start()
+
+        self.platform = PlatformClient(self.platform_iface)
+
+        # Start the configured pulse acquisition backend
+        base_period = self.acquisition_period
+        schedule = {
+            "base_period_s": base_period,
+            "min_period_s": min(settings.min_acquisition_period, base_period),
+            "idle_period_s": max(settings.idle_acquisition_period, base_period),
+            "idle_after_s": reporting_interval,
+            "cpu_budget": settings.acquisition_cpu_budget,
+        }
+        sharded = settings.acquisition_shards > 0
+        if sharded:
+            if settings.trace_file:
+                log.warning("Trace recording isn't available with acquisition shards, not recording")
+            self.acquisition = ShardedBackend(
+                settings.acquisition_mode,
+                platform_factory(self.platform_iface),
+                self.channels,
+                settings.acquisition_shards,
+                counter_bits=settings.counter_bits,
+                resync_counters=settings.resync_counters,
+                schedule=schedule,
+            )
+        else:
+            platform_iface = self.platform
+            if settings.trace_file:
+                self.trace_writer = TraceWriter(settings.trace_file)
+                platform_iface = RecordingPlatform(platform_iface, self.trace_writer)
+                log.info("Recording pulse trace to %s", settings.trace_file)
+
+            self.acquisition = create_backend(
+                settings.acquisition_mode,
+                platform_iface,
+                self.channels,
+                counter_bits=settings.counter_bits,
+                resync_counters=settings.resync_counters,
+            )
+        await self.acquisition.start()
+        if settings.auto_debounce:
+            self._start_debounce_tuning()
+
+        # With shards the workers sample the inputs, the app only reads their shared counts
+        self.scheduler = AdaptiveScheduler(
+            **schedule,
+            sampled=self.acquisition.name == ACQUISITION_POLLING and not sharded,
+        )
+
+        if settings.instrumentation:
+            self.metrics = Instrumentation()
+            log.info("Instrumentation enabled, %.2f us per observation", self.metrics.observe_cost * 1e6)
+            if settings.metrics_port:
+                self.metrics_server = MetricsServer(self._render_metrics, port=settings.metrics_port)
+                try:
+                    await self.metrics_server.start()
+                except OSError as e:
+                    log.error("Unable to serve metrics on port %d: %s", settings.metrics_port, e)
+                    self.metrics_server = None
+
+        self._open_history()
+
+        # Restore totals from the local journal first, falling back to tags
+        restored = self._open_journal()
+        for channel in self.channels:
+            engine = self.engines[channel.index]
+            if channel.index in restored:
+                engine.pulse_count, engine.total_volume = restored[channel.index]
+            else:
+                self._restore_channel(channel)
+
+            # Configure flow rate ranges based on thresholds
+            self.ui.set_flow_rate_ranges(
+                channel.low_flow_threshold,
+                channel.high_flow_threshold,
+                channel=channel.index,
+            )
+
+            log.info(
+                "Meter %r started - pin=%d, pulses_per_litre=%.1f, restored volume=%.2f L, pulses=%d",
+                channel.name,
+                channel.pin,
+                engine.pulses_per_litre,
+                engine.total_volume,
+                engine.pulse_count,
+            )
+            if engine.k_factor is not None:
+                log.info("Meter %r K-factor points: %s", channel.name, format_k_factor_points(engine.k_factor.points))
+
+        if self.ui.batching:
+            await self._setup_batching()
+
+        self.ui.set_flow_rate_unit(settings.flow_rate_unit)
+        self.change_filter.max_staleness_s = settings.max_staleness
+
+        # Set initial calibration factor in UI
+        self.ui.calibration_factor.coerce(self.engines[self.calibration_channel].pulses_per_litre)
+
+        log.info(
+            "Flow Pulse Counter started - %d meter(s), mode=%s",
+            len(self.channels),
+            self.acquisition.name,
+        )
+
+        self.acquisition_task = asyncio.create_task(self._acquisition_loop())
+
+        try:
+            requests = parse_profile_spec(os.environ.get(PROFILE_ENV))
+        except ValueError as e:
+            log.error("Ignoring %s: %s", PROFILE_ENV, e)
+            requests = {}
+        if requests:
+            self._start_profiling(requests)
+        if self.journal is not None:
+            self.journal_task = asyncio.create_task(self._journal_loop())
+            self._reconcile_tags(restored)
+        if not self.test_mode:
+            # Runs after the framework's own subscription has loaded the new config into the schema
+            self.device_agent.add_subscription("deployment_config", self._on_deployment_config_change)
+
+    async def _setup_batching(self):
+        """Create the batch controller with its learned latency, and make sure the output starts off."""
+        meter = self.settings.batch_meter
+        for channel in self.channels:
+            if meter and meter in (channel.name, channel.key):
+                self.batch_channel = channel.index
+                break
+        else:
+            if meter:
+                log.warning("Batch meter %r not found, batching on %r", meter, self.channels[0].name)
+
+        self.batch = BatchController(
+            latency_s=self.settings.batch_initial_latency,
+            settle_s=self.settings.batch_settle_time,
+        )
+        saved = self.get_tag(self.channels[self.batch_channel].tag("batch_stats"))
+        if isinstance(saved, dict):
+            try:
+                self.batch.restore(saved)
+            except (TypeError, ValueError) as e:
+                log.warning("Ignoring saved batch stats %r: %s", saved, e)
+        await self._set_batch_output(False)
+        log.info(
+            "Batch dosing on %r with output pin %d, latency estimate %.2f s",
+            self.channels[self.batch_channel].name,
+            self.settings.batch_output_pin,
+            self.batch.latency_s,
+        )
+
+    async def _set_batch_output(self, on):
+        """Switch the batch output. Returns False if the platform call failed."""
+        try:
+            await self.platform.set_do_async(self.settings.batch_output_pin, 1 if on else 0)
+        except Exception as e:
+            log.error("Error switching batch output %s: %s", "on" if on else "off", e)
+            return False
+        self.batch_output_on = on
+        return True
+
+    async def _update_batch(self, now, elapsed):
+        """Shut the batch output off ahead of the target, and record each batch once it settles."""
+        batch = self.batch
+        engine = self.engines[self.batch_channel]
+        volume = engine.total_volume
+        # The windowed rate lags a starting pump, so also take this read's own rate
+        rate_lps = engine.flow_rate / 60.0
+        if elapsed > 0:
+            rate_lps = max(rate_lps, (volume - self.batch_last_volume) / elapsed)
+        self.batch_last_volume = volume
+
+        action = batch.update(now, volume, rate_lps, self.scheduler.floor)
+        if action == ACTION_STOP:
+            log.info(
+                "Batch shut-off at %.3f L of %.3f L, flowing %.3f L/s",
+                batch.dispensed(volume),
+                batch.target,
+                rate_lps,
+            )
+        elif action == ACTION_DONE and not batch.manual_stop:
+            stats = batch.stats()
+            log.info(
+                "Batch finished: %.3f L of %.3f L (overshoot %+.3f L), latency estimate now %.2f s",
+                stats["last_dispensed"],
+                stats["last_target"],
+                stats["last_overshoot"],
+                stats["latency_s"],
+            )
+            self.tag_writer.write(self.channels[self.batch_channel].tag("batch_stats"), stats)
+            self.tag_writer.request_flush()
+
+        if self.batch_output_on and not batch.running:
+            # Retried on every read until the platform confirms the output is off
+            await self._set_batch_output(False)
+        if action == ACTION_DONE:
+            self.ui.start_batch.hidden = False
+            self.ui.stop_batch.hidden = True
+
+    def _start_debounce_tuning(self):
+        if self.acquisition.name == ACQUISITION_STREAM:
+            log.warning("Auto debounce needs 'Polling' or 'Events' mode, the pulse stream only gives a count")
+            return
+        if isinstance(self.acquisition, ShardedBackend):
+            log.warning("Auto debounce isn't available with acquisition shards, the workers see the edges")
+            return
+        self.debounce_tuners = [DebounceTuner(channel.debounce_s) for channel in self.channels]
+        self.acquisition.edge_stats = [tuner.edges for tuner in self.debounce_tuners]
+        self.last_debounce_tune = time.time()
+
+    def _tune_debounce(self, now):
+        """Apply each channel's tuned debounce to its acquisition and engine."""
+        self.last_debounce_tune = now
+        for channel, tuner in zip(self.channels, self.debounce_tuners):
+            index = channel.index
+            debounce_s = tuner.tune()
+            if debounce_s == self.acquisition.debounce_s[index]:
+                continue
+            self.acquisition.debounce_s[index] = debounce_s
+            self.engines[index].debounce_s = debounce_s
+            log.info(
+                "Debounce for %r tuned to %.2f ms: %.1f%% of edges are bounce, counts up to %.0f Hz",
+                channel.name,
+                debounce_s * 1000.0,
+                tuner.bounce_rate * 100.0,
+                tuner.max_frequency_hz,
+            )
+
+    def _open_history(self):
+        """Create the flow history store, restore it from disk and start saving and uploading it."""
+        settings = self.settings
+        self.history = HistoryStore(
+            [channel.key or "meter" for channel in self.channels], upload_from_s=settings.history_upload_from_s
+        )
+
+        directory = settings.history_directory
+        self.history_uploader = HistoryUploader(
+            self.history,
+            self.publish_to_channel,
+            channel_name=settings.history_channel,
+            upload_interval_s=settings.history_upload_interval,
+            path=os.path.join(directory, HISTORY_FILE) if directory else None,
+        )
+        self.history_uploader.load()
+        self.history_uploader.start()
+
+    def _open_journal(self):
+        """Open the local totalizer journal, returning the totals it restored."""
+        journal_directory = self.settings.journal_directory
+        if not journal_directory:
+            return {}
+
+        journal = TotalizerJournal(journal_directory)
+        try:
+            restored = journal.load()
+        except OSError as e:
+            log.error("Unable to open totalizer journal in %s, restoring from tags: %s", journal_directory, e)
+            return {}
+
+        self.journal = journal
+        return {index: totals for index, totals in restored.items() if index < len(self.channels)}
+
+    def _reconcile_tags(self, restored):
+        """Adopt tag totals for channels whose journal is behind them, e.g. a replaced device."""
+        for channel in self.channels:
+            if channel.index not in restored:
+                continue
+            journal_pulses, journal_volume = restored[channel.index]
+            try:
+                tag_pulses = int(self.get_tag(channel.tag("pulse_count")) or 0)
+                tag_volume = float(self.get_tag(channel.tag("total_volume")) or 0.0)
+            except (TypeError, ValueError):
+                continue
 
-        # Load calibration factor from config
-        self.pulses_per_litre = self.config.pulses_per_litre.value
+            if tag_pulses > journal_pulses:
+                log.warning(
+                    "Journal for meter %r is behind its tags (%d < %d pulses), using tag totals",
+                    channel.name,
+                    journal_pulses,
+                    tag_pulses,
+                )
+                engine = self.engines[channel.index]
+                engine.pulse_count += tag_pulses - journal_pulses
+                engine.total_volume += tag_volume - journal_volume
+                self.journal.update(channel.index, engine.pulse_count, engine.total_volume)
 
-        # Restore persisted state from tags
-        saved_total_volume = self.get_tag("total_volume")
+    def _restore_channel(self, channel):
+        """Restore a channel's persisted totals from tags."""
+        engine = self.engines[channel.index]
+        saved_total_volume = self.get_tag(channel.tag("total_volume"))
         if saved_total_volume is not None:
             try:
-                self.total_volume = float(saved_total_volume)
+                engine.total_volume = float(saved_total_volume)
             except (TypeError, ValueError):
-                self.total_volume = 0.0
+                engine.total_volume = 0.0
 
-        saved_pulse_count = self.get_tag("pulse_count")
+        saved_pulse_count = self.get_tag(channel.tag("pulse_count"))
         if saved_pulse_count is not None:
             try:
-                self.pulse_count = int(saved_pulse_count)
+                engine.pulse_count = int(saved_pulse_count)
             except (TypeError, ValueError):
-                self.pulse_count = 0
-
-        # Set initial calibration factor in UI
-        self.ui.calibration_factor.update(self.pulses_per_litre)
+                engine.pulse_count = 0
 
-        # Configure flow rate ranges based on thresholds
-        low_threshold = self.config.low_flow_threshold.value
-        high_threshold = self.config.high_flow_threshold.value
-        self.ui.set_flow_rate_ranges(low_threshold, high_threshold)
+    async def _acquisition_loop(self):
+        """Run pulse acquisition at its own rate, independent of the publish loop."""
+        next_tick = time.monotonic()
+        while True:
+            if self.metrics is not None:
+                self.metrics.observe_jitter(time.monotonic() - next_tick)
+            await self._acquire()
 
-        log.info(
-            "Flow Pulse Counter started - pin=%d, pulses_per_litre=%.1f, restored volume=%.2f L, pulses=%d",
-            self.config.input_pin.value,
-            self.pulses_per_litre,
-            self.total_volume,
-            self.pulse_count,
-        )
+            # A running batch is checked as often as the scheduler allows, for a precise shut-off
+            period = self.scheduler.floor if self.batch is not None and self.batch.running else self.scheduler.period
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # Running behind, don't try to catch up with a burst of reads
+                self.missed_ticks += int(-delay // period)
+                next_tick = time.monotonic()
+                delay = 0
+            await asyncio.sleep(delay)
 
-    async def main_loop(self):
-        """Main loop: read pin, detect pulses, calculate flow rate, update UI."""
+    async def _acquire(self):
+        """Acquire pulses on every channel and update the flow rates."""
         try:
-            # Read the digital input pin
-            pin = self.config.input_pin.value
-            values = await self.platform_iface.get_di_async([pin])
-            current_state = values.get(pin, False)
-
-            # Detect rising edge with debounce
+            # Collect pulses counted on every channel since the last iteration
             now = time.time()
-            debounce_s = self.config.debounce_ms.value / 1000.0
+            read_start = time.perf_counter()
+            new_pulses = await self.acquisition.read(now)
+            read_s = time.perf_counter() - read_start
+            metrics = self.metrics
 
-            if self.prev_pin_state is not None and current_state and not self.prev_pin_state:
-                # Rising edge detected
-                if (now - self.last_edge_time) >= debounce_s:
-                    # Valid pulse after debounce
-                    self.pulse_count += 1
-                    self.last_edge_time = now
+            elapsed = now - self.last_read_time if self.last_read_time is not None else 0.0
+            self.last_read_time = now
+            pulse_hz = 0.0
+            # Polling with counters open knows the edges it missed, otherwise they are estimated
+            missed_edges = getattr(self.acquisition, "missed_edges", None) if metrics is not None else None
+            estimate_missed = metrics is not None and self.scheduler.sampled and missed_edges is None
 
-                    # Accumulate volume
-                    if self.pulses_per_litre > 0:
-                        self.total_volume += 1.0 / self.pulses_per_litre
+            for index, pulses in enumerate(new_pulses):
+                engine = self.engines[index]
+                if pulses > 0:
+                    engine.add_pulses(pulses, self.acquisition.last_edge_time[index])
+                    if self.journal is not None:
+                        self.journal.update(index, engine.pulse_count, engine.total_volume, now)
 
-            self.prev_pin_state = current_state
+                # Record the cumulative count and recalculate the flow rate
+                engine.update(now)
+                self.history.record(index, now, engine.flow_rate, engine.total_volume)
 
-            # Record pulse history for flow rate calculation
-            self.pulse_history.append((now, self.pulse_count))
+                # The windowed rate lags a rising flow, so also take this read's own rate
+                channel_hz = engine.pulse_hz
+                if elapsed > 0:
+                    channel_hz = max(channel_hz, pulses / elapsed)
+                pulse_hz = max(pulse_hz, channel_hz)
 
-            # Remove entries older than the reporting interval
-            reporting_interval = self.config.reporting_interval.value
-            cutoff = now - reporting_interval
-            while self.pulse_history and self.pulse_history[0][0] < cutoff:
-                self.pulse_history.popleft()
+                if estimate_missed:
+                    # The measured rate, not this read's own, so reads that counted more offset the others
+                    metrics.estimate_missed(engine.pulse_hz, elapsed, pulses, index)
 
-            # Calculate flow rate from rolling window
-            self.flow_rate = self._calculate_flow_rate(now, reporting_interval)
+            if self.batch is not None and (self.batch.active or self.batch_output_on):
+                await self._update_batch(now, elapsed)
 
-            # Convert flow rate to selected unit
-            display_flow_rate = self._convert_flow_rate(self.flow_rate)
-            unit = self.config.flow_rate_unit.value
+            self._update_schedule(now, pulse_hz, read_s)
+            self.acquisition_error = None
 
-            # Determine status text
-            status = self._get_status_text()
+            if metrics is not None:
+                dropped = getattr(self.acquisition, "dropped_events", 0)
+                if dropped > self.reported_dropped_events:
+                    metrics.add_missed(dropped - self.reported_dropped_events)
+                    self.reported_dropped_events = dropped
+                if missed_edges is not None and missed_edges > self.reported_missed_edges:
+                    metrics.add_missed(missed_edges - self.reported_missed_edges)
+                    self.reported_missed_edges = missed_edges
+                metrics.observe(STAGE_READ, read_s)
+                metrics.observe(STAGE_ACQUIRE, time.perf_counter() - read_start)
 
-            # Update UI
-            self.ui.update_readings(
-                flow_rate=display_flow_rate,
-                total_volume=self.total_volume,
-                pulse_count=self.pulse_count,
-                status_text=status,
-                unit=unit,
+        except PlatformUnavailable:
+            # Logged by the client, once per outage and then at its log interval
+            self.missed_ticks += 1
+            self.acquisition_error = None
+
+        except Exception as e:
+            log.error("Error acquiring pulses: %s", e, exc_info=True)
+            self.acquisition_error = str(e)
+
+    def _update_schedule(self, now, pulse_hz, read_s):
+        """Retune the acquisition period and report when polling can't keep up."""
+        was_limited = self.scheduler.sampling_limited
+        self.scheduler.update(now, pulse_hz, read_s)
+        if self.scheduler.sampling_limited and not was_limited:
+            log.warning(
+                "Sampling limited: %.1f Hz of pulses needs a shorter acquisition period than %.0f ms, "
+                "pulses may be missed. Consider 'Pulse Stream' or 'Events' mode",
+                pulse_hz,
+                self.scheduler.period * 1000.0,
             )
+        elif was_limited and not self.scheduler.sampling_limited:
+            log.info("Sampling no longer limited")
+
+    async def _journal_loop(self):
+        """Write journaled totals to local disk at the configured interval."""
+        while True:
+            await asyncio.sleep(self.settings.journal_sync_interval)
+            try:
+                await self.journal.sync()
+            except Exception as e:
+                log.error("Error writing totalizer journal: %s", e)
+
+    def _on_deployment_config_change(self, _, config):
+        self.config_changed = True
+
+    def _reload_settings(self):
+        """Compile the current config and swap it in, keeping the totals and rate history.
+
+        Settings only read at startup, and a change to the meters' inputs,
+        keep their old values until the app is restarted.
+        """
+        try:
+            settings = compile_settings(self.config)
+        except Exception as e:
+            log.error("Ignoring config update: %s", e)
+            return
+        old = self.settings
+        changed = old.changed(settings)
+
+        restart_fields = RESTART_FIELDS
+        if not old.same_meters(settings):
+            # The thresholds are set in the display unit, so it stays with the meters
+            restart_fields |= {"channels", "low_flow_lpm", "high_flow_lpm", "flow_rate_unit", "flow_rate_factor"}
+        pinned = changed & restart_fields
+        if pinned:
+            log.warning("Config changes to %s take effect after a restart", ", ".join(sorted(pinned)))
+            settings = settings.replace(**{name: getattr(old, name) for name in pinned})
+            changed -= pinned
+        if not changed:
+            return
+
+        self.settings = settings
+        self.channels = list(settings.channels)
+        for channel, old_channel in zip(self.channels, old.channels):
+            self._reconfigure_channel(channel, old_channel, settings)
+
+        scheduler = self.scheduler
+        scheduler.min_period_s = min(settings.min_acquisition_period, scheduler.base_period_s)
+        scheduler.idle_period_s = max(settings.idle_acquisition_period, scheduler.base_period_s)
+        scheduler.idle_after_s = settings.reporting_interval
+        if 0 < settings.acquisition_cpu_budget <= 1:
+            scheduler.cpu_budget = settings.acquisition_cpu_budget
+
+        if changed & ALERT_FIELDS:
+            # New rules start inactive, so the indicators are cleared and raised again once due
+            self.alert_engine = self._build_alert_engine()
+            for meter_ui in self.ui.meters:
+                meter_ui.low_flow_warning.hidden = True
+                meter_ui.high_flow_warning.hidden = True
+
+        if self.batch is not None:
+            self.batch.settle_s = settings.batch_settle_time
+        self.history_uploader.upload_interval_s = settings.history_upload_interval
+        self.change_filter.max_staleness_s = settings.max_staleness
+        self.ui.set_flow_rate_unit(settings.flow_rate_unit)
+        self.ui_manager.set_display_name(settings.display_name)
+        self.change_filter.invalidate()
+        log.info("Config reloaded: %s", ", ".join(sorted(changed)))
+
+    def _reconfigure_channel(self, channel, old_channel, settings):
+        engine = self.engines[channel.index]
+        reporting_interval = settings.reporting_interval
+        engine.set_window(reporting_interval, settings.no_flow_periods, bucket_s=min(1.0, reporting_interval / 10.0))
+        if self.debounce_tuners is None:
+            engine.debounce_s = channel.debounce_s
+            self.acquisition.debounce_s[channel.index] = channel.debounce_s
+
+        # Only a changed calibration setting replaces one made from the UI since startup
+        if (channel.pulses_per_litre, channel.k_factor_points) != (
+            old_channel.pulses_per_litre,
+            old_channel.k_factor_points,
+        ):
+            engine.pulses_per_litre = channel.pulses_per_litre
+            engine.k_factor = KFactorTable(channel.k_factor_points) if channel.k_factor_points else None
+            if channel.index == self.calibration_channel:
+                self.ui.calibration_factor.coerce(engine.pulses_per_litre)
+
+        self.ui.set_flow_rate_ranges(channel.low_flow_threshold, channel.high_flow_threshold, channel=channel.index)
+
+    async def main_loop(self):
+        """Publish loop: push changed readings to the UI, check warnings, persist state."""
+        try:
+            loop_start = time.perf_counter()
+            if self.config_changed:
+                # Swapped in here, between iterations, so no loop sees a half-applied config
+                self.config_changed = False
+                self._reload_settings()
+
+            now = time.time()
+            settings = self.settings
+            flow_deadband = settings.flow_deadband
+            volume_deadband = settings.volume_deadband
+            flow_rate_factor = settings.flow_rate_factor
+
+            for channel in self.channels:
+                index = channel.index
+                flow_rate = self.engines[index].flow_rate
+
+                # Convert flow rate to selected unit
+                display_flow_rate = flow_rate * flow_rate_factor
+
+                # Update the UI with readings that moved beyond their deadband
+                self.ui.publish_readings(
+                    self.change_filter,
+                    now,
+                    flow_rate=display_flow_rate,
+                    total_volume=self.engines[index].total_volume,
+                    pulse_count=self.engines[index].pulse_count,
+                    status_text=self._get_status_text(index),
+                    flow_deadband=flow_deadband,
+                    volume_deadband=volume_deadband,
+                    channel=index,
+                )
+
+                # Check warning thresholds
+                self._check_warnings(channel, now, flow_rate)
 
-            # Check warning thresholds
-            await self._check_warnings(display_flow_rate)
+            if self.debounce_tuners is not None and now - self.last_debounce_tune >= self.DEBOUNCE_TUNE_INTERVAL:
+                self._tune_debounce(now)
 
+            if self.batch is not None and self.batch.active:
+                self.ui.batch_volume.update(self.batch.dispensed(self.engines[self.batch_channel].total_volume))
+
+            persist_start = time.perf_counter()
             # Periodically persist state to tags
-            await self._persist_state(now)
+            self._persist_state(now)
+
+            if self.trace_writer is not None:
+                self.trace_writer.flush()
+
+            if self.profiler is not None:
+                self.profiler.tick()
+
+            if self.metrics is not None:
+                loop_end = time.perf_counter()
+                self.metrics.observe(STAGE_PUBLISH, persist_start - loop_start)
+                self.metrics.observe(STAGE_PERSIST, loop_end - persist_start)
+                self.metrics.observe(STAGE_MAIN_LOOP, loop_end - loop_start)
 
         except Exception as e:
             log.error("Error in main loop: %s", e, exc_info=True)
             self.ui.status.update(f"Error: {e}")
 
-    def _calculate_flow_rate(self, now, reporting_interval):
-        """Calculate flow rate in L/min from the rolling pulse window."""
-        if len(self.pulse_history) < 2:
-            return 0.0
+    async def close(self):
+        """Stop acquisition and the background writers, saving everything still pending, then close the app."""
+        for task in (self.acquisition_task, self.journal_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.acquisition_task = self.journal_task = None
+        if self.acquisition is not None:
+            # Stops shard workers and releases their shared memory block
+            await self.acquisition.stop()
 
-        oldest_time, oldest_pulses = self.pulse_history[0]
-        newest_time, newest_pulses = self.pulse_history[-1]
+        if self.journal is not None:
+            try:
+                await self.journal.sync()
+            except Exception as e:
+                log.error("Error writing totalizer journal: %s", e)
+            self.journal.close()
+        if self.history_uploader is not None:
+            # Queue the final totals, sent by the tag writer's flush
+            self.last_tag_save_time = 0.0
+            self._persist_state(time.time())
+        await self.tag_writer.stop()
+        if self.alerts is not None:
+            await self.alerts.stop()
+        if self.history_uploader is not None:
+            await self.history_uploader.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.profiler is not None:
+            await self.profiler.stop()
+        if self.trace_writer is not None:
+            self.trace_writer.close()
+        if self.platform is not None:
+            await self.platform.close()
+        await super().close()
 
-        elapsed = newest_time - oldest_time
-        if elapsed <= 0 or self.pulses_per_litre <= 0:
-            return 0.0
+    def _start_profiling(self, requests):
+        if self.profiler is None:
+            self.profiler = Profiler(ProfileStore(self.settings.profile_directory))
+        self.profiler.start(requests)
 
-        pulse_diff = newest_pulses - oldest_pulses
-        litres = pulse_diff / self.pulses_per_litre
+    def _render_metrics(self):
+        """Prometheus text for the metrics endpoint, including the scheduler's gauges."""
+        scheduler = self.scheduler.stats()
+        scheduler["sampling_limited"] = int(scheduler["sampling_limited"])
+        return self.metrics.prometheus(scheduler)
 
-        # Flow rate in L/min
-        return (litres / elapsed) * 60.0
+    def _get_status_text(self, index=0):
+        """Determine the current operational status text for a channel."""
+        if self.acquisition_error is not None:
+            return f"Error: {self.acquisition_error}"
 
-    def _convert_flow_rate(self, rate_lpm):
-        """Convert flow rate from L/min to the configured display unit."""
-        unit = self.config.flow_rate_unit.value
-        if unit == "L/hr":
-            return rate_lpm * 60.0
-        elif unit == "m3/hr":
-            return rate_lpm * 60.0 * 0.001
-        else:
-            # Default: L/min
-            return rate_lpm
+        if self.platform is not None and not self.platform.available:
+            return "Platform Unavailable"
 
-    def _get_status_text(self):
-        """Determine the current operational status text."""
-        if self.calibrating:
-            cal_pulses = self.pulse_count - self.calibration_start_pulses
+        if self.calibrating and index == self.calibration_channel:
+            cal_pulses = self.engines[index].pulse_count - self.calibration_start_pulses
             return f"Calibrating... ({cal_pulses} pulses)"
 
-        if self.flow_rate > 0.01:
+        if self.batch is not None and self.batch.active and index == self.batch_channel:
+            dispensed = self.batch.dispensed(self.engines[index].total_volume)
+            return f"Batch {self.batch.state} ({dispensed:.2f} / {self.batch.target:.2f} L)"
+
+        if self.scheduler is not None and self.scheduler.sampling_limited:
+            return "Sampling Limited"
+
+        if self.engines[index].flow_rate > 0.01:
             return "Running"
         else:
             return "No Flow"
 
-    async def _check_warnings(self, display_flow_rate):
-        """Check flow rate against warning thresholds and update indicators."""
-        low_threshold = self.config.low_flow_threshold.value
-        high_threshold = self.config.high_flow_threshold.value
-
-        # Low flow warning
-        if low_threshold > 0 and display_flow_rate > 0 and display_flow_rate < low_threshold:
-            self.ui.low_flow_warning.hidden = False
-            await self._send_alert_once(
-                "low_flow",
-                f"Low flow detected: {display_flow_rate:.2f} {self.config.flow_rate_unit.value}",
+    def _build_alert_engine(self):
+        """Compile every channel's alert rules into one evaluation table, in L/min."""
+        settings = self.settings
+        on_delay = settings.alert_on_delay
+        off_delay = settings.alert_off_delay
+        cooldown = settings.alert_cooldown
+
+        rules = []
+        for channel in self.channels:
+            prefix = f"{channel.name}: " if channel.key else ""
+            rules.extend(
+                threshold_rules(
+                    channel.index,
+                    settings.low_flow_lpm[channel.index],
+                    settings.high_flow_lpm[channel.index],
+                    settings.alert_hysteresis,
+                    on_delay,
+                    off_delay,
+                    cooldown,
+                    prefix,
+                )
             )
-        else:
-            self.ui.low_flow_warning.hidden = True
-            self._clear_alert("low_flow")
-
-        # High flow warning
-        if high_threshold > 0 and display_flow_rate > high_threshold:
-            self.ui.high_flow_warning.hidden = False
-            await self._send_alert_once(
-                "high_flow",
-                f"High flow detected: {display_flow_rate:.2f} {self.config.flow_rate_unit.value}",
+            rules.extend(
+                duration_rules(
+                    channel.index,
+                    settings.continuous_flow_alert_hours,
+                    settings.no_flow_alert_hours,
+                    off_delay,
+                    cooldown,
+                    prefix,
+                )
             )
-        else:
-            self.ui.high_flow_warning.hidden = True
-            self._clear_alert("high_flow")
+        return AlertEngine(rules)
 
-    async def _send_alert_once(self, alert_id, message):
-        """Send an alert only once until cleared."""
-        if alert_id in self.active_alerts:
+    def _check_warnings(self, channel, now, flow_rate):
+        """Evaluate a channel's alert rules against its L/min flow rate and update its warning indicators on changes."""
+        settings = self.settings
+        changes = self.alert_engine.evaluate(
+            channel.index, now, flow_rate, settings.flow_rate_unit, settings.flow_rate_factor
+        )
+        if not changes:
             return
-        await self.ui.notifications.send_alert(message)
-        self.active_alerts.add(alert_id)
 
-    def _clear_alert(self, alert_id):
-        """Clear an alert so it can fire again."""
-        self.active_alerts.discard(alert_id)
+        meter_ui = self.ui.meters[channel.index]
+        for kind, active, message in changes:
+            if kind == RULE_LOW_FLOW:
+                meter_ui.low_flow_warning.hidden = not active
+            elif kind == RULE_HIGH_FLOW:
+                meter_ui.high_flow_warning.hidden = not active
+            if message is not None:
+                self.alerts.send(message)
+            log.info("%s alert %s on %r", kind, "raised" if active else "cleared", channel.name)
+
+    async def _deliver_alert(self, message):
+        await self.ui.notifications.send_alert(message)
 
-    async def _persist_state(self, now):
-        """Periodically save state to tags for persistence across restarts."""
+    def _persist_state(self, now):
+        """Periodically queue state tags for persistence across restarts."""
         if (now - self.last_tag_save_time) >= self.TAG_SAVE_INTERVAL:
-            await self.set_tag("total_volume", round(self.total_volume, 4))
-            await self.set_tag("pulse_count", self.pulse_count)
-            await self.set_tag("status", self._get_status_text())
-            await self.set_tag("flow_rate", round(self.flow_rate, 4))
+            # Snapshot writer stats before this cycle's writes are queued
+            diagnostics = {**self.tag_writer.stats(), **self.alerts.stats(), **self.scheduler.stats()}
+            diagnostics.update(self.history_uploader.stats())
+            diagnostics.update(self.acquisition.stats())
+            diagnostics.update(self.platform.stats())
+            diagnostics["missed_ticks"] = self.missed_ticks
+            diagnostics["active_alerts"] = self.alert_engine.active_alerts()
+            diagnostics["alerts_suppressed"] = self.alert_engine.suppressed
+            if self.debounce_tuners is not None:
+                diagnostics["debounce"] = {
+                    channel.key or "meter": tuner.stats() for channel, tuner in zip(self.channels, self.debounce_tuners)
+                }
+            if self.metrics is not None:
+                diagnostics.update(self.metrics.stats())
+            if self.journal is not None:
+                diagnostics["journal_sync_latency_ms"] = round(self.journal.last_sync_latency * 1000.0, 1)
+            write = self.tag_writer.write
+            for channel in self.channels:
+                index = channel.index
+                write(channel.tag("total_volume"), round(self.engines[index].total_volume, 4))
+                write(channel.tag("pulse_count"), self.engines[index].pulse_count)
+                write(channel.tag("status"), self._get_status_text(index))
+                write(channel.tag("flow_rate"), round(self.engines[index].flow_rate, 4))
+                for tag_name, window_s in self.AVERAGE_WINDOWS.items():
+                    write(channel.tag(tag_name), round(self.engines[index].average_rate(window_s), 4))
+            write("diagnostics", diagnostics)
             self.last_tag_save_time = now
             log.debug(
-                "Persisted state: volume=%.2f, pulses=%d",
-                self.total_volume,
-                self.pulse_count,
+                "Persisted state: volume=%s, pulses=%s",
+                [e.total_volume for e in self.engines],
+                [e.pulse_count for e in self.engines],
             )
 
     # ---- UI Callbacks ----
@@ -249,37 +886,61 @@ class FlowPulseCounterApplication(Application):
     async def on_reset_totals(self, new_value):
         """Reset accumulated totals when user presses the reset button."""
         log.info("Resetting totals")
-        self.pulse_count = 0
-        self.total_volume = 0.0
-        self.pulse_history.clear()
-        self.flow_rate = 0.0
+        for channel in self.channels:
+            self.engines[channel.index].reset()
 
-        # Persist immediately
-        await self.set_tag("total_volume", 0.0)
-        await self.set_tag("pulse_count", 0)
+            if self.journal is not None:
+                self.journal.update(channel.index, 0, 0.0)
+            self.tag_writer.write(channel.tag("total_volume"), 0.0)
+            self.tag_writer.write(channel.tag("pulse_count"), 0)
 
-        self.ui.update_readings(0.0, 0.0, 0, "Totals Reset")
+            self.ui.update_readings(
+                0.0,
+                0.0,
+                0,
+                "Totals Reset",
+                unit=self.settings.flow_rate_unit,
+                channel=channel.index,
+            )
+        # Persist immediately rather than waiting for the batch delay
+        self.tag_writer.request_flush()
+        self.change_filter.invalidate()
         self.ui.reset_totals.coerce(None)
 
+    @ui.callback("calibration_meter")
+    async def on_calibration_meter_change(self, new_value):
+        """Select which meter the calibration controls apply to."""
+        for channel in self.channels:
+            if channel.key == new_value:
+                self.calibration_channel = channel.index
+                self.ui.calibration_factor.coerce(self.engines[channel.index].pulses_per_litre)
+                log.info("Calibration meter set to %r", channel.name)
+                return
+
     @ui.callback("calibrate")
     async def on_calibrate(self, new_value):
         """Start calibration mode."""
         log.info("Starting calibration mode")
         self.calibrating = True
-        self.calibration_start_pulses = self.pulse_count
+        self.calibration_start_pulses = self.engines[self.calibration_channel].pulse_count
+        self.calibration_start_time = time.time()
 
         # Show stop button, hide start button
         self.ui.stop_calibration.hidden = False
         self.ui.calibrate.hidden = True
 
-        self.ui.status.update("Calibrating... (0 pulses)")
+        self.ui.meters[self.calibration_channel].status.update("Calibrating... (0 pulses)")
         self.ui.calibrate.coerce(None)
 
     @ui.callback("stop_calibration")
     async def on_stop_calibration(self, new_value):
         """Stop calibration and compute new calibration factor."""
         log.info("Stopping calibration")
-        calibration_pulses = self.pulse_count - self.calibration_start_pulses
+        index = self.calibration_channel
+        status = self.ui.meters[index].status
+        engine = self.engines[index]
+        calibration_pulses = engine.pulse_count - self.calibration_start_pulses
+        elapsed = time.time() - self.calibration_start_time
         self.calibrating = False
 
         # Hide stop button, show start button
@@ -290,20 +951,25 @@ class FlowPulseCounterApplication(Application):
         known_volume = self.ui.known_volume.current_value
 
         if known_volume and known_volume > 0 and calibration_pulses > 0:
-            new_factor = calibration_pulses / known_volume
-            self.pulses_per_litre = new_factor
-            self.ui.calibration_factor.update(new_factor)
-            self.ui.status.update(
-                f"Calibration complete: {new_factor:.1f} pulses/L ({calibration_pulses} pulses / {known_volume:.2f} L)"
-            )
-            log.info(
-                "Calibration result: %d pulses / %.2f L = %.1f pulses/L",
-                calibration_pulses,
-                known_volume,
-                new_factor,
-            )
+            if self.calibration_mode == CALIBRATION_ADD_POINT:
+                self._add_k_factor_point(index, calibration_pulses, known_volume, elapsed)
+            else:
+                new_factor = calibration_pulses / known_volume
+                engine.pulses_per_litre = new_factor
+                # A single factor run replaces any K-factor table
+                engine.k_factor = None
+                self.ui.calibration_factor.coerce(new_factor)
+                status.update(
+                    f"Calibration complete: {new_factor:.1f} pulses/L ({calibration_pulses} pulses / {known_volume:.2f} L)"
+                )
+                log.info(
+                    "Calibration result: %d pulses / %.2f L = %.1f pulses/L",
+                    calibration_pulses,
+                    known_volume,
+                    new_factor,
+                )
         else:
-            self.ui.status.update(
+            status.update(
                 f"Calibration ended: {calibration_pulses} pulses counted. Set 'Known Volume' and retry to compute factor."
             )
             log.warning(
@@ -314,9 +980,80 @@ class FlowPulseCounterApplication(Application):
 
         self.ui.stop_calibration.coerce(None)
 
+    def _add_k_factor_point(self, index, calibration_pulses, known_volume, elapsed):
+        """Add a calibration run to a channel's K-factor table, at the run's average pulse frequency."""
+        engine = self.engines[index]
+        new_factor = calibration_pulses / known_volume
+        point_hz = calibration_pulses / elapsed if elapsed > 0 else 0.0
+        if engine.k_factor is None:
+            engine.k_factor = KFactorTable([(point_hz, new_factor)])
+        else:
+            engine.k_factor = engine.k_factor.with_point(point_hz, new_factor)
+
+        self.ui.meters[index].status.update(f"K-factor point added: {new_factor:.1f} pulses/L at {point_hz:.2f} Hz")
+        # Calibration isn't persisted, so log the table in the form the K Factor Points setting takes
+        log.info(
+            "Calibration point: %d pulses / %.2f L = %.1f pulses/L at %.2f Hz. K Factor Points: %s",
+            calibration_pulses,
+            known_volume,
+            new_factor,
+            point_hz,
+            format_k_factor_points(engine.k_factor.points),
+        )
+
+    @ui.callback("calibration_mode")
+    async def on_calibration_mode_change(self, new_value):
+        """Choose whether calibration runs set the single factor or add K-factor points."""
+        if new_value in (CALIBRATION_SINGLE, CALIBRATION_ADD_POINT):
+            self.calibration_mode = new_value
+            log.info("Calibration mode set to %r", new_value)
+
+    @ui.callback("run_profiler")
+    async def on_run_profiler(self, new_value):
+        """Profile the next loop iterations and trace memory allocations for a while."""
+        log.info("Profiling requested from the UI")
+        self._start_profiling(
+            {PROFILE_CPROFILE: DEFAULT_PROFILE_ITERATIONS, PROFILE_TRACEMALLOC: DEFAULT_TRACEMALLOC_SECONDS}
+        )
+        self.ui.run_profiler.coerce(None)
+
+    @ui.callback("start_batch")
+    async def on_start_batch(self, new_value):
+        """Start filling a batch of the target volume."""
+        self.ui.start_batch.coerce(None)
+        if self.batch is None or self.batch.active:
+            return
+        target = self.ui.batch_target.current_value
+        if not target or target <= 0:
+            self.ui.meters[self.batch_channel].status.update("Set 'Batch Target' to start a batch")
+            return
+
+        volume = self.engines[self.batch_channel].total_volume
+        self.batch.start(target, volume, time.time())
+        self.batch_last_volume = volume
+        if not await self._set_batch_output(True):
+            self.batch.stop(volume, 0.0, time.time(), manual=True)
+            return
+        log.info("Batch started: %.3f L, latency estimate %.2f s", target, self.batch.latency_s)
+        self.ui.start_batch.hidden = True
+        self.ui.stop_batch.hidden = False
+        self.ui.batch_volume.update(0.0)
+
+    @ui.callback("stop_batch")
+    async def on_stop_batch(self, new_value):
+        """Stop a batch early. Stopped batches don't update the latency estimate."""
+        self.ui.stop_batch.coerce(None)
+        if self.batch is None or not self.batch.running:
+            return
+        log.info("Batch stopped by the user")
+        self.batch.stop(self.engines[self.batch_channel].total_volume, 0.0, time.time(), manual=True)
+        await self._set_batch_output(False)
+
     @ui.callback("calibration_factor")
     async def on_calibration_factor_change(self, new_value):
         """Update the active calibration factor when user changes it via UI."""
         if new_value is not None and new_value > 0:
-            self.pulses_per_litre = new_value
+            engine = self.engines[self.calibration_channel]
+            engine.pulses_per_litre = new_value
+            engine.k_factor = None
             log.info("Calibration factor updated via UI: %.1f pulses/L", new_value)
@@ -0,0 +1,146 @@
+import logging
+import re
+
+from pydoover import config
+
+from .kfactor import parse_k_factor_points
+
+log = logging.getLogger(__name__)
+
+
+def _element_value(element, default=None):
+    """Read a config element, falling back to its default when it was left out of the config.
+
+    A required element that was left out has no default either, and reads as `default`.
+    """
+    try:
+        value = element.value
+    except ValueError:
+        value = element.default
+    return default if value is None or value is config.NotSet else value
+
+
+def _slugify(name):
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def _k_factor_points(text, name):
+    try:
+        return parse_k_factor_points(text)
+    except ValueError as e:
+        log.error("Ignoring K factor points for %r: %s", name, e)
+        return []
+
+
+class MeterChannel:
+    """Static settings for one pulse input.
+
+    The channel `key` namespaces the channel's UI elements and tags. A single
+    meter configured through the top-level settings has an empty key so its
+    names match earlier releases (`flow_rate`, `total_volume`, ...).
+    """
+
+    __slots__ = (
+        "index",
+        "key",
+        "name",
+        "pin",
+        "pulses_per_litre",
+        "k_factor_points",
+        "debounce_s",
+        "low_flow_threshold",
+        "high_flow_threshold",
+    )
+
+    def __init__(
+        self,
+        index,
+        key,
+        name,
+        pin,
+        pulses_per_litre=450.0,
+        debounce_ms=50,
+        low_flow_threshold=0.0,
+        high_flow_threshold=0.0,
+        k_factor_points=(),
+    ):
+        self.index = index
+        self.key = key
+        self.name = name
+        self.pin = pin
+        self.pulses_per_litre = float(pulses_per_litre)
+        self.debounce_s = debounce_ms / 1000.0
+        self.low_flow_threshold = float(low_flow_threshold)
+        self.high_flow_threshold = float(high_flow_threshold)
+        # (Hz, pulses/L) calibration points, empty for a single factor
+        self.k_factor_points = list(k_factor_points)
+
+    def __eq__(self, other):
+        if not isinstance(other, MeterChannel):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def tag(self, name):
+        """Return the channel-qualified name for a tag or UI element."""
+        return f"{self.key}_{name}" if self.key else name
+
+
+def build_channels(config):
+    """Build the list of meter channels from the app config.
+
+    If no meters are configured, the top-level input settings describe a
+    single meter. A meter without an input pin, or on a pin an earlier meter
+    already uses, is skipped with an error rather than counting nothing or
+    counting the same pulses twice.
+    """
+    meters = config.meters.elements
+    if not meters:
+        return [
+            MeterChannel(
+                0,
+                "",
+                config.app_display_name.value,
+                config.input_pin.value,
+                pulses_per_litre=config.pulses_per_litre.value,
+                debounce_ms=config.debounce_ms.value,
+                low_flow_threshold=config.low_flow_threshold.value,
+                high_flow_threshold=config.high_flow_threshold.value,
+                k_factor_points=_k_factor_points(config.k_factor_points.value, config.app_display_name.value),
+            )
+        ]
+
+    channels = []
+    used_keys = set()
+    used_pins = {}
+    for index, meter in enumerate(meters):
+        name = _element_value(meter.meter_name) or f"Meter {index + 1}"
+        pin = _element_value(meter.input_pin)
+        if pin is None:
+            log.error("Skipping meter %r: no input pin is configured", name)
+            continue
+        if pin in used_pins:
+            log.error("Skipping meter %r: input pin %s is already used by %r", name, pin, used_pins[pin])
+            continue
+        used_pins[pin] = name
+
+        key = _slugify(name) or f"meter_{index + 1}"
+        if key in used_keys:
+            key = f"{key}_{index + 1}"
+        used_keys.add(key)
+
+        channels.append(
+            MeterChannel(
+                len(channels),
+                key,
+                name,
+                pin,
+                pulses_per_litre=_element_value(meter.pulses_per_litre),
+                debounce_ms=_element_value(meter.debounce_ms),
+                low_flow_threshold=_element_value(meter.low_flow_threshold),
+                high_flow_threshold=_element_value(meter.high_flow_threshold),
+                k_factor_points=_k_factor_points(_element_value(meter.k_factor_points), name),
+            )
+        )
+    return channels
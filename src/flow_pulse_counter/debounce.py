@@ -0,0 +1,193 @@
+import math
+from array import array
+from bisect import bisect_left
+
+# Log-spaced bucket bounds in seconds, four per octave from 50 us to about 13 s,
+# plus an overflow bucket
+EDGE_BUCKETS = tuple(50e-6 * 2.0 ** (i / 4.0) for i in range(73))
+
+# A rising edge within this fraction of the pulse period after a pulse is taken as bounce
+BOUNCE_FRACTION = 0.5
+# A burst of more bounce edges than this is the pulse rate changing instead
+MAX_BURST = 8
+# Below this fraction of intervals an input is treated as bounce-free
+MIN_BOUNCE_RATE = 0.005
+
+
+def _bucket(seconds):
+    return bisect_left(EDGE_BUCKETS, seconds)
+
+
+def quantile(counts, q):
+    """Bound of the bucket holding the `q` quantile of a histogram.
+
+    The upper bound for high quantiles and the lower bound for low ones, so
+    either errs towards the tail.
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    seen = 0
+    for i, n in enumerate(counts):
+        seen += n
+        if n and seen >= q * total:
+            if q < 0.5:
+                return EDGE_BUCKETS[i - 1] if i > 0 else 0.0
+            return EDGE_BUCKETS[min(i, len(EDGE_BUCKETS) - 1)]
+    return EDGE_BUCKETS[-1]
+
+
+class EdgeStatistics:
+    """Streaming histograms of one input's raw edges, before any debounce.
+
+    Rising edges are split into pulses and bounce. Bounce comes in bursts
+    right after a pulse, much sooner than the pulse period, followed by a
+    quiet gap until the next pulse. Edges within `BOUNCE_FRACTION` of the
+    last pulse period after the last pulse are held as a possible burst.
+    When the next pulse arrives, they are counted as bounce if the burst
+    took less than `BOUNCE_FRACTION` of the time since the pulse before.
+    Otherwise, or past `MAX_BURST` edges, the pulse rate went up instead,
+    and they are dropped.
+
+    `periods` holds the time between pulses and `bounces` the time from a
+    pulse to each of its bounce edges; the widths of the high and low half
+    of each pulse are kept too. Every histogram has the same fixed
+    log-spaced buckets, so memory doesn't grow with the number of edges,
+    and observing an edge is a bisect and an array increment.
+    """
+
+    __slots__ = (
+        "periods",
+        "bounces",
+        "high_widths",
+        "low_widths",
+        "last_rise",
+        "last_fall",
+        "pulse_start",
+        "period",
+        "burst",
+        "pending",
+    )
+
+    def __init__(self):
+        size = len(EDGE_BUCKETS) + 1
+        self.periods = array("q", bytes(8 * size))
+        self.bounces = array("q", bytes(8 * size))
+        self.high_widths = array("q", bytes(8 * size))
+        self.low_widths = array("q", bytes(8 * size))
+        self.last_rise = None
+        self.last_fall = None
+        # The latest pulse and period, and the buckets of the bounce edges seen since
+        self.pulse_start = 0.0
+        self.period = 0.0
+        self.burst = 0
+        self.pending = array("q", bytes(8 * MAX_BURST))
+
+    @property
+    def edges(self):
+        return sum(self.periods) + sum(self.bounces)
+
+    def rise(self, t):
+        """Record a rising edge at `t`."""
+        last_rise = self.last_rise
+        if last_rise is not None:
+            since = t - self.pulse_start
+            burst = self.burst
+            if since < self.period * BOUNCE_FRACTION and burst < MAX_BURST:
+                self.pending[burst] = _bucket(since)
+                self.burst = burst + 1
+            else:
+                if burst and burst < MAX_BURST and last_rise - self.pulse_start < since * BOUNCE_FRACTION:
+                    for i in range(burst):
+                        self.bounces[self.pending[i]] += 1
+                elif burst:
+                    # The pulse rate went up, the period is the latest interval
+                    since = t - last_rise
+                self.periods[_bucket(since)] += 1
+                self.period = since
+                self.pulse_start = t
+                self.burst = 0
+            last_fall = self.last_fall
+            if last_fall is not None and last_fall >= last_rise:
+                self.low_widths[_bucket(t - last_fall)] += 1
+        else:
+            self.pulse_start = t
+        self.last_rise = t
+
+    def fall(self, t):
+        """Record a falling edge at `t`."""
+        if self.last_rise is not None:
+            self.high_widths[_bucket(t - self.last_rise)] += 1
+        self.last_fall = t
+
+    def decay(self):
+        """Halve every count, so older edges weigh less than recent ones."""
+        for histogram in (self.periods, self.bounces, self.high_widths, self.low_widths):
+            for i, n in enumerate(histogram):
+                histogram[i] = n >> 1
+
+
+class DebounceTuner:
+    """Choose an input's debounce from the statistics of its raw edges.
+
+    With bounce seen, the debounce is set `margin` times above the time the
+    bounce lasts after a pulse (its 99th percentile), but never past the middle
+    (geometric) of the gap up to the shortest pulse period, so the fastest
+    real pulses still count. An input without bounce gets the shortest
+    debounce, `min_s`, leaving the most headroom for fast meters.
+
+    Nothing changes until `min_edges` edges have been seen. Once the
+    histograms hold `max_edges`, their counts are halved, so the tuning
+    follows a meter whose bounce or flow range changes.
+    """
+
+    def __init__(self, initial_s, min_s=0.0002, max_s=0.1, margin=2.0, min_edges=200, max_edges=20000):
+        self.debounce_s = initial_s
+        self.min_s = min_s
+        self.max_s = max_s
+        self.margin = margin
+        self.min_edges = min_edges
+        self.max_edges = max_edges
+        self.edges = EdgeStatistics()
+
+        self.bounce_rate = 0.0
+        self.bounce_s = 0.0
+        self.shortest_period_s = 0.0
+
+    @property
+    def max_frequency_hz(self):
+        """Fastest pulse rate the debounce lets through, or None without a debounce."""
+        return 1.0 / self.debounce_s if self.debounce_s > 0 else None
+
+    def tune(self):
+        """Update the debounce from the edges seen so far, returning it."""
+        edges = self.edges
+        periods = sum(edges.periods)
+        bounces = sum(edges.bounces)
+        if periods + bounces >= self.min_edges and periods:
+            self.bounce_rate = bounces / (periods + bounces)
+            self.shortest_period_s = quantile(edges.periods, 0.01)
+            if self.bounce_rate >= MIN_BOUNCE_RATE:
+                self.bounce_s = quantile(edges.bounces, 0.99)
+                debounce = min(self.bounce_s * self.margin, math.sqrt(self.bounce_s * self.shortest_period_s))
+            else:
+                self.bounce_s = 0.0
+                debounce = self.min_s
+            self.debounce_s = min(max(debounce, self.min_s), self.max_s)
+
+        if periods + bounces >= self.max_edges:
+            edges.decay()
+        return self.debounce_s
+
+    def stats(self):
+        edges = self.edges
+        max_frequency = self.max_frequency_hz
+        return {
+            "debounce_ms": round(self.debounce_s * 1000.0, 3),
+            "bounce_rate": round(self.bounce_rate, 4),
+            "max_frequency_hz": round(max_frequency, 1) if max_frequency is not None else None,
+            "bounce_ms": round(self.bounce_s * 1000.0, 3),
+            "shortest_period_ms": round(self.shortest_period_s * 1000.0, 3),
+            "high_width_p50_ms": round(quantile(edges.high_widths, 0.5) * 1000.0, 3),
+            "low_width_p50_ms": round(quantile(edges.low_widths, 0.5) * 1000.0, 3),
+        }
@@ -0,0 +1,141 @@
+BATCH_IDLE = "Idle"
+BATCH_RUNNING = "Running"
+BATCH_SETTLING = "Settling"
+
+# Returned by BatchController.update
+ACTION_STOP = "stop"
+ACTION_DONE = "done"
+
+
+class BatchController:
+    """Dispense a target volume, shutting the output off ahead of the target.
+
+    Liquid keeps flowing after the output is de-energised, for as long as
+    the pump or valve takes to stop, so the output is shut off once the
+    volume dispensed plus the flow rate times `latency_s` reaches the
+    target. Half an acquisition period is added to that horizon, since the
+    next check comes a period later; on average that stops as close to the
+    target as the check rate allows.
+
+    After the shut-off the batch settles until no volume has been added for
+    `settle_s` seconds, and its overshoot is recorded. The overshoot divided
+    by the flow rate at the shut-off is how much earlier (or later) the
+    output should have been shut off, and a share of it is added to
+    `latency_s`, so each batch stops closer to the target than the last.
+    Learning from the overshoot rather than the run-on alone also corrects
+    for a flow rate that reads high or low. Batches stopped by hand don't
+    update the estimate.
+
+    Framework-free: the app feeds it the meter's total volume and flow rate
+    on every acquisition read and switches the output on its actions.
+    """
+
+    # Weight of the latest batch in the latency estimate
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, latency_s=0.5, settle_s=5.0, max_latency_s=30.0):
+        self.latency_s = latency_s
+        self.settle_s = settle_s
+        self.max_latency_s = max_latency_s
+
+        self.state = BATCH_IDLE
+        self.target = 0.0
+        self.start_volume = 0.0
+        self.stop_rate = 0.0
+        self.last_volume = 0.0
+        self.last_change = 0.0
+        self.manual_stop = False
+
+        self.batches = 0
+        self.last_dispensed = 0.0
+        self.last_overshoot = 0.0
+        self.overshoot_sum = 0.0
+        self.abs_overshoot_sum = 0.0
+
+    @property
+    def running(self):
+        return self.state == BATCH_RUNNING
+
+    @property
+    def active(self):
+        return self.state != BATCH_IDLE
+
+    def dispensed(self, volume):
+        """Volume dispensed so far in this batch, given the meter's total volume."""
+        return volume - self.start_volume
+
+    def start(self, target, volume, now):
+        """Start a batch of `target` litres from the meter's current total volume."""
+        if target <= 0:
+            raise ValueError("Batch target must be greater than zero")
+        self.state = BATCH_RUNNING
+        self.target = target
+        self.start_volume = self.last_volume = volume
+        self.last_change = now
+        self.manual_stop = False
+
+    def stop(self, volume, rate_lps, now, manual=False):
+        """Record the shut-off and start settling."""
+        self.state = BATCH_SETTLING
+        self.stop_rate = rate_lps
+        self.last_volume = volume
+        self.last_change = now
+        self.manual_stop = manual
+
+    def update(self, now, volume, rate_lps, period_s=0.0):
+        """Check the batch against the latest total volume (L) and flow rate (L/s).
+
+        Returns ACTION_STOP when the output should be shut off now,
+        ACTION_DONE when a batch has finished settling, otherwise None.
+        """
+        if self.state == BATCH_RUNNING:
+            predicted = self.dispensed(volume) + rate_lps * (self.latency_s + period_s / 2.0)
+            if predicted >= self.target:
+                self.stop(volume, rate_lps, now)
+                return ACTION_STOP
+        elif self.state == BATCH_SETTLING:
+            if volume != self.last_volume:
+                self.last_volume = volume
+                self.last_change = now
+            elif now - self.last_change >= self.settle_s:
+                self._finish(volume)
+                return ACTION_DONE
+        return None
+
+    def _finish(self, volume):
+        self.state = BATCH_IDLE
+        if self.manual_stop:
+            return
+
+        dispensed = self.dispensed(volume)
+        overshoot = dispensed - self.target
+        self.batches += 1
+        self.last_dispensed = dispensed
+        self.last_overshoot = overshoot
+        self.overshoot_sum += overshoot
+        self.abs_overshoot_sum += abs(overshoot)
+
+        if self.stop_rate > 0:
+            self.latency_s += self.LATENCY_SMOOTHING * overshoot / self.stop_rate
+            self.latency_s = min(max(self.latency_s, 0.0), self.max_latency_s)
+
+    def stats(self):
+        batches = self.batches or 1
+        return {
+            "batches": self.batches,
+            "last_target": round(self.target, 4),
+            "last_dispensed": round(self.last_dispensed, 4),
+            "last_overshoot": round(self.last_overshoot, 4),
+            "mean_overshoot": round(self.overshoot_sum / batches, 4),
+            "mean_abs_overshoot": round(self.abs_overshoot_sum / batches, 4),
+            "latency_s": round(self.latency_s, 3),
+        }
+
+    def restore(self, stats):
+        """Carry on from `stats()` saved by an earlier run."""
+        self.batches = int(stats.get("batches", 0))
+        self.last_dispensed = float(stats.get("last_dispensed", 0.0))
+        self.last_overshoot = float(stats.get("last_overshoot", 0.0))
+        self.overshoot_sum = float(stats.get("mean_overshoot", 0.0)) * self.batches
+        self.abs_overshoot_sum = float(stats.get("mean_abs_overshoot", 0.0)) * self.batches
+        self.latency_s = min(max(float(stats.get("latency_s", self.latency_s)), 0.0), self.max_latency_s)
@@ -0,0 +1,416 @@
+import math
+from collections import namedtuple
+
+from .period_estimator import PeriodEstimator
+from .rate_window import RateWindow
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for feed_batch
+    np = None
+
+FLOW_RATE_UNITS = ["L/min", "L/hr", "m3/hr"]
+
+# Sentinel for an input whose previous level has not been seen yet
+_UNKNOWN_LEVEL = 2
+
+BatchResult = namedtuple("BatchResult", ["counts", "volumes", "flow_rates"])
+
+
+# Multiplier from L/min to each display unit
+FLOW_RATE_FACTORS = {"L/min": 1.0, "L/hr": 60.0, "m3/hr": 60.0 * 0.001}
+
+
+def convert_flow_rate(rate_lpm, unit):
+    """Convert a flow rate from L/min to `unit`. Works on floats and arrays."""
+    # Unknown units are shown in L/min
+    return rate_lpm * FLOW_RATE_FACTORS.get(unit, 1.0)
+
+
+class PulseEngine:
+    """Pulse counting core for one meter, independent of the app framework.
+
+    Turns a digital input into a pulse count, a total volume and a flow rate:
+    rising edge detection with debounce, volume accumulation, a rolling
+    counting window and the inter-pulse period estimator at low flow.
+
+    Samples are fed one at a time with `feed()`, or pre-counted pulses (e.g.
+    from a hardware counter) with `add_pulses()` followed by `update()`.
+    `feed_batch()` processes whole arrays of samples with NumPy and gives the
+    same results, bit for bit, as calling `feed()` for each sample.
+
+    The calibration is either a single `pulses_per_litre` or a `k_factor`
+    table giving pulses per litre by pulse frequency. Pulses are added to
+    the volume at the factor of the latest flow rate. They are counted in
+    segments of one factor each and a segment is only divided into litres
+    when the factor changes, so the volume carries no per-pulse rounding
+    and pulses counted before a calibration change keep their old factor.
+
+    Each meter gets its own engine, with its totals held as slots and its
+    rate history in the `RateWindow`'s flat arrays. Keeping the totals in
+    one array per field across meters would save little memory at the
+    channel counts an app serves, and would tie an engine used on its own,
+    as replay and offline analysis do, to a bank of other channels.
+    """
+
+    __slots__ = (
+        "pulses_per_litre",
+        "k_factor",
+        "debounce_s",
+        "window_s",
+        "period_max_pulses",
+        "window",
+        "periods",
+        "pulse_count",
+        "flow_rate",
+        "pulse_hz",
+        "_closed_volume",
+        "_segment_pulses",
+        "_segment_factor",
+        "prev_level",
+        "last_edge_time",
+    )
+
+    def __init__(
+        self,
+        pulses_per_litre=450.0,
+        debounce_s=0.05,
+        window_s=10.0,
+        max_window_s=None,
+        bucket_s=1.0,
+        no_flow_periods=3.0,
+        period_max_pulses=20,
+        k_factor=None,
+    ):
+        self.pulses_per_litre = pulses_per_litre
+        self.k_factor = k_factor
+        self.debounce_s = debounce_s
+        self.window_s = window_s
+        self.period_max_pulses = period_max_pulses
+
+        self.window = RateWindow(max(window_s, max_window_s or 0), bucket_s=bucket_s)
+        self.periods = PeriodEstimator(no_flow_periods, max_period_s=window_s)
+
+        self.pulse_count = 0
+        self.flow_rate = 0.0
+        # Pulse frequency behind the latest flow rate
+        self.pulse_hz = 0.0
+
+        # Volume of closed segments, and the pulses of the open one at `_segment_factor`
+        self._closed_volume = 0.0
+        self._segment_pulses = 0
+        self._segment_factor = pulses_per_litre
+
+        self.prev_level = _UNKNOWN_LEVEL
+        self.last_edge_time = 0.0
+
+    @property
+    def total_volume(self):
+        if self._segment_factor > 0:
+            return self._closed_volume + self._segment_pulses / self._segment_factor
+        return self._closed_volume
+
+    @total_volume.setter
+    def total_volume(self, volume):
+        self._closed_volume = volume
+        self._segment_pulses = 0
+
+    def factor(self, pulses_per_second):
+        """Pulses per litre at a pulse frequency."""
+        if self.k_factor is not None:
+            return self.k_factor.factor(pulses_per_second)
+        return self.pulses_per_litre
+
+    def _close_segment(self, factor):
+        if self._segment_factor > 0:
+            self._closed_volume += self._segment_pulses / self._segment_factor
+        self._segment_pulses = 0
+        self._segment_factor = factor
+
+    def set_window(self, window_s, no_flow_periods, bucket_s=None):
+        """Change the counting window and no-flow timeout, keeping the totals.
+
+        The rate history is kept too, unless the window has to grow past
+        what it holds or change its bucket width.
+        """
+        self.window_s = window_s
+        self.periods.no_flow_periods = no_flow_periods
+        self.periods.max_period_s = window_s
+        if bucket_s is None:
+            bucket_s = self.window.bucket_s
+        if window_s > self.window.max_window_s or bucket_s != self.window.bucket_s:
+            self.window = RateWindow(max(window_s, self.window.max_window_s), bucket_s=bucket_s)
+
+    def reset(self):
+        """Zero the totals and forget the rate history."""
+        self.pulse_count = 0
+        self.total_volume = 0.0
+        self.flow_rate = 0.0
+        self.pulse_hz = 0.0
+        self.window.clear()
+        self.periods.clear()
+
+    def feed(self, timestamp, level):
+        """Process one input sample. Returns the number of pulses counted (0 or 1)."""
+        pulses = 0
+        if level and self.prev_level == 0:
+            # Rising edge detected, only count it once the debounce has elapsed
+            if (timestamp - self.last_edge_time) >= self.debounce_s:
+                pulses = 1
+                self.add_pulses(pulses, timestamp)
+        self.prev_level = 1 if level else 0
+        self.update(timestamp)
+        return pulses
+
+    def add_pulses(self, pulses, edge_time):
+        """Count pulses detected elsewhere, the latest of which arrived at `edge_time`."""
+        self.pulse_count += pulses
+        factor = self.factor(self.pulse_hz)
+        if factor != self._segment_factor:
+            self._close_segment(factor)
+        self._segment_pulses += pulses
+        self.last_edge_time = edge_time
+        self.periods.record(edge_time, pulses)
+
+    def update(self, now):
+        """Record the count at `now` and recalculate the flow rate in L/min."""
+        self.window.record(now, self.pulse_count)
+        self.pulse_hz = self.pulse_frequency(now)
+        self.flow_rate = self._to_flow_rate(self.pulse_hz)
+        return self.flow_rate
+
+    def pulse_frequency(self, now):
+        """Current pulses per second, from the counting window or pulse periods."""
+        return self.periods.estimate(
+            now,
+            self.window.pulses_per_second(self.window_s),
+            self.window_s,
+            max_pulses=self.period_max_pulses,
+        )
+
+    def rate(self, now):
+        """Current flow rate in L/min."""
+        return self._to_flow_rate(self.pulse_frequency(now))
+
+    def average_rate(self, window_s):
+        """Average flow rate in L/min over the last `window_s` seconds of counting."""
+        return self._to_flow_rate(self.window.pulses_per_second(window_s))
+
+    def _to_flow_rate(self, pulses_per_second):
+        factor = self.factor(pulses_per_second)
+        if factor <= 0:
+            return 0.0
+        return (pulses_per_second / factor) * 60.0
+
+    def feed_batch(self, timestamps, levels):
+        """Process arrays of input samples in one pass.
+
+        Equivalent to calling `feed()` for each sample, and returns the
+        cumulative count, total volume and flow rate (L/min) after each one.
+        Timestamps must not go backwards. Requires numpy. With a `k_factor`
+        table the factor depends on the rate after each pulse, so the
+        samples are fed one at a time.
+        """
+        if np is None:
+            raise ImportError("PulseEngine.feed_batch requires numpy")
+        if self.k_factor is not None:
+            return self._feed_each(timestamps, levels)
+
+        t = np.asarray(timestamps, dtype=np.float64)
+        level = np.asarray(levels).astype(bool)
+        n = len(t)
+        if n == 0:
+            return BatchResult(np.empty(0, np.int64), np.empty(0), np.empty(0))
+        if np.any(np.diff(t) < 0):
+            raise ValueError("timestamps must not go backwards")
+
+        edges = self._batch_edges(t, level)
+        edge_times = t[edges]
+
+        increments = np.zeros(n, dtype=np.int64)
+        increments[edges] = 1
+        edges_so_far = np.cumsum(increments)
+        counts = self.pulse_count + edges_so_far
+
+        volumes = self._batch_volumes(edges_so_far, len(edge_times))
+
+        counted = self._batch_counted_rates(t, counts)
+        periods = self._batch_periods(edge_times)
+
+        # Period state seen by each sample: its latest edge, or the state before the batch
+        latest = edges_so_far - 1
+        has_edge = latest >= 0
+        latest = np.maximum(latest, 0)
+        prior_edge = np.nan if self.periods.last_edge is None else self.periods.last_edge
+        prior_period = np.nan if self.periods.period is None else self.periods.period
+        if len(edge_times):
+            last_edge = np.where(has_edge, edge_times[latest], prior_edge)
+            period = np.where(has_edge, periods[latest], prior_period)
+        else:
+            last_edge = np.full(n, prior_edge)
+            period = np.full(n, prior_period)
+
+        pulse_hz = self._batch_estimate(t, counted, last_edge, period)
+        if self.pulses_per_litre > 0:
+            flow_rates = (pulse_hz / self.pulses_per_litre) * 60.0
+        else:
+            flow_rates = np.zeros(n)
+
+        self._finish_batch(t, level, counts, pulse_hz, edge_times, periods, flow_rates)
+        return BatchResult(counts, volumes, flow_rates)
+
+    def _feed_each(self, timestamps, levels):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if np.any(np.diff(timestamps) < 0):
+            raise ValueError("timestamps must not go backwards")
+        n = len(timestamps)
+        counts = np.empty(n, np.int64)
+        volumes = np.empty(n)
+        flow_rates = np.empty(n)
+        for i, (t, level) in enumerate(zip(timestamps.tolist(), np.asarray(levels).astype(bool).tolist())):
+            self.feed(t, level)
+            counts[i], volumes[i], flow_rates[i] = self.pulse_count, self.total_volume, self.flow_rate
+        return BatchResult(counts, volumes, flow_rates)
+
+    def _batch_volumes(self, edges_so_far, edge_count):
+        """Total volume after each sample, computed as the scalar segments would."""
+        before = self.total_volume
+        if edge_count and self.pulses_per_litre != self._segment_factor:
+            self._close_segment(self.pulses_per_litre)
+        factor = self._segment_factor
+        if factor > 0:
+            volumes = self._closed_volume + (self._segment_pulses + edges_so_far) / factor
+        else:
+            volumes = np.full(len(edges_so_far), self._closed_volume)
+        # Samples before the first edge still see the segment that was open
+        volumes[edges_so_far == 0] = before
+        return volumes
+
+    def _batch_edges(self, t, level):
+        """Indices of samples where a debounced rising edge is counted."""
+        prev = np.empty(len(level), dtype=np.int8)
+        prev[0] = self.prev_level
+        prev[1:] = level[:-1]
+        candidates = np.flatnonzero(level & (prev == 0))
+        rising = t[candidates]
+
+        # An edge far enough after the previous rising edge is always counted.
+        # Closer ones depend on which earlier edges were counted, so walk them
+        # in order; these are bounces and noise, not the bulk of the samples.
+        gaps = np.diff(rising, prepend=self.last_edge_time)
+        accepted = gaps >= self.debounce_s
+        last = self.last_edge_time
+        prev_k = -2
+        for k in np.flatnonzero(~accepted).tolist():
+            if k != prev_k + 1:
+                # First of a run, the edge before it (if any) was counted
+                last = rising[k - 1] if k > 0 else self.last_edge_time
+            if rising[k] - last >= self.debounce_s:
+                accepted[k] = True
+                last = rising[k]
+            prev_k = k
+
+        return candidates[accepted]
+
+    def _batch_counted_rates(self, t, counts):
+        """Counting-window pulse rate after each sample, as RateWindow would give."""
+        window = self.window
+        buckets = np.floor_divide(t, window.bucket_s).astype(np.int64)
+
+        last_index, filled, held = window.state()
+        if last_index is None:
+            # The first sample also seeds the bucket before it
+            last_index = int(buckets[0]) - 1
+            held = [(last_index, int(counts[0]), float(t[0]))]
+        elif buckets[0] < last_index:
+            raise ValueError("timestamps must not go back before the previous samples")
+
+        held_buckets, held_counts, held_times = zip(*held)
+        all_buckets = np.concatenate((np.array(held_buckets, dtype=np.int64), buckets))
+        all_counts = np.concatenate((np.array(held_counts, dtype=np.int64), counts))
+        all_times = np.concatenate((np.array(held_times, dtype=np.float64), t))
+
+        filled = np.minimum(filled + (buckets - last_index), window.size - 1)
+        buckets_back = np.minimum(max(1, math.ceil(self.window_s / window.bucket_s)), filled)
+        oldest = np.searchsorted(all_buckets, buckets - buckets_back, side="right") - 1
+
+        elapsed = t - all_times[oldest]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = (counts - all_counts[oldest]) / elapsed
+        return np.where(elapsed > 0, rates, 0.0)
+
+    def _batch_periods(self, edge_times):
+        """Period recorded at each edge, NaN where the estimator would have none."""
+        m = len(edge_times)
+        periods = np.full(m, np.nan)
+        if m == 0:
+            return periods
+
+        est = PeriodEstimator(self.periods.no_flow_periods, self.periods.max_period_s)
+        est.period, est.last_edge = self.periods.period, self.periods.last_edge
+        est.record(float(edge_times[0]), 1)
+        valid = np.zeros(m, dtype=bool)
+        if est.period is not None:
+            periods[0] = est.period
+            valid[0] = True
+
+        if m > 1:
+            gaps = np.diff(edge_times)
+            candidate = np.concatenate(([periods[0]], gaps))
+            # A gap within the maximum is a period if the previous edge had no
+            # period, or if it is also within the no-flow timeout of that period
+            within_max = (gaps > 0) & (gaps <= est.max_period_s)
+            timeout = np.minimum(est.max_period_s, est.no_flow_periods * candidate[:-1])
+            within_timeout = gaps <= timeout
+            valid[1:] = within_max & within_timeout
+            # Where only the first holds, the result alternates with the previous edge
+            for k in (np.flatnonzero(within_max & ~within_timeout) + 1).tolist():
+                valid[k] = not valid[k - 1]
+            periods[1:] = np.where(valid[1:], gaps, np.nan)
+
+        return periods
+
+    def _batch_estimate(self, t, counted, last_edge, period):
+        """Pulses per second after each sample, as PulseEngine.pulse_frequency would give."""
+        no_period = np.isnan(period)
+        since_edge = t - last_edge
+        timeout = np.where(
+            no_period,
+            self.periods.max_period_s,
+            np.minimum(self.periods.max_period_s, self.periods.no_flow_periods * period),
+        )
+        timed_out = np.isnan(last_edge) | (since_edge > timeout)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            period_rate = 1.0 / np.maximum(period, since_edge)
+        use_period = ~no_period & (period_rate * self.window_s < self.period_max_pulses)
+
+        return np.where(timed_out, 0.0, np.where(use_period, period_rate, counted))
+
+    def _finish_batch(self, t, level, counts, pulse_hz, edge_times, periods, flow_rates):
+        """Leave the engine in the state the scalar path would have after the batch."""
+        self.pulse_count = int(counts[-1])
+        self._segment_pulses += len(edge_times)
+        self.pulse_hz = float(pulse_hz[-1])
+        self.flow_rate = float(flow_rates[-1])
+        self.prev_level = 1 if level[-1] else 0
+
+        if len(edge_times):
+            self.last_edge_time = float(edge_times[-1])
+            self.periods.last_edge = float(edge_times[-1])
+            self.periods.period = None if np.isnan(periods[-1]) else float(periods[-1])
+
+        # Replay the last sample of each bucket still held by the window, plus
+        # the last sample before them, to rebuild the ring exactly
+        window = self.window
+        fresh = window.state()[0] is None
+        buckets = np.floor_divide(t, window.bucket_s).astype(np.int64)
+        start = int(np.searchsorted(buckets, buckets[-1] - (window.size - 1), side="left"))
+        start = max(start - 1, 0)
+        tail = buckets[start:]
+        replay = (np.flatnonzero(np.append(tail[1:] != tail[:-1], True)) + start).tolist()
+        if fresh and start == 0 and replay[0] != 0:
+            # The first sample seeds the bucket before it
+            replay.insert(0, 0)
+        for i in replay:
+            window.record(float(t[i]), int(counts[i]))
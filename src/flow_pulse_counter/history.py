@@ -0,0 +1,373 @@
+import asyncio
+import base64
+import json
+import logging
+import math
+import os
+import struct
+import time
+import zlib
+from array import array
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# Bucket lengths in seconds, finest first; each tier is built from the one before it
+TIER_SECONDS = (1, 60, 3600)
+TIER_NAMES = {1: "1s", 60: "1m", 3600: "1h"}
+# Completed buckets kept on the device per tier: 15 minutes of seconds, a day of minutes, 30 days of hours
+DEFAULT_TIER_SIZES = (900, 1440, 720)
+
+# Flow rates are in L/min and volumes in litres
+BUCKET_FIELDS = ("start", "samples", "min", "max", "mean", "volume")
+_WIDTH = len(BUCKET_FIELDS)
+
+HISTORY_FILE = "history.bin"
+_MAGIC = b"FPH1"
+# magic, channels, tiers, outbox rows
+_HEADER = struct.Struct("<4sHHI")
+# size, head, filled, open bucket index (-1 for none), then its start, samples, min, max, rate sum, volume
+_TIER_STATE = struct.Struct("<IIIqdqdddd")
+# channel, tier seconds, then the bucket
+_OUTBOX_ROW = struct.Struct("<HI6d")
+
+DEFAULT_MAX_OUTBOX = 20000
+DEFAULT_UPLOAD_ROWS = 2000
+
+
+class HistoryTier:
+    """Fixed-size ring of completed buckets of one length, plus the bucket being filled.
+
+    Completed buckets are stored as rows of `BUCKET_FIELDS` in one flat
+    array, so the tier never allocates once it is created.
+    """
+
+    __slots__ = (
+        "period_s",
+        "size",
+        "data",
+        "head",
+        "filled",
+        "open_index",
+        "open_start",
+        "samples",
+        "low",
+        "high",
+        "rate_sum",
+        "volume",
+    )
+
+    def __init__(self, period_s, size):
+        self.period_s = period_s
+        self.size = size
+        self.data = array("d", bytes(8 * _WIDTH * size))
+        self.head = 0
+        self.filled = 0
+        self.open_index = -1
+        self.open_start = 0.0
+        self.samples = 0
+        self.low = self.high = self.rate_sum = self.volume = 0.0
+
+    def add(self, t, samples, low, high, rate_sum, volume):
+        """Add samples (or a finer bucket) starting at `t`.
+
+        Returns the bucket this closed, as a row of `BUCKET_FIELDS`, or None.
+        """
+        index = int(t // self.period_s)
+        closed = None
+        if index != self.open_index:
+            if self.samples:
+                closed = self._close()
+            self.open_index = index
+            self.open_start = index * self.period_s
+            self.low, self.high = low, high
+
+        self.samples += samples
+        if low < self.low:
+            self.low = low
+        if high > self.high:
+            self.high = high
+        self.rate_sum += rate_sum
+        self.volume += volume
+        return closed
+
+    def _close(self):
+        row = (self.open_start, self.samples, self.low, self.high, self.rate_sum / self.samples, self.volume)
+        offset = self.head * _WIDTH
+        self.data[offset : offset + _WIDTH] = array("d", row)
+        self.head = (self.head + 1) % self.size
+        self.filled = min(self.filled + 1, self.size)
+        self.samples = 0
+        self.rate_sum = self.volume = 0.0
+        return row
+
+    def buckets(self):
+        """Completed buckets, oldest first."""
+        start = (self.head - self.filled) % self.size
+        rows = []
+        for i in range(self.filled):
+            offset = ((start + i) % self.size) * _WIDTH
+            rows.append(tuple(self.data[offset : offset + _WIDTH]))
+        return rows
+
+    def pack(self):
+        state = _TIER_STATE.pack(
+            self.size,
+            self.head,
+            self.filled,
+            self.open_index,
+            self.open_start,
+            self.samples,
+            self.low,
+            self.high,
+            self.rate_sum,
+            self.volume,
+        )
+        return state + self.data.tobytes()
+
+    def unpack(self, data, offset):
+        """Restore the state packed at `offset`, returning the offset after it."""
+        (
+            size,
+            self.head,
+            self.filled,
+            self.open_index,
+            self.open_start,
+            self.samples,
+            self.low,
+            self.high,
+            self.rate_sum,
+            self.volume,
+        ) = _TIER_STATE.unpack_from(data, offset)
+        if size != self.size:
+            raise ValueError(f"{self.period_s} s tier holds {size} buckets, expected {self.size}")
+        offset += _TIER_STATE.size
+        end = offset + 8 * _WIDTH * size
+        self.data = array("d", data[offset:end])
+        return end
+
+
+class HistoryStore:
+    """Per-meter flow history in 1 s, 1 min and 1 h tiers.
+
+    `record()` is called with every flow rate reading. Each tier keeps the
+    minimum, maximum and mean flow rate of its buckets and the volume that
+    passed in them, and is fed by the completed buckets of the tier below,
+    so a reading costs the same however much history is kept.
+
+    Completed buckets of `upload_from_s` and longer also go into an outbox
+    for upload in batches. The outbox is bounded; once full the oldest
+    buckets are dropped and counted. The whole store, outbox included, can
+    be written to a compact file and loaded back after a restart.
+    """
+
+    def __init__(self, names, tier_sizes=DEFAULT_TIER_SIZES, upload_from_s=60, max_outbox=DEFAULT_MAX_OUTBOX):
+        self.names = list(names)
+        self.tier_sizes = tuple(tier_sizes)
+        self.upload_from_s = upload_from_s
+        self.tiers = [
+            [HistoryTier(period_s, size) for period_s, size in zip(TIER_SECONDS, self.tier_sizes)] for _ in self.names
+        ]
+        self.last_volume = [math.nan] * len(self.names)
+
+        self.outbox = deque(maxlen=max_outbox)
+        self.dropped = 0
+        self.uploaded = 0
+
+    def record(self, channel, now, rate, total_volume):
+        """Record a channel's flow rate (L/min) and total volume (L) at `now`."""
+        last = self.last_volume[channel]
+        self.last_volume[channel] = total_volume
+        volume = total_volume - last
+        if not volume >= 0.0:
+            # First reading (NaN) or the totals were reset
+            volume = 0.0
+
+        row = (now, 1, rate, rate, rate, volume)
+        for tier in self.tiers[channel]:
+            start, samples, low, high, mean, volume = row
+            row = tier.add(start, samples, low, high, mean * samples, volume)
+            if row is None:
+                return
+            if tier.period_s >= self.upload_from_s:
+                self._queue(channel, tier.period_s, row)
+
+    def _queue(self, channel, period_s, row):
+        if len(self.outbox) == self.outbox.maxlen:
+            self.dropped += 1
+        self.outbox.append((channel, period_s, row))
+
+    def history(self, channel, period_s):
+        """A channel's completed buckets of `period_s` seconds, oldest first."""
+        return self.tiers[channel][TIER_SECONDS.index(period_s)].buckets()
+
+    def upload_batch(self, max_rows=DEFAULT_UPLOAD_ROWS):
+        """The oldest outbox buckets as a channel message, and how many it holds.
+
+        Buckets are grouped by meter and tier, and the rows are compressed.
+        Returns (None, 0) if the outbox is empty.
+        """
+        count = min(max_rows, len(self.outbox))
+        if not count:
+            return None, 0
+
+        grouped = {}
+        for i in range(count):
+            channel, period_s, row = self.outbox[i]
+            rows = grouped.setdefault(self.names[channel], {}).setdefault(TIER_NAMES[period_s], [])
+            rows.append([row[0], int(row[1]), round(row[2], 4), round(row[3], 4), round(row[4], 4), round(row[5], 4)])
+
+        data = zlib.compress(json.dumps(grouped, separators=(",", ":")).encode(), 9)
+        message = {
+            "fields": list(BUCKET_FIELDS),
+            "encoding": "zlib+base64",
+            "rows": count,
+            "data": base64.b64encode(data).decode("ascii"),
+        }
+        return message, count
+
+    def acknowledge(self, count):
+        """Remove the `count` oldest buckets from the outbox once they are uploaded."""
+        for _ in range(min(count, len(self.outbox))):
+            self.outbox.popleft()
+        self.uploaded += count
+
+    def dump(self):
+        """The store as bytes, for `load()`."""
+        chunks = [_HEADER.pack(_MAGIC, len(self.names), len(self.tier_sizes), len(self.outbox))]
+        for channel, tiers in enumerate(self.tiers):
+            chunks.append(struct.pack("<d", self.last_volume[channel]))
+            chunks.extend(tier.pack() for tier in tiers)
+        chunks.extend(_OUTBOX_ROW.pack(channel, period_s, *row) for channel, period_s, row in self.outbox)
+        return zlib.compress(b"".join(chunks))
+
+    def load(self, data):
+        """Restore a store written by `dump()` for the same meters and tier sizes."""
+        data = zlib.decompress(data)
+        magic, channels, tiers, outbox_rows = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Not a flow history file")
+        if channels != len(self.names) or tiers != len(self.tier_sizes):
+            raise ValueError(f"History file holds {channels} meters, expected {len(self.names)}")
+
+        offset = _HEADER.size
+        for channel, channel_tiers in enumerate(self.tiers):
+            (self.last_volume[channel],) = struct.unpack_from("<d", data, offset)
+            offset += 8
+            for tier in channel_tiers:
+                offset = tier.unpack(data, offset)
+
+        self.outbox.clear()
+        for _ in range(outbox_rows):
+            channel, period_s, *row = _OUTBOX_ROW.unpack_from(data, offset)
+            offset += _OUTBOX_ROW.size
+            self.outbox.append((channel, period_s, tuple(row)))
+
+    def stats(self):
+        return {
+            "history_outbox_depth": len(self.outbox),
+            "history_uploaded": self.uploaded,
+            "history_dropped": self.dropped,
+        }
+
+
+def _write_file(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class HistoryUploader:
+    """Background task that saves the history store and uploads its outbox.
+
+    The store is written to `path` every `save_interval_s` seconds, and
+    the outbox is published to `channel_name` every `upload_interval_s`
+    seconds in batches. A batch is only removed from the outbox once it
+    has been published, so buckets wait on the device through a network
+    outage (and, with a file, a restart).
+    """
+
+    def __init__(
+        self,
+        store,
+        publish,
+        channel_name="flow_history",
+        upload_interval_s=300.0,
+        path=None,
+        save_interval_s=60.0,
+        max_rows=DEFAULT_UPLOAD_ROWS,
+    ):
+        self.store = store
+        self.publish = publish
+        self.channel_name = channel_name
+        self.upload_interval_s = upload_interval_s
+        self.path = path
+        self.save_interval_s = save_interval_s
+        self.max_rows = max_rows
+
+        self.failed_uploads = 0
+        self._task = None
+
+    def load(self):
+        """Load the store from `path`, if it was saved before."""
+        if not self.path:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                self.store.load(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, zlib.error, struct.error) as e:
+            log.error("Discarding unreadable flow history %s: %s", self.path, e)
+            return
+        log.info("Restored flow history from %s, %d buckets waiting to upload", self.path, len(self.store.outbox))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.save()
+
+    async def _run(self):
+        next_upload = time.monotonic() + self.upload_interval_s
+        while True:
+            await asyncio.sleep(self.save_interval_s)
+            await self.save()
+            if self.upload_interval_s > 0 and time.monotonic() >= next_upload:
+                next_upload = time.monotonic() + self.upload_interval_s
+                await self.upload()
+
+    async def save(self):
+        if not self.path:
+            return
+        data = self.store.dump()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            await asyncio.to_thread(_write_file, self.path, data)
+        except OSError as e:
+            log.error("Error saving flow history to %s: %s", self.path, e)
+
+    async def upload(self):
+        """Publish the outbox in batches until it is empty or a publish fails."""
+        while True:
+            message, count = self.store.upload_batch(self.max_rows)
+            if message is None:
+                return
+            try:
+                result = await self.publish(self.channel_name, message)
+            except Exception as e:
+                result = False
+                log.error("Error uploading %d history buckets: %s", count, e)
+            if result is False:
+                self.failed_uploads += 1
+                return
+            self.store.acknowledge(count)
+
+    def stats(self):
+        return {**self.store.stats(), "history_failed_uploads": self.failed_uploads}
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+from array import array
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets, plus an overflow bucket
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Pipeline stages timed by the app
+STAGE_READ = "read"
+STAGE_ACQUIRE = "acquire"
+STAGE_PUBLISH = "publish"
+STAGE_PERSIST = "persist"
+STAGE_MAIN_LOOP = "main_loop"
+STAGES = (STAGE_READ, STAGE_ACQUIRE, STAGE_PUBLISH, STAGE_PERSIST, STAGE_MAIN_LOOP)
+
+# How late acquisition ticks fire
+JITTER = "acquisition_jitter"
+
+# Seconds over which a channel's expected and counted pulses are balanced
+MISSED_EDGE_WINDOW = 10.0
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds.
+
+    Observing a value is a bisect and three array updates, with no
+    allocation, so it is cheap enough for the acquisition path.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = array("q", bytes(8 * (len(self.bounds) + 1)))
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile, or the max for the overflow bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        """Compact summary in milliseconds for the diagnostics tag."""
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000.0, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.5) * 1000.0, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000.0, 3),
+            "max_ms": round(self.max * 1000.0, 3),
+        }
+
+    def prometheus(self, name, labels=""):
+        """Render the histogram in the Prometheus text exposition format."""
+        sep = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class Instrumentation:
+    """Stage latency and jitter histograms plus a missed-edge estimate.
+
+    `missed_edges` estimates pulses the acquisition could not have seen. A
+    polled input shows at most one pulse per two reads, so each read's
+    count is compared with the pulses expected at the measured pulse rate.
+    The difference is summed over `missed_window_s` for each channel, so
+    reads that counted more than expected offset those that counted fewer,
+    and a window that ends short adds its shortfall. Edges known to be
+    missed, dropped edge events or the pulses a counter saw that polling
+    didn't, are added as they are reported.
+
+    The cost of one observation is measured at startup, so the overhead of
+    the instrumentation itself is reported alongside the measurements.
+    """
+
+    def __init__(self, stages=STAGES, missed_window_s=MISSED_EDGE_WINDOW):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.jitter = LatencyHistogram()
+        self.missed_edges = 0.0
+        self.missed_window_s = missed_window_s
+        # Per channel, the seconds and the expected minus counted pulses of the open window
+        self._shortfall = {}
+        self.started = time.monotonic()
+        self.observe_cost = self._measure_observe_cost()
+
+    @staticmethod
+    def _measure_observe_cost(samples=1000):
+        histogram = LatencyHistogram()
+        perf_counter = time.perf_counter
+        start = perf_counter()
+        for _ in range(samples):
+            t0 = perf_counter()
+            histogram.observe(perf_counter() - t0)
+        return (perf_counter() - start) / samples
+
+    def observe(self, stage, seconds):
+        self.histograms[stage].observe(seconds)
+
+    def observe_jitter(self, lateness):
+        self.jitter.observe(max(lateness, 0.0))
+
+    def estimate_missed(self, pulse_hz, interval, counted, channel=0):
+        """Balance the pulses a sampled channel counted over `interval` seconds against `pulse_hz`."""
+        expected = pulse_hz * interval
+        difference = expected - counted
+        # Below one pulse per two reads every pulse is seen, so only a count ahead of the rate is kept
+        if expected <= 0.5 and difference > 0:
+            difference = 0.0
+        window = self._shortfall.get(channel)
+        if window is None:
+            window = self._shortfall[channel] = [0.0, 0.0]
+        window[0] += interval
+        window[1] += difference
+        if window[0] >= self.missed_window_s:
+            if window[1] > 0:
+                self.missed_edges += window[1]
+            window[0] = window[1] = 0.0
+
+    def add_missed(self, edges):
+        self.missed_edges += edges
+
+    @property
+    def observations(self):
+        return self.jitter.count + sum(h.count for h in self.histograms.values())
+
+    def overhead(self):
+        """Estimated fraction of run time spent inside the instrumentation."""
+        uptime = time.monotonic() - self.started
+        return self.observations * self.observe_cost / uptime if uptime > 0 else 0.0
+
+    def stats(self):
+        return {
+            "latency": {stage: h.summary() for stage, h in self.histograms.items()},
+            "acquisition_jitter": self.jitter.summary(),
+            "missed_edges_estimate": int(self.missed_edges),
+            "instrumentation_overhead_pct": round(self.overhead() * 100.0, 4),
+        }
+
+    def prometheus(self, extra=None):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = ["# TYPE flow_pulse_stage_seconds histogram"]
+        for stage, histogram in self.histograms.items():
+            lines.extend(histogram.prometheus("flow_pulse_stage_seconds", f'stage="{stage}"'))
+        lines.append("# TYPE flow_pulse_acquisition_jitter_seconds histogram")
+        lines.extend(self.jitter.prometheus("flow_pulse_acquisition_jitter_seconds"))
+        lines.append("# TYPE flow_pulse_missed_edges_estimate counter")
+        lines.append(f"flow_pulse_missed_edges_estimate {self.missed_edges}")
+        lines.append("# TYPE flow_pulse_instrumentation_overhead_ratio gauge")
+        lines.append(f"flow_pulse_instrumentation_overhead_ratio {self.overhead()}")
+        for name, value in (extra or {}).items():
+            lines.append(f"# TYPE flow_pulse_{name} gauge")
+            lines.append(f"flow_pulse_{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Minimal local HTTP server answering every request with the Prometheus text metrics.
+
+    `render` is called per request and returns the exposition text.
+    """
+
+    def __init__(self, render, host="127.0.0.1", port=9108):
+        self.render = render
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if self.port == 0:
+            self.port = self._server.sockets[0].getsockname()[1]
+        log.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            # Read the request line and headers; every path serves the metrics
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            body = self.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except Exception as e:
+            log.debug("Metrics request failed: %s", e)
+        finally:
+            writer.close()
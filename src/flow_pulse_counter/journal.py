@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+log = logging.getLogger(__name__)
+
+# sequence, timestamp, channel index, pulse count, total volume
+RECORD = struct.Struct("<QdIqd")
+CRC = struct.Struct("<I")
+RECORD_SIZE = RECORD.size + CRC.size
+
+JOURNAL_FILE = "totals.journal"
+SNAPSHOT_FILE = "totals.snapshot"
+
+
+def pack_record(seq, timestamp, index, pulse_count, total_volume):
+    body = RECORD.pack(seq, timestamp, index, pulse_count, total_volume)
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def unpack_records(data):
+    """Unpack records from `data`, stopping at the first torn or corrupt one.
+
+    Returns the records and the number of bytes they occupied.
+    """
+    records = []
+    offset = 0
+    while offset + RECORD_SIZE <= len(data):
+        body = data[offset : offset + RECORD.size]
+        (crc,) = CRC.unpack_from(data, offset + RECORD.size)
+        if zlib.crc32(body) != crc:
+            break
+        records.append(RECORD.unpack(body))
+        offset += RECORD_SIZE
+    return records, offset
+
+
+def _write_snapshot(path, data):
+    """Atomically replace `path` with `data`, durable once this returns."""
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # The rename itself is only durable once the directory is synced
+    fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class TotalizerJournal:
+    """Crash-safe local record of each channel's pulse count and total volume.
+
+    Updates are buffered in memory (latest value per channel wins) and
+    appended by `sync()` as fixed-size, CRC-checked records followed by one
+    fsync. Once `compact_records` records have been appended, the latest
+    state is written to a snapshot file and the journal is truncated.
+
+    Every record carries a sequence number, so records left over from a
+    crash part way through compaction are never replayed over a newer
+    snapshot.
+    """
+
+    def __init__(self, directory, compact_records=4096):
+        self.directory = Path(directory)
+        self.journal_path = self.directory / JOURNAL_FILE
+        self.snapshot_path = self.directory / SNAPSHOT_FILE
+        self.compact_records = compact_records
+
+        # channel index -> (sequence, timestamp, pulse_count, total_volume)
+        self.state = {}
+        self.seq = 0
+        self.syncs = 0
+        self.last_sync_latency = 0.0
+
+        self._dirty = {}
+        self._file = None
+        self._records = 0
+
+    def load(self):
+        """Restore state from the snapshot and journal.
+
+        Returns a dict of channel index -> (pulse_count, total_volume).
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        snapshot, _ = unpack_records(self._read(self.snapshot_path))
+        self._apply(snapshot)
+
+        data = self._read(self.journal_path)
+        records, valid = unpack_records(data)
+        self._apply(records)
+        self._records = len(records)
+        if valid < len(data):
+            log.warning(
+                "Discarding %d bytes of torn or corrupt journal after %d records",
+                len(data) - valid,
+                self._records,
+            )
+
+        self._file = open(self.journal_path, "ab")
+        if valid < len(data):
+            self._file.truncate(valid)
+
+        return {index: (s[2], s[3]) for index, s in self.state.items()}
+
+    def update(self, index, pulse_count, total_volume, now=None):
+        """Record a channel's latest totals, to be written on the next sync."""
+        self._dirty[index] = (time.time() if now is None else now, pulse_count, total_volume)
+
+    @property
+    def pending(self):
+        return len(self._dirty)
+
+    async def sync(self):
+        """Append pending updates and fsync them, compacting if due."""
+        if not self._dirty:
+            return
+
+        start = time.monotonic()
+        chunks = []
+        for index, (timestamp, pulse_count, total_volume) in self._dirty.items():
+            self.seq += 1
+            self.state[index] = (self.seq, timestamp, pulse_count, total_volume)
+            chunks.append(pack_record(self.seq, timestamp, index, pulse_count, total_volume))
+        self._dirty.clear()
+
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        # fsync can take tens of milliseconds on flash, keep it off the event loop
+        await asyncio.to_thread(os.fsync, self._file.fileno())
+        self._records += len(chunks)
+        self.syncs += 1
+        self.last_sync_latency = time.monotonic() - start
+
+        if self._records >= self.compact_records:
+            await self.compact()
+
+    async def compact(self):
+        """Write the current state to the snapshot and truncate the journal."""
+        data = b"".join(
+            pack_record(seq, timestamp, index, pulse_count, total_volume)
+            for index, (seq, timestamp, pulse_count, total_volume) in self.state.items()
+        )
+        await asyncio.to_thread(_write_snapshot, self.snapshot_path, data)
+
+        self._file.truncate(0)
+        await asyncio.to_thread(os.fsync, self._file.fileno())
+        self._records = 0
+        log.debug("Compacted totalizer journal into %s", self.snapshot_path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _apply(self, records):
+        """Apply records newer than the current state for their channel."""
+        for seq, timestamp, index, pulse_count, total_volume in records:
+            current = self.state.get(index)
+            if current is None or seq > current[0]:
+                self.state[index] = (seq, timestamp, pulse_count, total_volume)
+            self.seq = max(self.seq, seq)
+
+    @staticmethod
+    def _read(path):
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return b""
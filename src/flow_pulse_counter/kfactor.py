@@ -0,0 +1,89 @@
+from array import array
+from bisect import bisect_left
+
+# Entries in the dense lookup array spanning 0 Hz to the highest calibration point
+DENSE_SIZE = 1024
+
+# Calibration points closer than this fraction of their frequency replace each other
+MERGE_TOLERANCE = 0.1
+
+
+def parse_k_factor_points(text):
+    """Parse "Hz:pulses/L" pairs, e.g. "5:452, 20:450, 80:447", into sorted (hz, factor) tuples."""
+    points = []
+    for part in (text or "").replace(";", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        hz, sep, factor = part.partition(":")
+        if not sep:
+            raise ValueError(f"K-factor point {part!r} is not in 'Hz:pulses/L' form")
+        hz, factor = float(hz), float(factor)
+        if hz < 0 or factor <= 0:
+            raise ValueError(f"K-factor point {part!r} needs a frequency >= 0 and a factor > 0")
+        points.append((hz, factor))
+    return sorted(points)
+
+
+def format_k_factor_points(points):
+    """The inverse of `parse_k_factor_points`, for logging a table in config form."""
+    return ", ".join(f"{hz:g}:{factor:.2f}" for hz, factor in points)
+
+
+class KFactorTable:
+    """Pulses per litre as a function of pulse frequency.
+
+    Meters read slightly differently across their range, so a calibration
+    can hold several (frequency, factor) points. Between points the factor
+    is interpolated linearly, and outside them it is held at the nearest
+    point. The interpolation is done once, into a dense array of
+    `DENSE_SIZE` entries, so `factor()` is a single indexed lookup.
+    """
+
+    __slots__ = ("points", "step_hz", "_scale", "_last", "_factors")
+
+    def __init__(self, points, size=DENSE_SIZE):
+        points = sorted((float(hz), float(factor)) for hz, factor in points)
+        if not points:
+            raise ValueError("A K-factor table needs at least one point")
+        if any(hz < 0 or factor <= 0 for hz, factor in points):
+            raise ValueError("K-factor points need a frequency >= 0 and a factor > 0")
+        self.points = points
+
+        max_hz = points[-1][0]
+        if len(points) == 1 or max_hz <= 0:
+            self.step_hz = 0.0
+            self._scale = 0.0
+            self._factors = array("d", [points[0][1]])
+        else:
+            self.step_hz = max_hz / (size - 1)
+            self._scale = 1.0 / self.step_hz
+            self._factors = array("d", (self._interpolate(i * self.step_hz) for i in range(size)))
+        self._last = len(self._factors) - 1
+
+    def _interpolate(self, hz):
+        points = self.points
+        i = bisect_left(points, (hz,))
+        if i == 0:
+            return points[0][1]
+        if i == len(points):
+            return points[-1][1]
+        (hz0, k0), (hz1, k1) = points[i - 1], points[i]
+        if hz1 == hz0:
+            return k1
+        return k0 + (k1 - k0) * (hz - hz0) / (hz1 - hz0)
+
+    def factor(self, hz):
+        """Pulses per litre at a pulse frequency of `hz`."""
+        i = int(hz * self._scale + 0.5)
+        return self._factors[i if i < self._last else self._last]
+
+    @property
+    def nominal(self):
+        """The mean factor of the calibration points."""
+        return sum(factor for _, factor in self.points) / len(self.points)
+
+    def with_point(self, hz, factor):
+        """A new table with a point added, replacing any within `MERGE_TOLERANCE` of its frequency."""
+        kept = [(h, k) for h, k in self.points if abs(h - hz) > MERGE_TOLERANCE * max(hz, h)]
+        return KFactorTable(kept + [(hz, factor)], size=len(self._factors) if self.step_hz else DENSE_SIZE)
@@ -0,0 +1,399 @@
+"""
+Deterministic pulse load generator.
+
+A scenario file describes the pulse trains to generate on one or more pins as
+a list of segments (idle time, constant rates, ramps, bursts) with optional
+timing jitter and contact bounce. It compiles to a schedule of exactly timed
+level transitions plus the ground truth pulse count for each pin. The same
+seed always gives the same schedule.
+
+    {
+        "name": "stress",
+        "seed": 1,
+        "defaults": {"duty": 0.5},
+        "pins": {
+            "1": [
+                {"type": "idle", "duration": 5},
+                {"type": "ramp", "from_hz": 10, "to_hz": 2000, "duration": 20, "jitter": 0.05},
+                {"type": "burst", "rate_hz": 3000, "on": 0.5, "off": 1.5, "duration": 10},
+                {"type": "constant", "rate_hz": 20, "duration": 10, "bounce": {"probability": 0.2, "edges": 3}}
+            ]
+        }
+    }
+
+`run_load()` plays a schedule through an acquisition backend against a
+local stand-in for the platform interface, on the schedule's own clock, and
+reports the counter's loss rate:
+
+    python -m flow_pulse_counter.loadgen scenario.json --mode Events
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import random
+import time
+from array import array
+from bisect import bisect_right
+
+from .acquisition import ACQUISITION_MODES, create_backend
+from .channels import MeterChannel
+from .replay import ReplayPlatform
+
+SEGMENT_TYPES = ["idle", "constant", "ramp", "burst"]
+
+DEFAULT_DUTY = 0.5
+DEFAULT_BOUNCE_SPACING_S = 0.0005
+
+# Smallest gap kept between a falling edge and the next rising edge when
+# jitter pushes pulses together
+_MIN_GAP_S = 1e-6
+
+
+def _pulse_phases(from_hz, to_hz, duration):
+    """Yield (offset, period) of each pulse in a linear frequency ramp.
+
+    Pulse k starts where the integrated frequency reaches k, from k = 0 at
+    the start of the ramp, so a constant rate is the special case
+    `from_hz == to_hz` and gives exactly `rate * duration` pulses. The period
+    is the time to the next pulse.
+    """
+    slope = (to_hz - from_hz) / duration if duration > 0 else 0.0
+    total = from_hz * duration + slope * duration * duration / 2
+
+    def offset(k):
+        if slope == 0:
+            return k / from_hz
+        return (-from_hz + math.sqrt(max(from_hz * from_hz + 2 * slope * k, 0.0))) / slope
+
+    count = math.ceil(total - 1e-9)
+    current = 0.0
+    for k in range(count):
+        following = offset(k + 1) if k + 1 <= total else duration
+        yield current, following - current
+        current = following
+
+
+class Segment:
+    """One step of a pin's scenario."""
+
+    __slots__ = ("type", "duration", "from_hz", "to_hz", "on", "off", "duty", "jitter", "bounce")
+
+    def __init__(
+        self,
+        type,
+        duration,
+        rate_hz=0.0,
+        from_hz=None,
+        to_hz=None,
+        on=None,
+        off=None,
+        duty=DEFAULT_DUTY,
+        jitter=0.0,
+        bounce=None,
+    ):
+        if type not in SEGMENT_TYPES:
+            raise ValueError(f"Unknown segment type {type!r}, expected one of {SEGMENT_TYPES}")
+        if duration <= 0:
+            raise ValueError("Segment duration must be positive")
+        if not 0 < duty < 1:
+            raise ValueError("Segment duty must be between 0 and 1")
+        if not 0 <= jitter < 0.5:
+            raise ValueError("Segment jitter must be at least 0 and below 0.5 of the period")
+
+        self.type = type
+        self.duration = float(duration)
+        self.from_hz = float(rate_hz if from_hz is None else from_hz)
+        self.to_hz = float(rate_hz if to_hz is None else to_hz)
+        if type == "idle":
+            self.from_hz = self.to_hz = 0.0
+        if self.from_hz < 0 or self.to_hz < 0:
+            raise ValueError("Segment rates can't be negative")
+
+        self.on = float(duration if on is None else on)
+        self.off = float(0.0 if off is None else off)
+        if type == "burst" and (self.on <= 0 or self.off < 0):
+            raise ValueError("Burst segments need a positive 'on' and a non-negative 'off' time")
+
+        self.duty = float(duty)
+        self.jitter = float(jitter)
+        self.bounce = dict(bounce or {})
+
+    @classmethod
+    def from_dict(cls, data, defaults=None):
+        options = dict(defaults or {})
+        options.update(data)
+        return cls(**options)
+
+    def pulses(self):
+        """Yield (offset, period) of each nominal pulse in the segment."""
+        if self.type == "idle" or (self.from_hz == 0 and self.to_hz == 0):
+            return
+        if self.type != "burst":
+            yield from _pulse_phases(self.from_hz, self.to_hz, self.duration)
+            return
+
+        start = 0.0
+        while start < self.duration:
+            on = min(self.on, self.duration - start)
+            for offset, period in _pulse_phases(self.from_hz, self.to_hz, on):
+                yield start + offset, period
+            start += self.on + self.off
+
+
+class Scenario:
+    """A named set of per-pin segment lists and the seed for their randomness."""
+
+    def __init__(self, pins, name="scenario", seed=0):
+        if not pins:
+            raise ValueError("A scenario needs at least one pin")
+        self.name = name
+        self.seed = seed
+        self.pins = {int(pin): list(segments) for pin, segments in pins.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        defaults = data.get("defaults", {})
+        pins = {
+            pin: [Segment.from_dict(segment, defaults) for segment in segments]
+            for pin, segments in data.get("pins", {}).items()
+        }
+        return cls(pins, name=data.get("name", "scenario"), seed=data.get("seed", 0))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def duration(self):
+        return max(sum(s.duration for s in segments) for segments in self.pins.values())
+
+    def schedule(self, start=0.0):
+        """Compile the scenario into a `Schedule` starting at time `start`."""
+        rng = random.Random(self.seed)
+        times = {}
+        pulses = {}
+        for pin in sorted(self.pins):
+            times[pin], pulses[pin] = self._compile_pin(self.pins[pin], start, rng)
+        return Schedule(self, start, times, pulses)
+
+    @staticmethod
+    def _compile_pin(segments, start, rng):
+        # Transition times alternate rising, falling, starting with a rising edge
+        times = array("d")
+        pulses = 0
+        last_fall = -math.inf
+        segment_start = start
+        for segment in segments:
+            end = segment_start + segment.duration
+            bounce_p = float(segment.bounce.get("probability", 0.0))
+            bounce_edges = int(segment.bounce.get("edges", 0))
+            bounce_spacing = float(segment.bounce.get("spacing", DEFAULT_BOUNCE_SPACING_S))
+
+            for offset, period in segment.pulses():
+                rise = segment_start + offset
+                if segment.jitter:
+                    rise += rng.uniform(-segment.jitter, segment.jitter) * period
+                rise = max(rise, segment_start, last_fall + _MIN_GAP_S)
+                fall = min(rise + segment.duty * period, end)
+                if fall <= rise:
+                    continue
+
+                times.append(rise)
+                if bounce_edges and bounce_p and rng.random() < bounce_p:
+                    # The contact chatters after closing: extra edges, not pulses
+                    for k in range(1, bounce_edges + 1):
+                        if rise + 2 * k * bounce_spacing >= fall:
+                            break
+                        times.append(rise + (2 * k - 1) * bounce_spacing)
+                        times.append(rise + 2 * k * bounce_spacing)
+                times.append(fall)
+                last_fall = fall
+                pulses += 1
+
+            segment_start = end
+        return times, pulses
+
+
+class Schedule:
+    """Exactly timed level transitions for every pin of a scenario.
+
+    `pulses` is the ground truth pulse count of each pin. `edges` counts the
+    rising edges, which is higher when the scenario adds contact bounce.
+    """
+
+    def __init__(self, scenario, start, times, pulses):
+        self.scenario = scenario
+        self.start = start
+        self.end = start + scenario.duration
+        self.times = times
+        self.pulses = pulses
+
+    @property
+    def pins(self):
+        return sorted(self.times)
+
+    def edges(self, pin):
+        return (len(self.times[pin]) + 1) // 2
+
+    def __len__(self):
+        return sum(len(t) for t in self.times.values())
+
+    def transitions(self):
+        """Yield (timestamp, pin, level) for every transition, in time order."""
+
+        def pin_transitions(pin, times):
+            for i, t in enumerate(times):
+                yield t, pin, i % 2 == 0
+
+        return heapq.merge(*(pin_transitions(pin, times) for pin, times in self.times.items()))
+
+    def level(self, pin, timestamp):
+        """Level of `pin` at `timestamp`."""
+        return bisect_right(self.times[pin], timestamp) % 2 == 1
+
+    def truth(self):
+        """Return the ground truth log for the schedule as a dict."""
+        return {
+            "scenario": self.scenario.name,
+            "seed": self.scenario.seed,
+            "start": self.start,
+            "duration_s": self.end - self.start,
+            "pins": {str(pin): {"pulses": self.pulses[pin], "edges": self.edges(pin)} for pin in self.pins},
+        }
+
+    def write_truth(self, path):
+        with open(path, "w") as f:
+            json.dump(self.truth(), f, indent=2)
+
+
+async def run_load(
+    schedule,
+    mode,
+    pulses_per_litre=450.0,
+    debounce_ms=50,
+    acquisition_period=0.2,
+    counter_bits=32,
+):
+    """Play `schedule` through an acquisition backend and return a report dict.
+
+    The backend reads a `ReplayPlatform` every `acquisition_period` seconds of
+    schedule time while the transitions are applied in between, so a long
+    scenario runs in a fraction of real time. Each pin's count is compared
+    with the schedule's ground truth.
+    """
+    pins = schedule.pins
+    channels = [
+        MeterChannel(i, f"pin_{pin}", f"Pin {pin}", pin, pulses_per_litre=pulses_per_litre, debounce_ms=debounce_ms)
+        for i, pin in enumerate(pins)
+    ]
+    platform = ReplayPlatform()
+    platform.now = schedule.start
+    backend = create_backend(mode, platform, channels, counter_bits=counter_bits, clock=lambda: platform.now)
+    await backend.start()
+
+    counted = [0] * len(pins)
+    reads = 0
+
+    async def tick(now):
+        nonlocal reads
+        platform.now = now
+        for index, pulses in enumerate(await backend.read(now)):
+            counted[index] += pulses
+        reads += 1
+        # Let the backend's own tasks run, as they would between loop iterations
+        await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    # The first read establishes the baseline of counter backends
+    await tick(schedule.start)
+    next_tick = schedule.start + acquisition_period
+    for timestamp, pin, level in schedule.transitions():
+        while timestamp > next_tick:
+            await tick(next_tick)
+            next_tick += acquisition_period
+        platform.levels[pin] = level
+        if level:
+            await platform.deliver_edge(timestamp, pin)
+    while next_tick <= schedule.end + acquisition_period:
+        await tick(next_tick)
+        next_tick += acquisition_period
+    await backend.stop()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "scenario": schedule.scenario.name,
+        "mode": mode,
+        "acquisition_period": acquisition_period,
+        "duration_s": schedule.end - schedule.start,
+        "transitions": len(schedule),
+        "reads": reads,
+        "elapsed_s": elapsed,
+        "dropped_events": getattr(backend, "dropped_events", 0),
+        "channels": [],
+    }
+    for index, pin in enumerate(pins):
+        expected = schedule.pulses[pin]
+        report["channels"].append(
+            {
+                "pin": pin,
+                "pulses": counted[index],
+                "expected_pulses": expected,
+                "edges": schedule.edges(pin),
+                "count_error": counted[index] - expected,
+                "loss_rate": (expected - counted[index]) / expected if expected else 0.0,
+            }
+        )
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"Scenario {report['scenario']!r} in {report['mode']} mode, "
+        f"{report['acquisition_period'] * 1000:.0f} ms acquisition period",
+        f"{report['transitions']} transitions over {report['duration_s']:.1f} s, {report['reads']} reads "
+        f"in {report['elapsed_s']:.2f} s",
+    ]
+    if report["dropped_events"]:
+        lines.append(f"Dropped events: {report['dropped_events']}")
+    for channel in report["channels"]:
+        lines.append(
+            f"Pin {channel['pin']}: {channel['pulses']} of {channel['expected_pulses']} pulses "
+            f"({channel['edges']} edges), error {channel['count_error']:+d}, loss {channel['loss_rate']:.2%}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure pulse loss against a scripted load scenario")
+    parser.add_argument("scenario", help="Scenario file (JSON)")
+    parser.add_argument("--mode", choices=ACQUISITION_MODES, action="append", help="Acquisition mode(s) to test")
+    parser.add_argument("--pulses-per-litre", type=float, default=450.0)
+    parser.add_argument("--debounce-ms", type=int, default=50)
+    parser.add_argument("--acquisition-period", type=float, default=0.2)
+    parser.add_argument("--truth", help="Write the ground truth log to this file")
+    args = parser.parse_args(argv)
+
+    # Start on the wall clock, as the backends expect real timestamps
+    schedule = Scenario.load(args.scenario).schedule(start=time.time())
+    if args.truth:
+        schedule.write_truth(args.truth)
+
+    for mode in args.mode or ACQUISITION_MODES:
+        report = asyncio.run(
+            run_load(
+                schedule,
+                mode,
+                pulses_per_litre=args.pulses_per_litre,
+                debounce_ms=args.debounce_ms,
+                acquisition_period=args.acquisition_period,
+            )
+        )
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
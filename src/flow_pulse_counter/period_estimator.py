@@ -0,0 +1,67 @@
+class PeriodEstimator:
+    """Pulse rate from the time between consecutive valid edges.
+
+    At low pulse frequencies a counting window only holds a handful of
+    pulses, so its rate is coarse and slow to respond. Measuring the period
+    between edges gives a new reading with every pulse, in O(1) per pulse.
+
+    Once no edge has arrived for `no_flow_periods` times the last period
+    (or `max_period_s`, whichever is shorter) the flow is considered
+    stopped, and the period is forgotten so the first edge after a stop
+    doesn't report the length of the stop as a period.
+    """
+
+    __slots__ = ("no_flow_periods", "max_period_s", "period", "last_edge")
+
+    def __init__(self, no_flow_periods=3.0, max_period_s=10.0):
+        self.no_flow_periods = no_flow_periods
+        self.max_period_s = max_period_s
+        self.period = None
+        self.last_edge = None
+
+    def clear(self):
+        self.period = None
+        self.last_edge = None
+
+    def record(self, edge_time, pulses):
+        """Record `pulses` new pulses, the latest of which arrived at `edge_time`."""
+        if pulses <= 0:
+            return
+
+        if self.last_edge is not None and edge_time > self.last_edge and not self.timed_out(edge_time):
+            self.period = (edge_time - self.last_edge) / pulses
+        else:
+            self.period = None
+        self.last_edge = edge_time
+
+    def timeout(self):
+        if self.period is None:
+            return self.max_period_s
+        return min(self.max_period_s, self.no_flow_periods * self.period)
+
+    def timed_out(self, now):
+        """Return True if no edge has arrived within the no-flow timeout."""
+        return self.last_edge is None or (now - self.last_edge) > self.timeout()
+
+    def pulses_per_second(self, now):
+        """Return the pulse rate from the last period, or 0.0 if there isn't one."""
+        if self.period is None or self.timed_out(now):
+            return 0.0
+        # While waiting for the next edge the period is at least the time since the last one
+        return 1.0 / max(self.period, now - self.last_edge)
+
+    def estimate(self, now, counted_pps, window_s, max_pulses=20):
+        """Choose between a counting-window rate and the period-based rate.
+
+        The period-based rate is used when fewer than `max_pulses` pulses
+        would fall in the counting window, where counting is too coarse.
+        """
+        if self.timed_out(now):
+            return 0.0
+        if self.period is None:
+            return counted_pps
+
+        period_pps = self.pulses_per_second(now)
+        if period_pps * window_s < max_pulses:
+            return period_pps
+        return counted_pps
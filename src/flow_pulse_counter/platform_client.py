@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+
+try:
+    import grpc
+    from pydoover.docker.platform import PlatformInterface
+    from pydoover.docker.platform.grpc_stubs import platform_iface_pb2
+except ImportError:  # without them every request goes through the wrapped interface
+    grpc = None
+    PlatformInterface = None
+    platform_iface_pb2 = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 2.0
+DEFAULT_INITIAL_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_LOG_INTERVAL = 60.0
+
+
+class PlatformUnavailable(ConnectionError):
+    """The platform interface can't be reached, or its next reconnect attempt isn't due yet."""
+
+
+def start_pulse_listener(platform_iface, di, callback, edge="rising"):
+    """Start a pulse listener on `platform_iface` and return its task, or None if it keeps none.
+
+    pydoover's `PlatformInterface` doesn't return the listener task it
+    creates, it only appends it to `pulse_counter_listeners`.
+    """
+    listeners = getattr(platform_iface, "pulse_counter_listeners", None)
+    started = len(listeners) if listeners is not None else 0
+    platform_iface.start_di_pulse_listener(di, callback, edge=edge)
+    if listeners is not None and len(listeners) > started:
+        return listeners[-1]
+    return None
+
+
+async def stop_pulse_listeners(tasks):
+    """Cancel pulse listener tasks and wait for them to finish."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class ListenerCounter:
+    """Cumulative count of one input's edges, fed by a platform interface pulse listener.
+
+    Stands in for pydoover's `PulseCounter`, which keeps the time of every
+    pulse it has seen and logs each one, so it grows without bound at
+    meter pulse rates. This keeps only the count. The count lives in this
+    process: it starts at zero when the counter is opened, and edges sent
+    while the listener's stream is down are missed. `close()` stops the
+    listener.
+    """
+
+    __slots__ = ("count", "listener")
+
+    def __init__(self):
+        self.count = 0
+        self.listener = None
+
+    async def on_edge(self, di, di_value, dt_secs, counter, edge):
+        self.count += 1
+
+    def get_counter(self):
+        return self.count
+
+    async def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            await stop_pulse_listeners([listener])
+
+
+class PlatformClient:
+    """Long-lived client for the platform interface's digital IO requests.
+
+    pydoover's `PlatformInterface` opens a new gRPC channel for every request,
+    and when one fails it logs a traceback and returns None, which reads as
+    every input being low. This client keeps one channel open and sends the
+    digital input reads and output writes over it. gRPC multiplexes
+    concurrent requests on that one connection, so a batch output write
+    neither waits behind a read nor pays for a new connection. Pulse
+    counters are `ListenerCounter`s rather than pydoover's own. Anything
+    else is passed through to the wrapped interface.
+
+    A failed or rejected request raises `PlatformUnavailable`, and a
+    transport error also drops the channel. Reconnect attempts back off
+    exponentially from `initial_backoff_s` to `max_backoff_s`, and requests
+    made before the next attempt is due fail at once without touching the
+    network. The first failure is logged, then at most one reminder every
+    `log_interval_s` until the interface answers again.
+
+    Pulse listeners aren't covered: each keeps its own stream, which
+    pydoover reconnects by itself. A `ListenerCounter` holds its listener's
+    task so the backend using it can stop it.
+
+    When the wrapped interface isn't a gRPC `PlatformInterface` (a test fake,
+    a replay) or grpc isn't installed, requests fall back to the interface's
+    own methods, with the same backoff.
+    """
+
+    def __init__(
+        self,
+        platform_iface,
+        timeout_s=DEFAULT_TIMEOUT,
+        initial_backoff_s=DEFAULT_INITIAL_BACKOFF,
+        max_backoff_s=DEFAULT_MAX_BACKOFF,
+        log_interval_s=DEFAULT_LOG_INTERVAL,
+        clock=time.monotonic,
+    ):
+        self.platform_iface = platform_iface
+        self.timeout_s = timeout_s
+        self.initial_backoff_s = initial_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.log_interval_s = log_interval_s
+        self.clock = clock
+
+        self.persistent = PlatformInterface is not None and isinstance(platform_iface, PlatformInterface)
+        self._channel = None
+        self._stub = None
+
+        self.available = True
+        self.backoff_s = 0.0
+        self.retry_at = 0.0
+        self.down_since = None
+        self.last_logged = 0.0
+        self._outage_start = (0, 0)
+
+        self.failures = 0
+        self.refused = 0
+        self.reconnects = 0
+
+    async def get_di_async(self, pins):
+        if self.persistent:
+            request = platform_iface_pb2.getDIRequest(di=PlatformInterface._cast_pins(pins))
+            return await self._request("getDI", request, "di")
+        return await self._request_local(self.platform_iface.get_di_async, pins)
+
+    async def set_do_async(self, do, value):
+        if self.persistent:
+            pins, values = self.platform_iface._cast_pin_values(do, value)
+            return await self._request("setDO", platform_iface_pb2.setDORequest(do=pins, value=values), "do")
+        return await self._request_local(self.platform_iface.set_do_async, do, value)
+
+    def get_new_pulse_counter(self, di, edge="rising"):
+        if self.persistent:
+            counter = ListenerCounter()
+            counter.listener = start_pulse_listener(self.platform_iface, di, counter.on_edge, edge=edge)
+            return counter
+        return self.platform_iface.get_new_pulse_counter(di, edge)
+
+    def __getattr__(self, name):
+        return getattr(self.platform_iface, name)
+
+    async def close(self):
+        """Close the persistent channel."""
+        channel, self._channel, self._stub = self._channel, None, None
+        if channel is not None:
+            await channel.close()
+
+    async def _request(self, stub_call, request, response_field):
+        self._check_available()
+        try:
+            if self._stub is None:
+                self._channel = grpc.aio.insecure_channel(self.platform_iface.uri)
+                self._stub = self.platform_iface.stub(self._channel)
+            response = await getattr(self._stub, stub_call)(request, timeout=self.timeout_s)
+        except Exception as e:
+            await self.close()
+            raise self._failed(f"{stub_call} failed: {e}") from e
+        # Checked here rather than by `process_response`, which logs every rejected request
+        if not response.response_header.success:
+            raise self._failed(f"{stub_call} rejected: {response.response_header.message}")
+        values = list(getattr(response, response_field))
+        return self._result(stub_call, values[0] if len(values) == 1 else values)
+
+    async def _request_local(self, method, *args):
+        self._check_available()
+        try:
+            # Not `wait_for`, which on 3.11 drops a cancellation that arrives as the request completes
+            async with asyncio.timeout(self.timeout_s):
+                result = await method(*args)
+        except Exception as e:
+            raise self._failed(f"{method.__name__} failed: {e}") from e
+        return self._result(method.__name__, result)
+
+    def _check_available(self):
+        if not self.available and self.clock() < self.retry_at:
+            self.refused += 1
+            raise PlatformUnavailable(f"Retrying the platform interface in {self.retry_at - self.clock():.1f} s")
+
+    def _result(self, stub_call, result):
+        # pydoover returns None for a request the platform rejected
+        if result is None:
+            raise self._failed(f"{stub_call} returned no result")
+        if not self.available:
+            failures, refused = self._outage_start
+            log.info(
+                "Platform interface reconnected after %.1f s (%d failed, %d refused requests)",
+                self.clock() - self.down_since,
+                self.failures - failures,
+                self.refused - refused,
+            )
+            self.available = True
+            self.backoff_s = 0.0
+            self.reconnects += 1
+        return result
+
+    def _failed(self, message):
+        """Record a failed request and back off, returning the `PlatformUnavailable` to raise."""
+        now = self.clock()
+        self.failures += 1
+        self.backoff_s = min(self.max_backoff_s, self.backoff_s * 2 if self.backoff_s else self.initial_backoff_s)
+        self.retry_at = now + self.backoff_s
+        if self.available:
+            self.available = False
+            self.down_since = now
+            self._outage_start = (self.failures - 1, self.refused)
+            self.last_logged = now
+            log.warning("Platform interface unavailable: %s", message)
+        elif now - self.last_logged >= self.log_interval_s:
+            self.last_logged = now
+            log.warning(
+                "Platform interface still unavailable after %.0f s, retrying every %.1f s: %s",
+                now - self.down_since,
+                self.backoff_s,
+                message,
+            )
+        return PlatformUnavailable(message)
+
+    def stats(self):
+        return {
+            "platform_available": self.available,
+            "platform_failures": self.failures,
+            "platform_refused": self.refused,
+            "platform_reconnects": self.reconnects,
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import cProfile
+import io
+import logging
+import marshal
+import os
+import pstats
+import time
+import tracemalloc
+
+log = logging.getLogger(__name__)
+
+# Environment variable that starts profiling at startup, e.g. "cprofile:200,tracemalloc:60".
+# "1" runs both with their defaults.
+PROFILE_ENV = "FLOW_PULSE_PROFILE"
+
+PROFILE_CPROFILE = "cprofile"
+PROFILE_TRACEMALLOC = "tracemalloc"
+
+DEFAULT_PROFILE_ITERATIONS = 100
+DEFAULT_TRACEMALLOC_SECONDS = 60.0
+DEFAULT_MAX_PROFILE_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_PROFILE_FILES = 20
+
+# Lines of each report kept in the text summaries
+REPORT_LINES = 40
+
+
+def parse_profile_spec(spec):
+    """Parse a `PROFILE_ENV` value into {kind: iterations or seconds}."""
+    spec = (spec or "").strip().lower()
+    if not spec or spec in ("0", "false", "off"):
+        return {}
+    if spec in ("1", "true", "on"):
+        return {PROFILE_CPROFILE: DEFAULT_PROFILE_ITERATIONS, PROFILE_TRACEMALLOC: DEFAULT_TRACEMALLOC_SECONDS}
+
+    requests = {}
+    for part in spec.split(","):
+        kind, _, amount = part.strip().partition(":")
+        if kind == PROFILE_CPROFILE:
+            requests[kind] = int(amount) if amount else DEFAULT_PROFILE_ITERATIONS
+        elif kind == PROFILE_TRACEMALLOC:
+            requests[kind] = float(amount) if amount else DEFAULT_TRACEMALLOC_SECONDS
+        else:
+            raise ValueError(f"Unknown profile kind {kind!r} in {spec!r}")
+    return requests
+
+
+class ProfileStore:
+    """Directory of profile reports, capped in total size and file count.
+
+    The oldest reports are deleted first once either limit is exceeded.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_PROFILE_BYTES, max_files=DEFAULT_MAX_PROFILE_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+
+    def write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(data.encode() if isinstance(data, str) else data)
+        self.rotate()
+        return path
+
+    def files(self):
+        """Report files, oldest first."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file()]
+        except FileNotFoundError:
+            return []
+        return sorted(((e.stat().st_mtime, e.name, e.stat().st_size) for e in entries))
+
+    def rotate(self):
+        files = self.files()
+        total = sum(size for _, _, size in files)
+        while files and (total > self.max_bytes or len(files) > self.max_files):
+            _, name, size = files.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class Profiler:
+    """cProfile over a number of loop iterations and tracemalloc diffs over a time span.
+
+    Created only when profiling is requested, so nothing is paid while it is
+    off. The app calls `tick()` once per main loop iteration while a
+    cProfile run is active; everything running on the event loop in between
+    (acquisition included) is profiled.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._profile = None
+        self._iterations_left = 0
+        self._tracemalloc_task = None
+
+    @property
+    def active(self):
+        return self._profile is not None or (self._tracemalloc_task is not None and not self._tracemalloc_task.done())
+
+    def start(self, requests):
+        """Start the runs in a `parse_profile_spec` dict that aren't already running."""
+        if PROFILE_CPROFILE in requests:
+            self.start_cprofile(requests[PROFILE_CPROFILE])
+        if PROFILE_TRACEMALLOC in requests:
+            self.start_tracemalloc(requests[PROFILE_TRACEMALLOC])
+
+    def start_cprofile(self, iterations):
+        if self._profile is not None:
+            log.info("cProfile run already in progress")
+            return
+        self._iterations_left = max(1, iterations)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        log.info("Profiling the next %d loop iterations with cProfile", self._iterations_left)
+
+    def tick(self):
+        if self._profile is None:
+            return
+        self._iterations_left -= 1
+        if self._iterations_left <= 0:
+            self._finish_cprofile()
+
+    def _finish_cprofile(self):
+        profile, self._profile = self._profile, None
+        profile.disable()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        summary = io.StringIO()
+        stats = pstats.Stats(profile, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(REPORT_LINES)
+        try:
+            path = self.store.write(f"cprofile-{stamp}.txt", summary.getvalue())
+            # Full stats in the format of Stats.dump_stats, loadable with pstats or snakeviz
+            self.store.write(f"cprofile-{stamp}.prof", marshal.dumps(stats.stats))
+        except OSError as e:
+            log.error("Unable to write cProfile report to %s: %s", self.store.directory, e)
+            return
+        log.info("cProfile report written to %s", path)
+
+    def start_tracemalloc(self, duration_s, frames=10):
+        if self._tracemalloc_task is not None and not self._tracemalloc_task.done():
+            log.info("tracemalloc run already in progress")
+            return
+        self._tracemalloc_task = asyncio.create_task(self._run_tracemalloc(duration_s, frames))
+
+    async def _run_tracemalloc(self, duration_s, frames):
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(frames)
+        log.info("Tracing memory allocations for %.0f s", duration_s)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(duration_s)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+
+        lines = [f"tracemalloc diff over {duration_s:.0f} s, traced {current} B (peak {peak} B)", ""]
+        lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:REPORT_LINES])
+        try:
+            path = self.store.write(f"tracemalloc-{time.strftime('%Y%m%d-%H%M%S')}.txt", "\n".join(lines) + "\n")
+        except OSError as e:
+            log.error("Unable to write tracemalloc report to %s: %s", self.store.directory, e)
+            return
+        log.info("tracemalloc report written to %s", path)
+
+    async def stop(self):
+        if self._profile is not None:
+            self._finish_cprofile()
+        if self._tracemalloc_task is not None:
+            self._tracemalloc_task.cancel()
+            self._tracemalloc_task = None
@@ -0,0 +1,55 @@
+class ChangeFilter:
+    """Decide whether a reading has changed enough to be worth publishing.
+
+    Each key remembers the last value that was published and when. A new
+    value is published when it moves beyond the key's deadband, or when the
+    last publish is older than `max_staleness_s` so the UI never looks stuck.
+    Non-numeric values (e.g. status text) are published whenever they change.
+    """
+
+    __slots__ = ("max_staleness_s", "_values", "_times")
+
+    def __init__(self, max_staleness_s=60.0):
+        self.max_staleness_s = max_staleness_s
+        self._values = {}
+        self._times = {}
+
+    def should_publish(self, key, value, now, absolute=0.0, relative=0.0):
+        """Return True, and record `value` as published, if it should be sent.
+
+        `absolute` is the deadband in the value's own units and `relative` a
+        fraction of the last published value; the larger of the two applies.
+        """
+        try:
+            last = self._values[key]
+        except KeyError:
+            return self._publish(key, value, now)
+
+        if now - self._times[key] >= self.max_staleness_s:
+            return self._publish(key, value, now)
+
+        if isinstance(value, (int, float)) and isinstance(last, (int, float)):
+            if abs(value - last) > max(absolute, relative * abs(last)):
+                return self._publish(key, value, now)
+            # Always publish transitions to and from zero, e.g. flow stopping
+            if (value == 0) != (last == 0):
+                return self._publish(key, value, now)
+            return False
+
+        if value != last:
+            return self._publish(key, value, now)
+        return False
+
+    def invalidate(self, key=None):
+        """Forget published values so the next reading is always sent."""
+        if key is None:
+            self._values.clear()
+            self._times.clear()
+        else:
+            self._values.pop(key, None)
+            self._times.pop(key, None)
+
+    def _publish(self, key, value, now):
+        self._values[key] = value
+        self._times[key] = now
+        return True
@@ -0,0 +1,98 @@
+import math
+from array import array
+
+
+class RateWindow:
+    """Constant-memory rolling pulse-rate window.
+
+    Time is split into fixed-width buckets held in a preallocated ring. Each
+    bucket stores the cumulative pulse count and timestamp of the last sample
+    recorded in it, so the rate over any window up to `max_window_s` is the
+    difference between the newest bucket and the bucket `window_s` earlier:
+    one lookup regardless of the window length or loop rate.
+
+    Buckets skipped between samples (e.g. after a slow iteration) are filled
+    with the previous sample, so each bucket is written at most once per
+    pass around the ring.
+    """
+
+    __slots__ = ("bucket_s", "size", "_count", "_time", "_last_index", "_filled")
+
+    def __init__(self, max_window_s, bucket_s=1.0):
+        if bucket_s <= 0:
+            raise ValueError("bucket_s must be positive")
+        self.bucket_s = float(bucket_s)
+        # One extra bucket so the oldest bucket of a full window is still held
+        self.size = max(2, math.ceil(max_window_s / self.bucket_s) + 1)
+        self._count = array("q", bytes(8 * self.size))
+        self._time = array("d", bytes(8 * self.size))
+        self._last_index = None
+        self._filled = 0
+
+    @property
+    def max_window_s(self):
+        return (self.size - 1) * self.bucket_s
+
+    def clear(self):
+        self._last_index = None
+        self._filled = 0
+
+    def record(self, now, cumulative_count):
+        """Record the cumulative pulse count at time `now`."""
+        index = int(now // self.bucket_s)
+        size = self.size
+
+        if self._last_index is None:
+            # Seed the previous bucket with the first sample so a rate is
+            # available as soon as a second sample arrives.
+            slot = (index - 1) % size
+            self._count[slot] = cumulative_count
+            self._time[slot] = now
+            self._filled = 1
+        elif index > self._last_index:
+            last_slot = self._last_index % size
+            last_count = self._count[last_slot]
+            last_time = self._time[last_slot]
+            gap = index - self._last_index
+            for step in range(1, min(gap, size)):
+                slot = (self._last_index + step) % size
+                self._count[slot] = last_count
+                self._time[slot] = last_time
+            self._filled = min(self._filled + gap, size - 1)
+        elif index < self._last_index:
+            # The clock went backwards, start again rather than report nonsense
+            self.clear()
+            self.record(now, cumulative_count)
+            return
+
+        slot = index % size
+        self._count[slot] = cumulative_count
+        self._time[slot] = now
+        self._last_index = index
+
+    def state(self):
+        """Return the last bucket index, the filled count and the held buckets.
+
+        Buckets are returned oldest first as (bucket index, count, time).
+        """
+        if self._last_index is None:
+            return None, 0, []
+        buckets = []
+        for index in range(self._last_index - self._filled, self._last_index + 1):
+            slot = index % self.size
+            buckets.append((index, self._count[slot], self._time[slot]))
+        return self._last_index, self._filled, buckets
+
+    def pulses_per_second(self, window_s):
+        """Return the average pulse rate over the last `window_s` seconds."""
+        if self._last_index is None:
+            return 0.0
+
+        buckets_back = min(max(1, math.ceil(window_s / self.bucket_s)), self._filled)
+        newest = self._last_index % self.size
+        oldest = (self._last_index - buckets_back) % self.size
+
+        elapsed = self._time[newest] - self._time[oldest]
+        if elapsed <= 0:
+            return 0.0
+        return (self._count[newest] - self._count[oldest]) / elapsed
@@ -0,0 +1,254 @@
+"""
+Replay a recorded pulse trace through the acquisition backends and counting
+logic, faster than real time, and report throughput and accuracy.
+
+    python -m flow_pulse_counter.replay trace.bin --pulses-per-litre 450
+"""
+
+import argparse
+import asyncio
+import time
+
+from .acquisition import ACQUISITION_EVENTS, ACQUISITION_MODES, ACQUISITION_POLLING, create_backend
+from .channels import MeterChannel
+from .engine import PulseEngine
+from .trace import KIND_EDGE, KIND_SAMPLE, TraceReader
+
+
+class _ReplayCounter:
+    def __init__(self):
+        self.count = 0
+
+    def get_counter(self):
+        return self.count
+
+
+class ReplayPlatform:
+    """Fake `platform_iface` serving DI levels, counters and edge events from a trace.
+
+    `now` is the trace time of the record being replayed.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.levels = {}
+        self.counters = {}
+        self.listeners = {}
+
+    async def get_di_async(self, pins):
+        return [self.levels.get(p, False) for p in pins]
+
+    def get_new_pulse_counter(self, di, edge="rising"):
+        return self.counters.setdefault(di, _ReplayCounter())
+
+    def start_di_pulse_listener(self, di, callback, edge="rising", **kwargs):
+        self.listeners[di] = callback
+
+    async def deliver_edge(self, timestamp, pin):
+        """Count a recorded edge on the pin's counter and send it to any listener."""
+        self.now = timestamp
+        counter = self.counters.get(pin)
+        if counter is not None:
+            counter.count += 1
+        callback = self.listeners.get(pin)
+        if callback is not None:
+            await callback(pin, True, 0, 0, "rising")
+
+
+class _ChannelStats:
+    def __init__(self, pin, engine, truth):
+        self.pin = pin
+        self.engine = engine
+        self.truth = truth
+        self.error_sum = 0.0
+        self.error_max = 0.0
+        self.error_count = 0
+
+    def compare(self):
+        error = abs(self.engine.flow_rate - self.truth.flow_rate)
+        self.error_sum += error
+        self.error_max = max(self.error_max, error)
+        self.error_count += 1
+
+
+async def replay(
+    path,
+    mode=None,
+    pulses_per_litre=450.0,
+    debounce_ms=50,
+    reporting_interval=10,
+    acquisition_period=0.2,
+    expected_pulses=None,
+):
+    """Replay a trace file and return a report dict.
+
+    In `Polling` mode each group of recorded DI samples is one acquisition
+    read. In the other modes reads happen every `acquisition_period` seconds
+    of trace time. Recorded edges are the ground truth: they drive an ideal
+    engine that the replayed flow rate is compared against. If the trace has
+    no edges, `expected_pulses` (total over all pins) can be given instead.
+    """
+    with TraceReader(path) as reader:
+        pins = set()
+        samples = edges = 0
+        first = last = None
+        for timestamp, pin, kind, _ in reader:
+            pins.add(pin)
+            if kind == KIND_SAMPLE:
+                samples += 1
+            elif kind == KIND_EDGE:
+                edges += 1
+            if first is None:
+                first = timestamp
+            last = timestamp
+        pins = sorted(pins)
+        if not pins:
+            raise ValueError(f"{path} contains no records")
+
+        if mode is None:
+            mode = ACQUISITION_POLLING if samples else ACQUISITION_EVENTS
+        if mode == ACQUISITION_POLLING and not samples:
+            raise ValueError(f"{path} has no DI samples to replay in {ACQUISITION_POLLING} mode")
+
+        platform = ReplayPlatform()
+        channels = [
+            MeterChannel(i, f"pin_{pin}", f"Pin {pin}", pin, pulses_per_litre=pulses_per_litre, debounce_ms=debounce_ms)
+            for i, pin in enumerate(pins)
+        ]
+        backend = create_backend(mode, platform, channels, clock=lambda: platform.now)
+        await backend.start()
+        index_of = {pin: i for i, pin in enumerate(pins)}
+
+        def new_engine(debounce_s):
+            return PulseEngine(pulses_per_litre=pulses_per_litre, debounce_s=debounce_s, window_s=reporting_interval)
+
+        stats = [_ChannelStats(c.pin, new_engine(c.debounce_s), new_engine(0.0)) for c in channels]
+        ticks = 0
+
+        async def tick(now):
+            nonlocal ticks
+            platform.now = now
+            new_pulses = await backend.read(now)
+            for index, pulses in enumerate(new_pulses):
+                channel = stats[index]
+                if pulses > 0:
+                    channel.engine.add_pulses(pulses, backend.last_edge_time[index])
+                channel.engine.update(now)
+                channel.truth.update(now)
+                channel.compare()
+            ticks += 1
+
+        start = time.perf_counter()
+        sample_driven = mode == ACQUISITION_POLLING
+        pending_tick = None
+        next_tick = first + acquisition_period
+
+        for timestamp, pin, kind, level in reader:
+            if sample_driven:
+                # Each group of samples with the same timestamp is one read
+                if pending_tick is not None and (kind != KIND_SAMPLE or timestamp != pending_tick):
+                    await tick(pending_tick)
+                    pending_tick = None
+            else:
+                while timestamp > next_tick:
+                    await tick(next_tick)
+                    next_tick += acquisition_period
+
+            if kind == KIND_SAMPLE:
+                platform.levels[pin] = bool(level)
+                if sample_driven:
+                    pending_tick = timestamp
+            elif kind == KIND_EDGE:
+                stats[index_of[pin]].truth.add_pulses(1, timestamp)
+                if not sample_driven:
+                    await platform.deliver_edge(timestamp, pin)
+                    # Let the event consumer take the edge, or a fast burst overflows its queue
+                    await asyncio.sleep(0)
+
+        if pending_tick is not None:
+            await tick(pending_tick)
+        elif not sample_driven:
+            await tick(next_tick)
+        await backend.stop()
+        elapsed = time.perf_counter() - start
+
+    records = samples + edges
+    report = {
+        "mode": mode,
+        "records": records,
+        "samples": samples,
+        "edges": edges,
+        "reads": ticks,
+        "trace_duration_s": last - first,
+        "elapsed_s": elapsed,
+        "records_per_s": records / elapsed if elapsed > 0 else 0.0,
+        "speedup": (last - first) / elapsed if elapsed > 0 else 0.0,
+        "channels": [],
+    }
+    for channel in stats:
+        if edges:
+            expected = channel.truth.pulse_count
+        elif expected_pulses is not None and len(stats) == 1:
+            expected = expected_pulses
+        else:
+            expected = None
+        report["channels"].append(
+            {
+                "pin": channel.pin,
+                "pulses": channel.engine.pulse_count,
+                "expected_pulses": expected,
+                "count_error": None if expected is None else channel.engine.pulse_count - expected,
+                "flow_rate_mean_error": channel.error_sum / channel.error_count if edges and channel.error_count else None,
+                "flow_rate_max_error": channel.error_max if edges else None,
+            }
+        )
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"Mode: {report['mode']}",
+        f"Records: {report['records']} ({report['samples']} samples, {report['edges']} edges), {report['reads']} reads",
+        f"Replayed {report['trace_duration_s']:.1f} s of trace in {report['elapsed_s']:.2f} s "
+        f"({report['records_per_s']:.0f} records/s, {report['speedup']:.0f}x real time)",
+    ]
+    for channel in report["channels"]:
+        line = f"Pin {channel['pin']}: {channel['pulses']} pulses"
+        if channel["expected_pulses"] is not None:
+            line += f", expected {channel['expected_pulses']} (error {channel['count_error']:+d})"
+        if channel["flow_rate_mean_error"] is not None:
+            line += (
+                f", flow rate error mean {channel['flow_rate_mean_error']:.3f} / "
+                f"max {channel['flow_rate_max_error']:.3f} L/min"
+            )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded pulse trace faster than real time")
+    parser.add_argument("trace", help="Trace file recorded by the app")
+    parser.add_argument("--mode", choices=ACQUISITION_MODES, help="Acquisition mode to replay through")
+    parser.add_argument("--pulses-per-litre", type=float, default=450.0)
+    parser.add_argument("--debounce-ms", type=int, default=50)
+    parser.add_argument("--reporting-interval", type=float, default=10.0)
+    parser.add_argument("--acquisition-period", type=float, default=0.2)
+    parser.add_argument("--expected-pulses", type=int, help="Ground truth pulse count for traces without edges")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        replay(
+            args.trace,
+            mode=args.mode,
+            pulses_per_litre=args.pulses_per_litre,
+            debounce_ms=args.debounce_ms,
+            reporting_interval=args.reporting_interval,
+            acquisition_period=args.acquisition_period,
+            expected_pulses=args.expected_pulses,
+        )
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
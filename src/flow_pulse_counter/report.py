@@ -0,0 +1,551 @@
+"""
+Bulk totalizer and billing reports over exported counter data.
+
+Three kinds of input are read, chosen by file extension:
+
+- `.json` / `.jsonl`: history batches as published to the history channel,
+  one message per line (or a JSON list of messages, read one at a time).
+- `.csv`: per-tag exports with a `time` column (Unix seconds or ISO 8601,
+  UTC unless the time carries a `Z` or `+hh:mm` offset)
+  and `flow_rate` / `total_volume` columns, prefixed for each meter of a
+  multi-meter app (`inlet_flow_rate`, `inlet_total_volume`, ...).
+- `.bin`: pulse traces recorded by the app, counted with `PulseEngine`.
+
+Every input becomes chunks of rows of (start, duration, min rate, max rate,
+mean rate, volume), at most `chunk_rows` at a time, and each chunk is
+reduced per period with NumPy. Only the per-period totals are kept, so
+memory doesn't grow with the length of the data. Files are reported in a
+process pool:
+
+    flow-report exports/*.jsonl --period month --threshold 40 -o report.csv
+"""
+
+import argparse
+import base64
+import csv
+import itertools
+import json
+import math
+import os
+import re
+import sys
+import zlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .alert_rules import NO_FLOW_RATE
+from .engine import PulseEngine
+from .history import TIER_NAMES
+from .trace import KIND_EDGE, KIND_SAMPLE, TraceReader
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed to build reports, not to import the module
+    np = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is only needed for Parquet output
+    pyarrow = None
+
+PERIODS = ["hour", "day", "month"]
+FORMATS = ["history", "csv", "trace"]
+
+# Output columns; rates are in L/min, volumes in litres and times in seconds
+REPORT_FIELDS = (
+    "meter",
+    "period_start",
+    "covered_s",
+    "volume",
+    "mean_rate",
+    "peak_rate",
+    "min_rate",
+    "no_flow_s",
+    "exceedance_s",
+)
+
+DEFAULT_CHUNK_ROWS = 1 << 20
+# A CSV row stands for the time up to the next row, but no longer than this
+DEFAULT_MAX_GAP_S = 300.0
+
+TIER_BY_NAME = {name: seconds for seconds, name in TIER_NAMES.items()}
+
+# A UTC offset ending an ISO 8601 time: `Z`, `+hh`, `+hhmm` or `+hh:mm`
+_ISO_OFFSET = re.compile(r"(?:Z|([+-])(\d\d):?(\d\d)?)$", re.IGNORECASE)
+# Characters at the end of an ISO 8601 time that can hold its offset
+_ISO_OFFSET_WIDTH = 6
+# Length of the date in an ISO 8601 time, after which the time of day starts
+_ISO_DATE_WIDTH = 10
+
+# Characters read at a time from a JSON list export
+JSON_READ_SIZE = 1 << 16
+
+# One chunk of rows of one meter, as parallel arrays
+Rows = namedtuple("Rows", ["start", "duration", "low", "high", "mean", "volume"])
+
+# Per-period totals: covered time, volume, rate x time, peak, min, no-flow time, exceedance time
+_COVERED, _VOLUME, _AREA, _PEAK, _MIN, _NO_FLOW, _EXCEEDANCE = range(7)
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("flow-report requires numpy, install the 'analysis' extra")
+
+
+def detect_format(path):
+    suffix = Path(path).suffix.lower()
+    if suffix in (".json", ".jsonl"):
+        return "history"
+    if suffix == ".csv":
+        return "csv"
+    if suffix == ".bin":
+        return "trace"
+    raise ValueError(f"Can't tell the format of {path}, pass --format")
+
+
+def period_starts(t, period, utc_offset_s=0):
+    """Start (Unix seconds) of the period holding each time in `t`, in local time `utc_offset_s` from UTC."""
+    local = np.floor(t).astype(np.int64) + utc_offset_s
+    if period == "hour":
+        starts = local - local % 3600
+    elif period == "day":
+        starts = local - local % 86400
+    elif period == "month":
+        starts = local.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+    else:
+        raise ValueError(f"Unknown period {period!r}")
+    return starts - utc_offset_s
+
+
+class PeriodTotals:
+    """Per-period totals of one meter, built up a chunk of rows at a time.
+
+    Each chunk is sorted by period and reduced with one `bincount` or
+    `reduceat` per total, so the Python work per chunk only depends on the
+    number of periods it touches. Exceedance time counts rows whose mean
+    rate is above `threshold`, so it's exact for 1 s rows and approximate
+    for coarser buckets.
+    """
+
+    def __init__(self, period, threshold=0.0, utc_offset_s=0):
+        self.period = period
+        self.threshold = threshold
+        self.utc_offset_s = utc_offset_s
+        self.totals = {}
+
+    def add(self, rows):
+        if not len(rows.start):
+            return
+        keys = period_starts(rows.start, self.period, self.utc_offset_s)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        duration = rows.duration[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        index = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+
+        def total(weights):
+            return np.bincount(index, weights=weights, minlength=len(starts))
+
+        covered = total(duration)
+        volume = total(rows.volume[order])
+        area = total(rows.mean[order] * duration)
+        peak = np.maximum.reduceat(rows.high[order], starts)
+        low = np.minimum.reduceat(rows.low[order], starts)
+        no_flow = total(np.where(rows.high[order] <= NO_FLOW_RATE, duration, 0.0))
+        if self.threshold > 0:
+            exceedance = total(np.where(rows.mean[order] > self.threshold, duration, 0.0))
+        else:
+            exceedance = np.zeros(len(starts))
+
+        for i, key in enumerate(keys[starts].tolist()):
+            values = (covered[i], volume[i], area[i], peak[i], low[i], no_flow[i], exceedance[i])
+            self._merge(key, [float(v) for v in values])
+
+    def _merge(self, key, values):
+        existing = self.totals.get(key)
+        if existing is None:
+            self.totals[key] = values
+            return
+        for field in (_COVERED, _VOLUME, _AREA, _NO_FLOW, _EXCEEDANCE):
+            existing[field] += values[field]
+        existing[_PEAK] = max(existing[_PEAK], values[_PEAK])
+        existing[_MIN] = min(existing[_MIN], values[_MIN])
+
+    def merge(self, other):
+        for key, values in other.totals.items():
+            self._merge(key, list(values))
+
+    def rows(self, meter):
+        """Report rows for this meter, in period order."""
+        for key in sorted(self.totals):
+            covered, volume, area, peak, low, no_flow, exceedance = self.totals[key]
+            yield (
+                meter,
+                key,
+                round(covered, 3),
+                round(volume, 4),
+                round(area / covered, 4) if covered > 0 else 0.0,
+                round(peak, 4),
+                round(low, 4),
+                round(no_flow, 3),
+                round(exceedance, 3),
+            )
+
+
+def _json_list_items(f, read_size=JSON_READ_SIZE):
+    """Yield the items of the JSON list in a text file one at a time, without loading the whole list."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(read_size).lstrip()[1:]  # past the "["
+    at_end = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith("]"):
+            return
+        if buffer.startswith(","):
+            buffer = buffer[1:]
+            continue
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if at_end:
+                raise
+            end = None
+        if end is None or (end == len(buffer) and not at_end):
+            # The item may run past the buffer; reading as much again keeps a long item linear
+            more = f.read(max(read_size, len(buffer)))
+            at_end = not more
+            buffer += more
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def _history_messages(path):
+    with open(path, encoding="utf-8") as f:
+        head = f.read(64).lstrip()
+        f.seek(0)
+        if head.startswith("["):
+            yield from _json_list_items(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_history(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield (meter, tier seconds, Rows) from exported history channel messages.
+
+    Every tier is yielded; a report should only count one tier per meter.
+    """
+    prefix = Path(path).stem
+    for message in _history_messages(path):
+        data = message["data"]
+        if message.get("encoding") == "zlib+base64":
+            data = json.loads(zlib.decompress(base64.b64decode(data)))
+        for meter, tiers in data.items():
+            for tier, buckets in tiers.items():
+                period_s = TIER_BY_NAME[tier]
+                for first in range(0, len(buckets), chunk_rows):
+                    # start, samples, min, max, mean, volume
+                    block = np.asarray(buckets[first : first + chunk_rows], dtype=np.float64)
+                    duration = np.full(len(block), float(period_s))
+                    rows = Rows(block[:, 0], duration, block[:, 2], block[:, 3], block[:, 4], block[:, 5])
+                    yield f"{prefix}/{meter}", period_s, rows
+
+
+def _totalizer_rows(t, rates, totals, max_gap_s):
+    """Rows between consecutive readings of a rate and a cumulative total.
+
+    The last reading only starts the next chunk. A total that goes
+    backwards was reset, and adds no volume.
+    """
+    duration = np.minimum(np.diff(t), max_gap_s)
+    volume = np.maximum(np.diff(totals), 0.0)
+    rate = rates[:-1]
+    return Rows(t[:-1], duration, rate, rate, rate, volume)
+
+
+def _csv_meters(header):
+    """(meter, rate column, total column) for each meter in a CSV header."""
+    columns = {name.strip(): i for i, name in enumerate(header)}
+    meters = []
+    for name, index in columns.items():
+        if name.endswith("flow_rate"):
+            meter = name[: -len("flow_rate")]
+            total = columns.get(meter + "total_volume")
+            if total is not None:
+                meters.append((meter.rstrip("_") or "meter", index, total))
+    return meters
+
+
+def _iso_seconds(times):
+    """Unix seconds from an array of ISO 8601 times, applying any `Z` or `+hh:mm` offset.
+
+    NumPy only parses times without an offset, and warns about one, so each
+    offset is cut off and applied here. The offsets are read from the
+    distinct endings of the times, which an export only has a few of.
+    """
+    times = np.char.strip(times)
+    width = times.dtype.itemsize // 4
+    if width <= _ISO_DATE_WIDTH:
+        # Dates only, with no time of day to carry an offset
+        return times.astype("datetime64[ms]").astype(np.int64) / 1000.0
+
+    codes = times.view(np.uint32).reshape(len(times), width).copy()
+    lengths = np.count_nonzero(codes, axis=1)
+    has_time = (lengths > _ISO_DATE_WIDTH) & np.isin(codes[:, _ISO_DATE_WIDTH], [ord("T"), ord("t"), ord(" ")])
+
+    columns = lengths[:, None] + np.arange(-_ISO_OFFSET_WIDTH, 0)
+    tails = np.take_along_axis(codes, np.maximum(columns, 0), axis=1)
+    tails[columns < 0] = 0
+    endings, inverse = np.unique(tails.view(f"<U{_ISO_OFFSET_WIDTH}").ravel(), return_inverse=True)
+    cut = np.zeros(len(endings), dtype=np.int64)
+    offset = np.zeros(len(endings))
+    for i, ending in enumerate(endings.tolist()):
+        match = _ISO_OFFSET.search(ending)
+        if match is None:
+            continue
+        cut[i] = len(match.group(0))
+        sign, hours, minutes = match.groups()
+        if sign is not None:
+            offset[i] = (1 if sign == "+" else -1) * (int(hours) * 3600 + int(minutes or 0) * 60)
+    cut = np.where(has_time, cut[inverse.ravel()], 0)
+    offset = np.where(has_time, offset[inverse.ravel()], 0.0)
+
+    codes[np.arange(width) >= (lengths - cut)[:, None]] = 0
+    local = codes.view(f"<U{width}").ravel()
+    return local.astype("datetime64[ms]").astype(np.int64) / 1000.0 - offset
+
+
+def _is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
+
+
+def read_csv(path, chunk_rows=DEFAULT_CHUNK_ROWS, max_gap_s=DEFAULT_MAX_GAP_S):
+    """Yield (meter, Rows) from a CSV export of counter tags, in time order.
+
+    Chunks of lines are parsed by NumPy's C reader; only ISO 8601 times are
+    read as text, and converted in one go.
+    """
+    prefix = Path(path).stem
+    with open(path, newline="", encoding="utf-8") as f:
+        columns = [name.strip() for name in next(csv.reader([f.readline()]))]
+        time_column = next((i for i, name in enumerate(columns) if name in ("time", "timestamp")), None)
+        meters = _csv_meters(columns)
+        if time_column is None or not meters:
+            raise ValueError(f"{path} needs a time column and flow_rate / total_volume columns")
+        value_columns = sorted({c for _, rate, total in meters for c in (rate, total)})
+        position = {column: i for i, column in enumerate(value_columns)}
+
+        numeric_times = None
+        carry = None
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            if numeric_times is None:
+                numeric_times = _is_number(lines[0].split(",")[time_column])
+            if numeric_times:
+                t = np.loadtxt(lines, delimiter=",", usecols=time_column, dtype=np.float64, ndmin=1)
+            else:
+                t = _iso_seconds(np.loadtxt(lines, delimiter=",", usecols=time_column, dtype=str, ndmin=1))
+            block = np.loadtxt(lines, delimiter=",", usecols=value_columns, dtype=np.float64, ndmin=2)
+            values = {m: (block[:, position[r]], block[:, position[v]]) for m, r, v in meters}
+            if carry is not None:
+                # The previous chunk's last reading starts this chunk's first row
+                t = np.r_[carry[0], t]
+                values = {m: (np.r_[carry[1][m][0], r], np.r_[carry[1][m][1], v]) for m, (r, v) in values.items()}
+            for meter, (rates, totals) in values.items():
+                yield f"{prefix}/{meter}", _totalizer_rows(t, rates, totals, max_gap_s)
+            carry = (t[-1], {m: (r[-1], v[-1]) for m, (r, v) in values.items()})
+
+
+def read_trace(
+    path,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+    pulses_per_litre=450.0,
+    debounce_ms=50,
+    window_s=10.0,
+    max_gap_s=DEFAULT_MAX_GAP_S,
+):
+    """Yield (meter, Rows) from a recorded pulse trace, counting each pin with its own `PulseEngine`.
+
+    Pins with recorded samples are counted from the samples; pins with only
+    edges (`Pulse Stream` and `Events` traces) count each edge as a pulse.
+    """
+    prefix = Path(path).stem
+    with TraceReader(path) as reader:
+        # Views of the mapped file must be gone before the reader closes it
+        yield from _trace_rows(prefix, reader.arrays(), chunk_rows, pulses_per_litre, debounce_ms, window_s, max_gap_s)
+
+
+def _trace_rows(prefix, records, chunk_rows, pulses_per_litre, debounce_ms, window_s, max_gap_s):
+    sampled = set()
+    for first in range(0, len(records), chunk_rows):
+        chunk = records[first : first + chunk_rows]
+        sampled.update(np.unique(chunk["pin"][chunk["kind"] == KIND_SAMPLE]).tolist())
+
+    engines = {}
+    carry = {}
+    for first in range(0, len(records), chunk_rows):
+        chunk = records[first : first + chunk_rows]
+        for pin in np.unique(chunk["pin"]).tolist():
+            engine = engines.get(pin)
+            if engine is None:
+                engine = engines[pin] = PulseEngine(
+                    pulses_per_litre=pulses_per_litre, debounce_s=debounce_ms / 1000.0, window_s=window_s
+                )
+            mine = chunk[chunk["pin"] == pin]
+            if pin in sampled:
+                mine = mine[mine["kind"] == KIND_SAMPLE]
+                t, levels = mine["time"], mine["level"]
+            else:
+                # Each edge becomes a rising and a falling level at its own time
+                mine = mine[mine["kind"] == KIND_EDGE]
+                t = np.repeat(mine["time"], 2)
+                levels = np.tile(np.array([1, 0], dtype=np.uint8), len(mine))
+            if not len(t):
+                continue
+            result = engine.feed_batch(t, levels)
+            rates, totals = result.flow_rates, result.volumes
+            if pin in carry:
+                last_t, last_rate, last_total = carry[pin]
+                t, rates, totals = np.r_[last_t, t], np.r_[last_rate, rates], np.r_[last_total, totals]
+            yield f"{prefix}/pin{pin}", _totalizer_rows(t, rates, totals, max_gap_s)
+            carry[pin] = (t[-1], rates[-1], totals[-1])
+
+
+def report_file(path, file_format=None, period="day", threshold=0.0, utc_offset_s=0, **options):
+    """Per-period totals of every meter in one file, as {meter: PeriodTotals}."""
+    _require_numpy()
+    file_format = file_format or detect_format(path)
+    meters = {}
+
+    def totals_for(meter, into):
+        totals = into.get(meter)
+        if totals is None:
+            totals = into[meter] = PeriodTotals(period, threshold, utc_offset_s)
+        return totals
+
+    if file_format == "history":
+        chunk_rows = options.get("chunk_rows", DEFAULT_CHUNK_ROWS)
+        # Every uploaded tier covers the same time, so only the finest of each meter is counted
+        by_tier = {}
+        for meter, period_s, rows in read_history(path, chunk_rows):
+            totals_for(meter, by_tier.setdefault(period_s, {})).add(rows)
+        for period_s in sorted(by_tier, reverse=True):
+            meters.update(by_tier[period_s])
+        return meters
+
+    if file_format == "csv":
+        chunks = read_csv(path, **_only(options, "chunk_rows", "max_gap_s"))
+    elif file_format == "trace":
+        chunks = read_trace(
+            path, **_only(options, "chunk_rows", "pulses_per_litre", "debounce_ms", "window_s", "max_gap_s")
+        )
+    else:
+        raise ValueError(f"Unknown format {file_format!r}")
+    for meter, rows in chunks:
+        totals_for(meter, meters).add(rows)
+    return meters
+
+
+def _only(options, *names):
+    return {name: options[name] for name in names if name in options}
+
+
+def _report_file_job(job):
+    path, kwargs = job
+    return report_file(path, **kwargs)
+
+
+def build_report(paths, workers=None, **kwargs):
+    """Report every file, `workers` at a time in a process pool, and merge meters seen in several files.
+
+    Returns the report rows, sorted by meter and period.
+    """
+    _require_numpy()
+    jobs = [(str(path), kwargs) for path in paths]
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    if workers == 1:
+        results = map(_report_file_job, jobs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_report_file_job, jobs)
+
+    merged = {}
+    try:
+        for meters in results:
+            for meter, totals in meters.items():
+                if meter in merged:
+                    merged[meter].merge(totals)
+                else:
+                    merged[meter] = totals
+    finally:
+        if workers > 1:
+            pool.shutdown()
+
+    rows = []
+    for meter in sorted(merged):
+        rows.extend(merged[meter].rows(meter))
+    return rows
+
+
+def write_csv(rows, output):
+    writer = csv.writer(output)
+    writer.writerow(REPORT_FIELDS)
+    writer.writerows(rows)
+
+
+def write_parquet(rows, path):
+    if pyarrow is None:
+        raise ImportError("Parquet output requires pyarrow")
+    columns = list(zip(*rows)) if rows else [()] * len(REPORT_FIELDS)
+    table = pyarrow.table({name: list(column) for name, column in zip(REPORT_FIELDS, columns)})
+    pyarrow.parquet.write_table(table, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build per-period volume reports from exported counter data")
+    parser.add_argument("files", nargs="+", help="History exports (.json/.jsonl), tag exports (.csv) or traces (.bin)")
+    parser.add_argument("--format", choices=FORMATS, help="Input format, by default from each file's extension")
+    parser.add_argument("--period", choices=PERIODS, default="day")
+    parser.add_argument("--utc-offset", type=float, default=0.0, help="Hours from UTC of the periods' local time")
+    parser.add_argument("--threshold", type=float, default=0.0, help="Flow rate (L/min) for the exceedance time")
+    parser.add_argument("--max-gap", type=float, default=DEFAULT_MAX_GAP_S, help="Longest time a reading covers (s)")
+    parser.add_argument("--pulses-per-litre", type=float, default=450.0, help="For traces")
+    parser.add_argument("--debounce-ms", type=int, default=50, help="For traces")
+    parser.add_argument("--workers", type=int, help="Files reported in parallel (default: one per core)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("-o", "--output", help="Output file, .csv or .parquet (default: CSV on stdout)")
+    args = parser.parse_args(argv)
+
+    rows = build_report(
+        args.files,
+        workers=args.workers,
+        file_format=args.format,
+        period=args.period,
+        threshold=args.threshold,
+        utc_offset_s=int(math.floor(args.utc_offset * 3600)),
+        chunk_rows=args.chunk_rows,
+        max_gap_s=args.max_gap,
+        pulses_per_litre=args.pulses_per_litre,
+        debounce_ms=args.debounce_ms,
+    )
+    if args.output and args.output.endswith(".parquet"):
+        write_parquet(rows, args.output)
+    elif args.output:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            write_csv(rows, f)
+    else:
+        write_csv(rows, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import logging
+import math
+from array import array
+from collections import namedtuple
+
+from pydoover.utils import generate_diff
+
+from .alert_rules import NO_FLOW_RATE, AlertRule
+from .channels import _element_value
+
+log = logging.getLogger(__name__)
+
+ROLE_INLET = "Inlet"
+ROLE_OUTLET = "Outlet"
+ROLE_MONITOR = "Monitor"
+
+ROLES = [ROLE_INLET, ROLE_OUTLET, ROLE_MONITOR]
+
+RULE_LOSS = "imbalance_loss"
+RULE_GAIN = "imbalance_gain"
+
+# The balance is one alert channel of its own
+BALANCE_CHANNEL = 0
+
+# One counter feeding the rollup: a meter of a Flow Pulse Counter app. `meter`
+# is the meter's key, empty for an app counting a single meter.
+Source = namedtuple("Source", ["app_key", "meter", "role", "name"])
+
+
+def source_tag(source, name):
+    """Name of one of a source's counter tags, as its app publishes it."""
+    return f"{source.meter}_{name}" if source.meter else name
+
+
+def build_sources(config):
+    """Build the list of sources from the aggregator config, skipping any without an app key."""
+    sources = []
+    for index, element in enumerate(config.sources.elements):
+        app_key = _element_value(element.app_key, "")
+        if not app_key:
+            log.warning("Ignoring source %d without an app key", index + 1)
+            continue
+        meter = _element_value(element.meter_key, "")
+        name = _element_value(element.source_name) or (f"{app_key}/{meter}" if meter else app_key)
+        sources.append(Source(app_key, meter, _element_value(element.role, ROLE_INLET), name))
+    return sources
+
+
+def imbalance_rules(threshold_pct, hysteresis, min_on_s, min_off_s, cooldown_s):
+    """Rules flagging outlet flow below (loss) or above (gain) the inlet flow by `threshold_pct`.
+
+    `hysteresis` is a fraction of the threshold.
+    """
+    if threshold_pct <= 0:
+        return []
+    off = threshold_pct * (1.0 - hysteresis)
+    return [
+        AlertRule(
+            BALANCE_CHANNEL,
+            RULE_LOSS,
+            threshold_pct,
+            math.inf,
+            off,
+            math.inf,
+            min_on_s,
+            min_off_s,
+            cooldown_s,
+            "Flow imbalance: outlets {value:.1f}% below inlets, possible loss",
+        ),
+        AlertRule(
+            BALANCE_CHANNEL,
+            RULE_GAIN,
+            -math.inf,
+            -threshold_pct,
+            -math.inf,
+            -off,
+            min_on_s,
+            min_off_s,
+            cooldown_s,
+            "Flow imbalance: outlets {value:.1f}% above inlets, check the meters",
+        ),
+    ]
+
+
+class SiteRollup:
+    """Running site totals and the inlet/outlet balance over many counters.
+
+    Each source keeps the last flow rate, total volume and pulse count seen
+    from its counter, and an update only adds the difference from those to
+    the site sums. The work per update is constant however many sources
+    there are, and `apply` only updates the sources whose tags changed since
+    the last message.
+
+    Site volumes count from the first value seen from each source, so a
+    source's own history before it joined isn't counted. A total that goes
+    backwards (its counter's totals were reset) only moves that source's
+    baseline. The rate sums are recomputed exactly with `math.fsum` every
+    `RESUM_INTERVAL` updates, so rounding can't drift over months of updates.
+    """
+
+    RESUM_INTERVAL = 10000
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        n = len(self.sources)
+        self.by_app = {}
+        for index, source in enumerate(self.sources):
+            self.by_app.setdefault(source.app_key, []).append(index)
+
+        self.inlet = bytearray(s.role == ROLE_INLET for s in self.sources)
+        self.outlet = bytearray(s.role == ROLE_OUTLET for s in self.sources)
+        self.tags = [
+            (source_tag(s, "flow_rate"), source_tag(s, "total_volume"), source_tag(s, "pulse_count"))
+            for s in self.sources
+        ]
+
+        self.rates = array("d", bytes(8 * n))
+        # NaN until a source's first total arrives
+        self.volumes = array("d", [math.nan]) * n
+        # -1 until a source's first pulse count arrives
+        self.pulses = array("q", [-1]) * n
+        self.seen = bytearray(n)
+        # Each configured app's tags as of the last message
+        self.last_tags = {}
+        self.unseen_balance = sum(self.inlet) + sum(self.outlet)
+        self.has_balance = any(self.inlet) and any(self.outlet)
+
+        self.total_rate = 0.0
+        self.inlet_rate = 0.0
+        self.outlet_rate = 0.0
+        self.total_volume = 0.0
+        self.inlet_volume = 0.0
+        self.outlet_volume = 0.0
+        self.total_pulses = 0
+        self.resets = 0
+        self.updates = 0
+
+    def apply(self, tag_values):
+        """Apply a tag bus message of `{app_key: {tag: value}}`, touching only the configured sources.
+
+        Every message carries every app's tags, so it is diffed against the
+        last one and only the sources with a changed tag are updated.
+        """
+        for app_key, indexes in self.by_app.items():
+            tags = tag_values.get(app_key)
+            if not tags:
+                continue
+            changed = generate_diff(self.last_tags.get(app_key, {}), tags, do_delete=False)
+            if not changed:
+                continue
+            self.last_tags[app_key] = dict(tags)
+            for index in indexes:
+                rate_tag, volume_tag, pulse_tag = self.tags[index]
+                if rate_tag in changed or volume_tag in changed or pulse_tag in changed:
+                    self.update(index, changed.get(rate_tag), changed.get(volume_tag), changed.get(pulse_tag))
+
+    def update(self, index, flow_rate=None, total_volume=None, pulse_count=None):
+        """Apply one source's latest counter values; None leaves a value as it was."""
+        if flow_rate is not None:
+            delta = float(flow_rate) - self.rates[index]
+            if delta:
+                self.rates[index] += delta
+                self.total_rate += delta
+                if self.inlet[index]:
+                    self.inlet_rate += delta
+                elif self.outlet[index]:
+                    self.outlet_rate += delta
+
+        if total_volume is not None:
+            total_volume = float(total_volume)
+            previous = self.volumes[index]
+            self.volumes[index] = total_volume
+            if previous != previous:  # NaN, the first total only sets the baseline
+                if not self.seen[index]:
+                    self.seen[index] = 1
+                    if self.inlet[index] or self.outlet[index]:
+                        self.unseen_balance -= 1
+            elif total_volume < previous:
+                self.resets += 1
+                log.info(
+                    "Totals of %r went back from %.2f to %.2f L, rebasing",
+                    self.sources[index].name,
+                    previous,
+                    total_volume,
+                )
+            elif total_volume > previous:
+                delta = total_volume - previous
+                self.total_volume += delta
+                if self.inlet[index]:
+                    self.inlet_volume += delta
+                elif self.outlet[index]:
+                    self.outlet_volume += delta
+
+        if pulse_count is not None:
+            pulse_count = int(pulse_count)
+            previous = self.pulses[index]
+            self.pulses[index] = pulse_count
+            if previous >= 0 and pulse_count > previous:
+                self.total_pulses += pulse_count - previous
+
+        self.updates += 1
+        if self.updates % self.RESUM_INTERVAL == 0:
+            self._resum_rates()
+
+    def _resum_rates(self):
+        rates = self.rates
+        self.total_rate = math.fsum(rates)
+        self.inlet_rate = math.fsum(r for r, inlet in zip(rates, self.inlet) if inlet)
+        self.outlet_rate = math.fsum(r for r, outlet in zip(rates, self.outlet) if outlet)
+
+    @property
+    def balanced(self):
+        """True once every inlet and outlet has reported, so the balance means something."""
+        return self.has_balance and self.unseen_balance == 0
+
+    @property
+    def imbalance(self):
+        """Inlet minus outlet flow as a percentage of the larger, 0 without flow or before every meter reports."""
+        larger = max(self.inlet_rate, self.outlet_rate)
+        if not self.balanced or larger <= NO_FLOW_RATE:
+            return 0.0
+        return (self.inlet_rate - self.outlet_rate) / larger * 100.0
+
+    @property
+    def unaccounted_volume(self):
+        """Inlet volume that didn't reach an outlet, in litres."""
+        return self.inlet_volume - self.outlet_volume
+
+    def restore(self, total_volume, inlet_volume, outlet_volume):
+        """Carry the site volumes on from a previous run."""
+        self.total_volume = total_volume
+        self.inlet_volume = inlet_volume
+        self.outlet_volume = outlet_volume
+
+    def reset_volumes(self):
+        self.total_volume = 0.0
+        self.inlet_volume = 0.0
+        self.outlet_volume = 0.0
+        self.total_pulses = 0
+
+    def stats(self):
+        return {
+            "sources": len(self.sources),
+            "sources_reporting": sum(self.seen),
+            "source_updates": self.updates,
+            "source_resets": self.resets,
+        }
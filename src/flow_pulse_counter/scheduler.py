@@ -0,0 +1,112 @@
+# Shortest acquisition period in seconds the config can ask for
+MIN_ACQUISITION_PERIOD = 0.001
+
+
+class AdaptiveScheduler:
+    """Choose the acquisition period from the observed pulse frequency.
+
+    With no flow for `idle_after_s` the period backs off to `idle_period_s`,
+    saving DI reads while nothing is happening. While pulses are arriving it
+    runs at `base_period_s`, and when sampling (polling) a pulse input it
+    tightens further so each pulse is seen by at least `samples_per_pulse`
+    reads. The period never drops below `min_period_s`, nor below the point
+    where reads would take more than `cpu_budget` of the time.
+
+    A sampled input that needs a shorter period than that is
+    `sampling_limited`: pulses are being missed or aliased. `aliasing_risk`
+    is the observed pulse frequency as a fraction of the Nyquist frequency
+    of the current period; counters and edge events can't alias, so it
+    stays at 0 for them.
+    """
+
+    __slots__ = (
+        "base_period_s",
+        "min_period_s",
+        "idle_period_s",
+        "idle_after_s",
+        "cpu_budget",
+        "samples_per_pulse",
+        "sampled",
+        "period",
+        "read_time",
+        "pulse_hz",
+        "aliasing_risk",
+        "sampling_limited",
+        "last_flow",
+    )
+
+    # Weight of the newest read in the read time average
+    READ_TIME_SMOOTHING = 0.2
+    # Largest step up in period per update, so the period relaxes gradually
+    MAX_BACKOFF = 1.5
+
+    def __init__(
+        self,
+        base_period_s=0.2,
+        min_period_s=0.02,
+        idle_period_s=1.0,
+        idle_after_s=10.0,
+        cpu_budget=0.2,
+        samples_per_pulse=4.0,
+        sampled=True,
+    ):
+        if not 0 < min_period_s <= base_period_s <= idle_period_s:
+            raise ValueError("Periods must satisfy 0 < min_period_s <= base_period_s <= idle_period_s")
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be a fraction between 0 and 1")
+        self.base_period_s = base_period_s
+        self.min_period_s = min_period_s
+        self.idle_period_s = idle_period_s
+        self.idle_after_s = idle_after_s
+        self.cpu_budget = cpu_budget
+        self.samples_per_pulse = samples_per_pulse
+        self.sampled = sampled
+
+        self.period = base_period_s
+        self.read_time = 0.0
+        self.pulse_hz = 0.0
+        self.aliasing_risk = 0.0
+        self.sampling_limited = False
+        self.last_flow = None
+
+    @property
+    def floor(self):
+        """Shortest period allowed by the configured minimum and the CPU budget."""
+        return max(self.min_period_s, self.read_time / self.cpu_budget)
+
+    def update(self, now, pulse_hz, read_s):
+        """Record the latest pulse frequency and read duration, and return the next period."""
+        self.read_time += self.READ_TIME_SMOOTHING * (read_s - self.read_time)
+        self.pulse_hz = pulse_hz
+        floor = self.floor
+
+        if pulse_hz > 0:
+            self.last_flow = now
+            target = self.base_period_s
+            required = None
+            if self.sampled:
+                required = 1.0 / (self.samples_per_pulse * pulse_hz)
+                target = min(target, required)
+            self.sampling_limited = required is not None and required < floor
+        else:
+            idle = self.last_flow is None or (now - self.last_flow) >= self.idle_after_s
+            target = self.idle_period_s if idle else self.base_period_s
+            self.sampling_limited = False
+
+        target = max(target, floor)
+        if target > self.period:
+            # Tighten straight away, relax a step at a time
+            target = min(target, self.period * self.MAX_BACKOFF)
+        self.period = target
+
+        self.aliasing_risk = min(1.0, 2.0 * pulse_hz * self.period) if self.sampled else 0.0
+        return self.period
+
+    def stats(self):
+        return {
+            "acquisition_period_ms": round(self.period * 1000.0, 1),
+            "acquisition_read_ms": round(self.read_time * 1000.0, 2),
+            "pulse_frequency_hz": round(self.pulse_hz, 2),
+            "aliasing_risk": round(self.aliasing_risk, 3),
+            "sampling_limited": self.sampling_limited,
+        }
@@ -0,0 +1,208 @@
+import logging
+
+from .acquisition import LEGACY_ACQUISITION_MODES
+from .channels import build_channels
+from .engine import FLOW_RATE_FACTORS
+from .history import TIER_NAMES
+from .scheduler import MIN_ACQUISITION_PERIOD
+
+log = logging.getLogger(__name__)
+
+# Settings that are only read at startup; a change to them waits for a restart
+RESTART_FIELDS = frozenset(
+    (
+        "acquisition_mode",
+        "counter_bits",
+        "acquisition_shards",
+        "resync_counters",
+        "auto_debounce",
+        "trace_file",
+        "journal_directory",
+        "history_directory",
+        "history_channel",
+        "history_upload_from_s",
+        "instrumentation",
+        "metrics_port",
+        "batch_output_pin",
+        "batch_meter",
+    )
+)
+
+# Settings the alert rules are compiled from
+ALERT_FIELDS = frozenset(
+    (
+        "channels",
+        "low_flow_lpm",
+        "high_flow_lpm",
+        "alert_hysteresis",
+        "alert_on_delay",
+        "alert_off_delay",
+        "alert_cooldown",
+        "continuous_flow_alert_hours",
+        "no_flow_alert_hours",
+    )
+)
+
+
+class RuntimeSettings:
+    """Immutable snapshot of the app config, compiled once for the hot paths.
+
+    Reading a pydoover config element goes through a property each time,
+    and the flow rate unit would otherwise be compared as a string on every
+    tick. The snapshot holds plain values with the derived constants worked
+    out up front: the unit as a factor from L/min, the deadband and
+    hysteresis as fractions, and each meter's flow thresholds in L/min.
+
+    A new snapshot is compiled when the deployment config changes, and the
+    app swaps it in whole between loop iterations.
+    """
+
+    __slots__ = (
+        "display_name",
+        "channels",
+        "low_flow_lpm",
+        "high_flow_lpm",
+        "acquisition_mode",
+        "counter_bits",
+        "acquisition_shards",
+        "resync_counters",
+        "min_acquisition_period",
+        "idle_acquisition_period",
+        "acquisition_cpu_budget",
+        "flow_rate_unit",
+        "flow_rate_factor",
+        "auto_debounce",
+        "reporting_interval",
+        "no_flow_periods",
+        "alert_hysteresis",
+        "alert_on_delay",
+        "alert_off_delay",
+        "alert_cooldown",
+        "continuous_flow_alert_hours",
+        "no_flow_alert_hours",
+        "batch_output_pin",
+        "batch_meter",
+        "batch_initial_latency",
+        "batch_settle_time",
+        "flow_deadband",
+        "volume_deadband",
+        "max_staleness",
+        "journal_directory",
+        "journal_sync_interval",
+        "history_directory",
+        "history_upload_interval",
+        "history_upload_from_s",
+        "history_channel",
+        "trace_file",
+        "instrumentation",
+        "metrics_port",
+        "profile_directory",
+    )
+
+    def __init__(self, **values):
+        missing = set(self.__slots__) - values.keys()
+        if missing:
+            raise TypeError(f"Missing settings: {', '.join(sorted(missing))}")
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuntimeSettings is immutable, compile a new snapshot instead")
+
+    def __eq__(self, other):
+        if not isinstance(other, RuntimeSettings):
+            return NotImplemented
+        return not self.changed(other)
+
+    __hash__ = None
+
+    @property
+    def batching(self):
+        return self.batch_output_pin is not None and self.batch_output_pin >= 0
+
+    def changed(self, other):
+        """Names of the settings that differ from `other`."""
+        return {name for name in self.__slots__ if getattr(self, name) != getattr(other, name)}
+
+    def replace(self, **values):
+        """A copy of the snapshot with some settings replaced."""
+        return RuntimeSettings(**{**{name: getattr(self, name) for name in self.__slots__}, **values})
+
+    def same_meters(self, other):
+        """True if both snapshots count the same inputs under the same names."""
+        return [(c.key, c.pin) for c in self.channels] == [(c.key, c.pin) for c in other.channels]
+
+
+def _clamped(name, value, low, high):
+    """`value` limited to [low, high], with a warning when it was outside."""
+    if low <= value <= high:
+        return value
+    clamped = min(max(value, low), high)
+    log.warning("%s of %s is outside %s to %s, using %s", name, value, low, high, clamped)
+    return clamped
+
+
+def _acquisition_mode(mode):
+    """The acquisition mode, with an earlier name of a mode replaced by its current one."""
+    current = LEGACY_ACQUISITION_MODES.get(mode)
+    if current is None:
+        return mode
+    log.warning("Acquisition mode %r has been renamed %r, update the config", mode, current)
+    return current
+
+
+def compile_settings(config):
+    """Compile the app config into a `RuntimeSettings` snapshot."""
+    unit = config.flow_rate_unit.value
+    factor = FLOW_RATE_FACTORS.get(unit, 1.0)
+    channels = tuple(build_channels(config))
+    resolution = config.history_upload_resolution.value
+
+    return RuntimeSettings(
+        display_name=config.app_display_name.value,
+        channels=channels,
+        # Thresholds are set in the display unit, the engines measure L/min
+        low_flow_lpm=tuple(c.low_flow_threshold / factor for c in channels),
+        high_flow_lpm=tuple(c.high_flow_threshold / factor for c in channels),
+        acquisition_mode=_acquisition_mode(config.acquisition_mode.value),
+        counter_bits=config.counter_bits.value,
+        acquisition_shards=config.acquisition_shards.value,
+        resync_counters=config.resync_counters.value,
+        # Out of range, these would make the acquisition scheduler refuse to start
+        min_acquisition_period=_clamped(
+            "Min Acquisition Period", config.min_acquisition_period.value, MIN_ACQUISITION_PERIOD, float("inf")
+        ),
+        idle_acquisition_period=_clamped(
+            "Idle Acquisition Period", config.idle_acquisition_period.value, MIN_ACQUISITION_PERIOD, float("inf")
+        ),
+        acquisition_cpu_budget=_clamped("Acquisition CPU Budget", config.acquisition_cpu_budget.value, 1.0, 100.0)
+        / 100.0,
+        flow_rate_unit=unit,
+        flow_rate_factor=factor,
+        auto_debounce=config.auto_debounce.value,
+        reporting_interval=config.reporting_interval.value,
+        no_flow_periods=config.no_flow_periods.value,
+        alert_hysteresis=config.alert_hysteresis.value / 100.0,
+        alert_on_delay=config.alert_on_delay.value,
+        alert_off_delay=config.alert_off_delay.value,
+        alert_cooldown=config.alert_cooldown.value,
+        continuous_flow_alert_hours=config.continuous_flow_alert_hours.value,
+        no_flow_alert_hours=config.no_flow_alert_hours.value,
+        batch_output_pin=config.batch_output_pin.value,
+        batch_meter=config.batch_meter.value,
+        batch_initial_latency=config.batch_initial_latency.value,
+        batch_settle_time=config.batch_settle_time.value,
+        flow_deadband=config.ui_flow_deadband.value / 100.0,
+        volume_deadband=config.ui_volume_deadband.value,
+        max_staleness=config.ui_max_staleness.value,
+        journal_directory=config.journal_directory.value,
+        journal_sync_interval=config.journal_sync_interval.value,
+        history_directory=config.history_directory.value,
+        history_upload_interval=config.history_upload_interval.value,
+        history_upload_from_s=next((s for s, name in TIER_NAMES.items() if name == resolution), 60),
+        history_channel=config.history_channel.value,
+        trace_file=config.trace_file.value,
+        instrumentation=config.instrumentation.value,
+        metrics_port=config.metrics_port.value,
+        profile_directory=config.profile_directory.value,
+    )
@@ -0,0 +1,276 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from .acquisition import ACQUISITION_POLLING, AcquisitionBackend, create_backend
+from .platform_client import PlatformClient, PlatformUnavailable
+from .scheduler import AdaptiveScheduler
+
+log = logging.getLogger(__name__)
+
+# Workers are spawned, not forked: the app's process holds an event loop and gRPC threads
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+DEFAULT_HEARTBEAT_TIMEOUT = 10.0
+DEFAULT_SUPERVISE_INTERVAL = 1.0
+
+
+def platform_factory(platform_iface):
+    """Picklable factory that opens a worker's own connection to the app's platform interface."""
+    return functools.partial(type(platform_iface), platform_iface.app_key, platform_iface.uri, True)
+
+
+def shard_groups(count, shards):
+    """Split `count` channels into `shards` contiguous (first, stop) index ranges of near equal size."""
+    shards = max(1, min(shards, count))
+    size, extra = divmod(count, shards)
+    groups = []
+    first = 0
+    for shard in range(shards):
+        stop = first + size + (1 if shard < extra else 0)
+        groups.append((first, stop))
+        first = stop
+    return groups
+
+
+class SharedCounters:
+    """Per-channel acquisition state in one shared memory block.
+
+    Each channel has its cumulative pulse count, the timestamp of its latest
+    pulse and its debounce. Each shard has a heartbeat, the time of its
+    worker's latest read.
+
+    Every slot has a single writer: a channel's counts are only written by
+    the worker owning it and its debounce only by the app, so plain 8-byte
+    stores are enough and nothing is locked. The edge time is written before
+    the count, so a reader that sees a new count also sees its edge.
+    """
+
+    def __init__(self, channels, shards, name=None):
+        self.channels = channels
+        self.shards = shards
+        size = 8 * (3 * channels + shards)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        step = 8 * channels
+        self.counts = buf[0:step].cast("q")
+        self.edge_times = buf[step : 2 * step].cast("d")
+        self.debounce = buf[2 * step : 3 * step].cast("d")
+        self.heartbeats = buf[3 * step : size].cast("d")
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        for view in (self.counts, self.edge_times, self.debounce, self.heartbeats):
+            view.release()
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def run_shard(name, layout, shard, first, channels, mode, counter_bits, resync_counters, factory, schedule, parent_pid):
+    """Worker process entry point: acquire `channels`, starting at channel `first`, into shared memory.
+
+    `layout` is the (channels, shards) size of the shared block called `name`.
+    """
+    try:
+        asyncio.run(
+            _acquire_shard(
+                name, layout, shard, first, channels, mode, counter_bits, resync_counters, factory, schedule, parent_pid
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+async def _acquire_shard(
+    name, layout, shard, first, channels, mode, counter_bits, resync_counters, factory, schedule, parent_pid
+):
+    shared = SharedCounters(*layout, name=name)
+    platform = PlatformClient(factory())
+    backend = create_backend(mode, platform, channels, counter_bits=counter_bits, resync_counters=resync_counters)
+    counts, edge_times, debounce = shared.counts, shared.edge_times, shared.debounce
+    indexes = range(first, first + len(channels))
+    try:
+        # Carry on from where a previous worker for this shard stopped
+        for i, index in enumerate(indexes):
+            backend.last_edge_time[i] = edge_times[index]
+        await backend.start()
+
+        scheduler = AdaptiveScheduler(**schedule, sampled=mode == ACQUISITION_POLLING)
+        last_read = None
+        while os.getppid() == parent_pid:
+            for i, index in enumerate(indexes):
+                backend.debounce_s[i] = debounce[index]
+
+            now = time.time()
+            read_start = time.perf_counter()
+            try:
+                pulses = await backend.read(now)
+            except PlatformUnavailable:
+                # The client logs the outage; the worker is still alive, so keep its heartbeat
+                shared.heartbeats[shard] = now
+                await asyncio.sleep(scheduler.period)
+                continue
+            read_s = time.perf_counter() - read_start
+
+            elapsed = now - last_read if last_read is not None else 0.0
+            last_read = now
+            pulse_hz = 0.0
+            for i, index in enumerate(indexes):
+                if pulses[i]:
+                    edge_times[index] = backend.last_edge_time[i]
+                    counts[index] += pulses[i]
+                    if elapsed > 0:
+                        pulse_hz = max(pulse_hz, pulses[i] / elapsed)
+            shared.heartbeats[shard] = now
+
+            await asyncio.sleep(scheduler.update(now, pulse_hz, read_s))
+    finally:
+        await backend.stop()
+        await platform.close()
+        shared.close()
+
+
+class ShardedBackend(AcquisitionBackend):
+    """Run acquisition in worker processes, each owning a group of channels.
+
+    The channels are split into `shards` contiguous groups, and each group
+    gets a spawned worker running the `mode` backend against its own
+    platform connection (from `factory`, kept open by a `PlatformClient`),
+    debounce included. Workers pace
+    their reads with their own `AdaptiveScheduler` built from `schedule`, and
+    add their pulses to a `SharedCounters` block, so acquisition on one
+    group never waits on another's reads.
+
+    `read()` only compares the shared counts with those it saw last, so the
+    app's own loop stays cheap however fast the inputs pulse. It also
+    supervises the workers every `supervise_interval_s`: a worker that has
+    exited, or whose heartbeat is older than `heartbeat_timeout_s`, is
+    restarted, carrying on from the shared counts. The restarted worker
+    opens new pulse counters, so in every mode the edges that arrive while
+    a worker is down are missed.
+
+    `debounce_s` is the shared debounce, so changes reach the workers.
+    """
+
+    def __init__(
+        self,
+        mode,
+        factory,
+        channels,
+        shards,
+        counter_bits=32,
+        resync_counters=False,
+        schedule=None,
+        heartbeat_timeout_s=DEFAULT_HEARTBEAT_TIMEOUT,
+        supervise_interval_s=DEFAULT_SUPERVISE_INTERVAL,
+    ):
+        super().__init__(None, channels)
+        self.name = mode
+        self.factory = factory
+        self.channels = list(channels)
+        self.counter_bits = counter_bits
+        self.resync_counters = resync_counters
+        self.schedule = schedule or {}
+        self.heartbeat_timeout_s = heartbeat_timeout_s
+        self.supervise_interval_s = supervise_interval_s
+        self.groups = shard_groups(len(self.channels), shards)
+
+        self.shared = None
+        self.workers = []
+        self.seen = array("q", bytes(8 * len(self.channels)))
+        self.restarts = 0
+        self.last_supervised = 0.0
+
+    async def start(self):
+        self.shared = SharedCounters(len(self.channels), len(self.groups))
+        for i, debounce_s in enumerate(self.debounce_s):
+            self.shared.debounce[i] = debounce_s
+        self.debounce_s = self.shared.debounce
+        self.workers = [self._spawn(shard) for shard in range(len(self.groups))]
+        self.last_supervised = time.time()
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.terminate()
+        await asyncio.gather(*(asyncio.to_thread(worker.join, 5.0) for worker in self.workers))
+        self.workers = []
+        if self.shared is not None:
+            self.debounce_s = array("d", self.shared.debounce)
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+    def _spawn(self, shard):
+        first, stop = self.groups[shard]
+        # The heartbeat starts now, giving the worker the timeout to start up
+        self.shared.heartbeats[shard] = time.time()
+        worker = _MP_CONTEXT.Process(
+            target=run_shard,
+            args=(
+                self.shared.name,
+                (len(self.channels), len(self.groups)),
+                shard,
+                first,
+                self.channels[first:stop],
+                self.name,
+                self.counter_bits,
+                self.resync_counters,
+                self.factory,
+                self.schedule,
+                os.getpid(),
+            ),
+            name=f"acquisition-shard-{shard}",
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    async def supervise(self, now):
+        """Restart any worker that has exited or stopped updating its heartbeat."""
+        self.last_supervised = now
+        for shard, worker in enumerate(self.workers):
+            if worker.is_alive() and now - self.shared.heartbeats[shard] < self.heartbeat_timeout_s:
+                continue
+            if worker.is_alive():
+                log.warning("Acquisition shard %d stopped responding, restarting it", shard)
+                worker.kill()
+            else:
+                log.warning("Acquisition shard %d exited with code %s, restarting it", shard, worker.exitcode)
+            # Off the event loop: a killed worker can take a moment to exit
+            await asyncio.to_thread(worker.join, 5.0)
+            self.workers[shard] = self._spawn(shard)
+            self.restarts += 1
+
+    async def read(self, now):
+        if now - self.last_supervised >= self.supervise_interval_s:
+            await self.supervise(now)
+
+        counts = self.shared.counts
+        edge_times = self.shared.edge_times
+        seen = self.seen
+        pulses = self._pulses
+        for i in range(len(seen)):
+            count = counts[i]
+            if count != seen[i]:
+                pulses[i] += count - seen[i]
+                seen[i] = count
+                self.last_edge_time[i] = edge_times[i]
+
+        return self._take_pulses()
+
+    def stats(self):
+        return {"shards": len(self.groups), "shard_restarts": self.restarts}
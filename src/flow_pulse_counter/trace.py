@@ -0,0 +1,182 @@
+import logging
+import mmap
+import struct
+import time
+
+from .acquisition import pin_states
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for TraceReader.arrays
+    np = None
+
+log = logging.getLogger(__name__)
+
+TRACE_MAGIC = b"FPCTRACE"
+TRACE_VERSION = 1
+
+# magic, version, record size
+HEADER = struct.Struct("<8sHH")
+# timestamp, pin, kind, level
+RECORD = struct.Struct("<dHBB")
+
+# A digital input level read by the app
+KIND_SAMPLE = 0
+# An edge reported by the platform (edge event or pulse counter increment)
+KIND_EDGE = 1
+
+DEFAULT_MAX_TRACE_BYTES = 64 * 1024 * 1024
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([("time", "<f8"), ("pin", "<u2"), ("kind", "u1"), ("level", "u1")])
+
+
+class TraceWriter:
+    """Append DI samples and edges to a compact binary trace file.
+
+    Records are fixed-size and buffered in memory, then written out by
+    `flush()` or when the buffer fills. Recording stops with a warning once
+    the file reaches `max_bytes`, so a forgotten trace can't fill the disk.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_TRACE_BYTES, buffer_records=4096):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.buffer_records = buffer_records
+        self.records = 0
+
+        self._buffer = []
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+        self._size = HEADER.size
+        self._full = False
+
+    def sample(self, timestamp, pin, level):
+        self._append(timestamp, pin, KIND_SAMPLE, 1 if level else 0)
+
+    def edge(self, timestamp, pin):
+        self._append(timestamp, pin, KIND_EDGE, 1)
+
+    def _append(self, timestamp, pin, kind, level):
+        if self._full:
+            return
+        if self._size + RECORD.size * (len(self._buffer) + 1) > self.max_bytes:
+            self._full = True
+            log.warning("Trace file %s reached %d bytes, recording stopped", self.path, self.max_bytes)
+            return
+        self._buffer.append(RECORD.pack(timestamp, pin, kind, level))
+        if len(self._buffer) >= self.buffer_records:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            data = b"".join(self._buffer)
+            self._file.write(data)
+            self._size += len(data)
+            self.records += len(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class TraceReader:
+    """Memory-mapped reader for trace files written by `TraceWriter`."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_size = HEADER.unpack_from(self._map, 0)
+        if magic != TRACE_MAGIC:
+            raise ValueError(f"{path} is not a pulse trace file")
+        if version != TRACE_VERSION or record_size != RECORD.size:
+            raise ValueError(f"Unsupported trace version {version} in {path}")
+
+        # Ignore a partial record left by an interrupted write
+        self.records = (len(self._map) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.records
+
+    def __iter__(self):
+        """Yield (timestamp, pin, kind, level) for every record."""
+        end = HEADER.size + self.records * RECORD.size
+        return RECORD.iter_unpack(memoryview(self._map)[HEADER.size : end])
+
+    def arrays(self):
+        """Return the records as a NumPy structured array, without copying."""
+        if np is None:
+            raise ImportError("TraceReader.arrays requires numpy")
+        return np.frombuffer(self._map, dtype=RECORD_DTYPE, count=self.records, offset=HEADER.size)
+
+    def pins(self):
+        return sorted({pin for _, pin, _, _ in self})
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _RecordingCounter:
+    def __init__(self, counter, pin, writer):
+        self.counter = counter
+        self.pin = pin
+        self.writer = writer
+        self.last = None
+
+    def get_counter(self):
+        count = self.counter.get_counter()
+        if self.last is not None and count > self.last:
+            now = time.time()
+            for _ in range(count - self.last):
+                self.writer.edge(now, self.pin)
+        self.last = count
+        return count
+
+    async def close(self):
+        close = getattr(self.counter, "close", None)
+        if close is not None:
+            await close()
+
+
+class RecordingPlatform:
+    """Platform interface wrapper that records DI reads and edges to a trace.
+
+    Passed to an acquisition backend in place of the real platform
+    interface. Pulse counter increments are recorded as edges at the time
+    of the read that saw them.
+    """
+
+    def __init__(self, platform_iface, writer):
+        self.platform_iface = platform_iface
+        self.writer = writer
+
+    async def get_di_async(self, pins):
+        values = await self.platform_iface.get_di_async(pins)
+        now = time.time()
+        for pin, level in zip(pins, pin_states(values, pins)):
+            self.writer.sample(now, pin, level)
+        return values
+
+    def get_new_pulse_counter(self, di, edge="rising"):
+        return _RecordingCounter(self.platform_iface.get_new_pulse_counter(di, edge), di, self.writer)
+
+    def start_di_pulse_listener(self, di, callback, edge="rising", **kwargs):
+        async def on_edge(*args):
+            self.writer.edge(time.time(), di)
+            await callback(*args)
+
+        return self.platform_iface.start_di_pulse_listener(di, on_edge, edge=edge, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.platform_iface, name)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+
+class TagWriter:
+    """Background writer that batches tag updates off the sampling path.
+
+    `write()` only records the value, so callers never wait on the device
+    agent. Pending writes to the same key are coalesced (latest value wins)
+    and the background task sends everything that changed as a single
+    `write_tags` call, at most once every `batch_delay_s` seconds unless a
+    flush is requested.
+    """
+
+    def __init__(self, write_tags, max_pending=256, batch_delay_s=0.5, retry_delay_s=5.0):
+        self.write_tags = write_tags
+        self.max_pending = max_pending
+        self.batch_delay_s = batch_delay_s
+        self.retry_delay_s = retry_delay_s
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped_writes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+        self._pending = {}
+        self._wake = asyncio.Event()
+        self._flush_now = False
+        self._task = None
+        self._flushing = False
+        self._stopping = False
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task, then send everything still pending.
+
+        A flush already in progress is left to finish rather than cancelled
+        part way through its write.
+        """
+        task, self._task = self._task, None
+        if task is not None:
+            self._stopping = True
+            if not self._flushing:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self._stopping = False
+        try:
+            await self.flush()
+        except Exception:
+            # Logged by flush, and the writes stay pending
+            pass
+
+    def write(self, key, value):
+        """Queue a tag write. Returns False if the write was dropped."""
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            self.dropped_writes += 1
+            log.warning("Tag writer queue full, dropping write to %s", key)
+            return False
+        self._pending[key] = value
+        self._wake.set()
+        return True
+
+    def write_many(self, tags):
+        for key, value in tags.items():
+            self.write(key, value)
+
+    def request_flush(self):
+        """Ask the background task to flush without waiting for the batch delay."""
+        self._flush_now = True
+        self._wake.set()
+
+    async def flush(self):
+        """Send all pending writes as one batch."""
+        if not self._pending:
+            return
+
+        batch = self._pending
+        self._pending = {}
+        start = time.monotonic()
+        sent = False
+        try:
+            await self.write_tags(batch)
+            sent = True
+        except Exception as e:
+            self.failed_flushes += 1
+            log.error("Error writing %d tags: %s", len(batch), e)
+            raise
+        finally:
+            if not sent:
+                # Put the batch back without overwriting anything newer, cancelled or not
+                batch.update(self._pending)
+                self._pending = batch
+            self.last_flush_latency = time.monotonic() - start
+            self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+        self.flushes += 1
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            if not self._flush_now:
+                # Give other writes in this burst a chance to join the batch
+                await asyncio.sleep(self.batch_delay_s)
+            self._wake.clear()
+            self._flush_now = False
+
+            self._flushing = True
+            try:
+                await self.flush()
+                failed = False
+            except Exception:
+                failed = True
+            finally:
+                self._flushing = False
+            if self._stopping:
+                return
+            if failed:
+                await asyncio.sleep(self.retry_delay_s)
+                self._wake.set()
+
+    def stats(self):
+        return {
+            "tag_queue_depth": self.queue_depth,
+            "tag_flush_latency_ms": round(self.last_flush_latency * 1000.0, 1),
+            "tag_max_flush_latency_ms": round(self.max_flush_latency * 1000.0, 1),
+            "tag_dropped_writes": self.dropped_writes,
+        }
+
+
+class AlertDispatcher:
+    """Rate-limited outbound queue for alert notifications.
+
+    Alerts are queued by `send()` without waiting, and the background task
+    delivers them at most once every `min_interval_s` seconds. Alerts that
+    arrive while the queue is full are dropped and counted.
+    """
+
+    def __init__(self, send_alert, max_pending=32, min_interval_s=5.0):
+        self.send_alert = send_alert
+        self.min_interval_s = min_interval_s
+
+        self.sent = 0
+        self.dropped = 0
+
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._last_sent = None
+        self._task = None
+        self._sending = False
+        self._stopping = False
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task, letting an alert being sent finish first."""
+        task, self._task = self._task, None
+        if task is not None:
+            self._stopping = True
+            if not self._sending:
+                task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            self._stopping = False
+        if self.queue_depth:
+            log.warning("Stopping with %d alerts unsent", self.queue_depth)
+
+    def send(self, message):
+        """Queue an alert. Returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            log.warning("Alert queue full, dropping alert: %s", message)
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            message = await self._queue.get()
+            if self._last_sent is not None:
+                wait = self._last_sent + self.min_interval_s - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            self._sending = True
+            try:
+                await self.send_alert(message)
+                self.sent += 1
+            except Exception as e:
+                log.error("Error sending alert %r: %s", message, e)
+            finally:
+                self._sending = False
+            self._last_sent = time.monotonic()
+            if self._stopping:
+                return
+
+    def stats(self):
+        return {
+            "alert_queue_depth": self.queue_depth,
+            "alerts_sent": self.sent,
+            "alerts_dropped": self.dropped,
+        }
@@ -0,0 +1,121 @@
+"""
+In-process stand-ins for the platform interface used by the tests.
+"""
+
+import copy
+import inspect
+import time
+
+
+class FakePulseCounter:
+    def __init__(self):
+        self.count = 0
+
+    def get_counter(self):
+        return self.count
+
+
+class FakePlatform:
+    """Fake `platform_iface` with settable pin levels, counters, outputs and an edge event source.
+
+    Clearing `connected` makes the IO requests fail like an unreachable platform interface.
+    """
+
+    def __init__(self):
+        self.levels = {}
+        self.outputs = {}
+        self.counters = {}
+        self.listeners = {}
+        self.di_requests = 0
+        self.connected = True
+
+    async def get_di_async(self, pins):
+        self.di_requests += 1
+        if not self.connected:
+            raise ConnectionError("platform interface unreachable")
+        return [self.levels.get(p, False) for p in pins]
+
+    async def set_do_async(self, do, value):
+        if not self.connected:
+            raise ConnectionError("platform interface unreachable")
+        self.outputs[do] = value
+        return [True]
+
+    def get_new_pulse_counter(self, di, edge="rising"):
+        return self.counters.setdefault(di, FakePulseCounter())
+
+    def start_di_pulse_listener(self, di, callback, edge="rising", start_count=0):
+        self.listeners[di] = callback
+
+    async def emit_edge(self, di, value=True, dt_secs=1):
+        """Deliver one edge event to the listener subscribed to `di`."""
+        callback = self.listeners[di]
+        await callback(di, value, dt_secs, 0, "rising")
+
+
+class FakeTagStore:
+    """In-process stand-in for the device agent's tag store."""
+
+    def __init__(self, tags=None):
+        self.tags = dict(tags or {})
+        self.writes = 0
+
+    def get_tag(self, tag_key, app_key=None, default=None):
+        return self.tags.get(tag_key, default)
+
+    async def set_tags_async(self, tags, app_key=None, only_if_changed=True):
+        self.writes += 1
+        self.tags.update(tags)
+
+
+class ClockPulseCounter:
+    """Pulse counter driven by the wall clock, counting from zero when it's opened like the platform's."""
+
+    def __init__(self, rate_hz):
+        self.rate_hz = rate_hz
+        self.opened = time.time()
+
+    def get_counter(self):
+        return int((time.time() - self.opened) * self.rate_hz) % (1 << 32)
+
+
+class ClockPlatform:
+    """Picklable fake `platform_iface` whose counters tick at `rate_hz`, for acquisition worker processes."""
+
+    def __init__(self, rate_hz=1000.0):
+        self.rate_hz = rate_hz
+
+    def get_new_pulse_counter(self, di, edge="rising"):
+        return ClockPulseCounter(self.rate_hz)
+
+
+class FakeTagBus:
+    """In-process stand-in for the device agent's tag channel, shared by several apps.
+
+    Each `publish` merges an app's tags into the aggregate and delivers the
+    whole `{app_key: {tag: value}}` aggregate to every subscriber, as the
+    device agent does.
+    """
+
+    def __init__(self):
+        self.aggregate = {}
+        self.subscribers = []
+
+    def add_subscription(self, channel_name, callback):
+        self.subscribers.append((channel_name, callback))
+
+    def get_tag(self, tag_key, app_key=None, default=None):
+        return self.aggregate.get(app_key, {}).get(tag_key, default)
+
+    def publish(self, app_key, tags):
+        self.aggregate.setdefault(app_key, {}).update(tags)
+        for channel_name, callback in self.subscribers:
+            callback(channel_name, self.aggregate)
+
+    async def publish_async(self, app_key, tags):
+        """`publish` to subscribers that may be coroutines, like a pydoover app's own tag handler."""
+        self.aggregate.setdefault(app_key, {}).update(tags)
+        for channel_name, callback in self.subscribers:
+            result = callback(channel_name, copy.deepcopy(self.aggregate))
+            if inspect.isawaitable(result):
+                await result
@@ -0,0 +1,159 @@
+"""
+Tests for the pulse acquisition backends.
+"""
+
+import asyncio
+
+import pytest
+
+from flow_pulse_counter.acquisition import (
+    StreamBackend,
+    EventBackend,
+    PollingBackend,
+    counter_delta,
+    create_backend,
+    pin_states,
+)
+from flow_pulse_counter.channels import MeterChannel
+
+from .fakes import FakePlatform
+
+
+def channels(*pins, debounce_ms=50):
+    return [MeterChannel(i, f"m{i}", f"Meter {i}", pin, debounce_ms=debounce_ms) for i, pin in enumerate(pins)]
+
+
+def test_pin_states_shapes():
+    assert pin_states(True, [1]) == [True]
+    assert pin_states([False, True], [1, 2]) == [False, True]
+    assert pin_states({2: True}, [1, 2]) == [False, True]
+    assert pin_states(None, [1]) == [False]
+
+
+def test_counter_delta_forward_wrap_and_reset():
+    assert counter_delta(10, 15, 1 << 16) == 5
+    assert counter_delta(65530, 4, 1 << 16) == 10
+    # A large backwards step is a counter reset, not a wrap
+    assert counter_delta(5000, 12, 1 << 16) == 12
+
+
+@pytest.mark.asyncio
+async def test_polling_backend_reads_all_pins_in_one_batch():
+    platform = FakePlatform()
+    backend = PollingBackend(platform, channels(1, 2))
+
+    counted = [0, 0]
+    samples = [(0.0, False, False), (0.2, True, True), (0.21, False, True), (0.22, True, False), (0.4, False, True), (0.6, True, False)]
+    for now, level_1, level_2 in samples:
+        platform.levels.update({1: level_1, 2: level_2})
+        pulses = await backend.read(now)
+        counted = [a + b for a, b in zip(counted, pulses)]
+
+    assert counted == [2, 2]
+    assert platform.di_requests == len(samples)
+
+
+@pytest.mark.asyncio
+async def test_polling_counts_edges_missed_against_the_counters():
+    platform = FakePlatform()
+    backend = PollingBackend(platform, channels(1, debounce_ms=0), resync_counters=True)
+    await backend.start()
+    assert PollingBackend(platform, channels(1)).missed_edges is None
+    counter = platform.counters[1]
+
+    # Each read sees the input low then high, but the counter saw three edges each time
+    for now in range(6):
+        level = bool(now % 2)
+        platform.levels[1] = level
+        counter.count += 3 * level
+        await backend.read(float(now))
+    assert backend.seen_edges == 3
+    assert backend.missed_edges == 6
+
+
+@pytest.mark.asyncio
+async def test_stream_backend_reads_deltas():
+    platform = FakePlatform()
+    backend = create_backend("Pulse Stream", platform, channels(1), counter_bits=8)
+    assert isinstance(backend, StreamBackend)
+    await backend.start()
+
+    platform.counters[1].count = 250
+    assert await backend.read(0.0) == [0]
+    platform.counters[1].count = 260  # wraps to 4 on an 8-bit counter
+    assert await backend.read(0.2) == [10]
+
+
+@pytest.mark.asyncio
+async def test_event_backend_debounces_edges_without_polling(monkeypatch):
+    platform = FakePlatform()
+    backend = EventBackend(platform, channels(1, 2))
+    await backend.start()
+
+    times = iter([10.0, 10.01, 10.1, 10.2, 10.2])
+    monkeypatch.setattr("flow_pulse_counter.acquisition.time.time", lambda: next(times))
+    for _ in range(4):
+        await platform.emit_edge(1)
+    await platform.emit_edge(2)
+
+    # 10.01 falls inside the 50 ms debounce window
+    assert await backend.read(10.3) == [3, 1]
+    assert platform.di_requests == 0
+    await backend.stop()
+
+
+@pytest.mark.asyncio
+async def test_event_backend_counts_dropped_events():
+    backend = EventBackend(FakePlatform(), channels(1, debounce_ms=0), queue_size=2)
+    for ts in (1.0, 2.0, 3.0, 4.0):
+        backend.push_edge(0, ts)
+
+    assert backend.dropped_events == 2
+    assert backend.queue_high_water == 2
+    assert await backend.read(5.0) == [2]
+
+
+@pytest.mark.asyncio
+async def test_stream_backend_counts_the_pulse_stream_without_keeping_pulses(monkeypatch):
+    from pydoover.docker.platform import PlatformInterface
+
+    from flow_pulse_counter.platform_client import ListenerCounter, PlatformClient
+
+    platform = PlatformInterface("test", "127.0.0.1:1", is_async=True)
+    listeners = {}
+    monkeypatch.setattr(platform, "start_di_pulse_listener", lambda di, callback, edge: listeners.setdefault(di, callback))
+    backend = StreamBackend(PlatformClient(platform), channels(1))
+    await backend.start()
+
+    # pydoover's own PulseCounter would keep a timestamp per pulse
+    assert isinstance(backend.counters[0], ListenerCounter)
+    for i in range(5000):
+        await listeners[1](1, True, 0.01, i + 1, "rising")
+    assert await backend.read(0.0) == [0]
+    for i in range(75):
+        await listeners[1](1, True, 0.01, i + 1, "rising")
+    assert await backend.read(1.0) == [75]
+    assert not hasattr(backend.counters[0], "__dict__")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["Polling", "Pulse Stream", "Events"])
+async def test_stop_cancels_the_pulse_listeners(monkeypatch, mode):
+    from pydoover.docker.platform import PlatformInterface
+
+    from flow_pulse_counter.platform_client import PlatformClient
+
+    platform = PlatformInterface("test", "127.0.0.1:1", is_async=True)
+
+    async def recv_di_pulses(di, callback, edge="rising", start_count=0):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(platform, "recv_di_pulses", recv_di_pulses)
+    backend = create_backend(mode, PlatformClient(platform), channels(1, 2), resync_counters=True)
+    await backend.start()
+    listeners = list(platform.pulse_counter_listeners)
+    assert len(listeners) == 2
+
+    await backend.stop()
+    assert all(listener.cancelled() for listener in listeners)
+    assert platform.pulse_counter_listeners == []
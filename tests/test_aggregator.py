@@ -0,0 +1,61 @@
+"""
+Tests for the site aggregator app, driven through a fake tag channel.
+"""
+
+import pytest
+from pydoover import config
+
+from flow_pulse_counter.aggregator import TAG_CHANNEL, SiteAggregatorApplication
+from flow_pulse_counter.aggregator_config import SiteAggregatorConfig
+
+from .fakes import FakeTagBus
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # pydoover keeps one element map per process, shared by every schema
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    schema = SiteAggregatorConfig()
+    schema._inject_deployment_config(
+        {
+            "sources": [
+                {"source_name": "Bore", "app_key": "pump_shed", "meter_key": "", "role": "Inlet"},
+                {"source_name": "Tank", "app_key": "tank", "meter_key": "", "role": "Outlet"},
+            ]
+        }
+    )
+    app = SiteAggregatorApplication(config=schema, app_key="site", test_mode=True)
+    app.device_agent = FakeTagBus()
+
+    async def clear_ui():
+        pass
+
+    monkeypatch.setattr(app.ui_manager, "clear_ui_async", clear_ui)
+    return app
+
+
+@pytest.mark.asyncio
+async def test_restores_site_totals_and_applies_each_update_once(app):
+    bus = app.device_agent
+    await app._setup()
+    await bus.publish_async("site", {"site_total_volume": 100.0, "inlet_volume": 60.0, "outlet_volume": 40.0})
+    await bus.publish_async("pump_shed", {"flow_rate": 10.0, "total_volume": 1000.0, "pulse_count": 0})
+    await bus.publish_async("tank", {"flow_rate": 9.0, "total_volume": 500.0, "pulse_count": 0})
+    await app.setup()
+
+    # The base app's handler and the aggregator's are both subscribed, once each
+    assert [name for name, _ in bus.subscribers] == [TAG_CHANNEL, TAG_CHANNEL]
+    rollup = app.rollup
+    assert (rollup.total_volume, rollup.inlet_volume, rollup.outlet_volume) == (100.0, 60.0, 40.0)
+
+    await bus.publish_async("pump_shed", {"total_volume": 1010.0})
+    await bus.publish_async("tank", {"total_volume": 508.0})
+    assert rollup.inlet_volume == pytest.approx(70.0)
+    assert rollup.outlet_volume == pytest.approx(48.0)
+    assert rollup.unaccounted_volume == pytest.approx(22.0)
+    # Seeding both sources, then one update each
+    assert rollup.stats()["source_updates"] == 4
+    assert app.get_tag("total_volume", "tank") == 508.0
+
+    await app.main_loop()
+    assert app.ui.site_total_volume.current_value == pytest.approx(118.0)
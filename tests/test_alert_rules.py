@@ -0,0 +1,88 @@
+"""
+Tests for the alert rule engine: hysteresis, on/off delays, cooldowns and duration rules.
+"""
+
+from flow_pulse_counter.alert_rules import (
+    RULE_CONTINUOUS_FLOW,
+    RULE_HIGH_FLOW,
+    RULE_LOW_FLOW,
+    RULE_NO_FLOW,
+    AlertEngine,
+    duration_rules,
+    threshold_rules,
+)
+
+
+def _run(engine, samples, channel=0, start=0.0, step=1.0):
+    """Feed one sample per `step` seconds and collect the state changes."""
+    changes = []
+    for i, value in enumerate(samples):
+        changes.extend(engine.evaluate(channel, start + i * step, value, "L/min"))
+    return changes
+
+
+def test_noise_around_a_threshold_raises_one_alert():
+    engine = AlertEngine(threshold_rules(0, 0.0, 10.0, 0.1, min_on_s=3, min_off_s=3, cooldown_s=0))
+
+    # Flicks over the threshold shorter than the on delay don't count
+    assert _run(engine, [9.5, 10.5, 9.8, 10.2, 9.9]) == []
+
+    changes = _run(engine, [10.5, 10.1, 10.3, 10.2, 9.5], start=10.0)
+    assert changes == [(RULE_HIGH_FLOW, True, "High flow detected: 10.20 L/min")]
+    assert engine.is_active(0, RULE_HIGH_FLOW)
+
+    # Within the hysteresis band (above 9.0) the warning holds however long it stays
+    assert _run(engine, [9.2] * 20, start=20.0) == []
+    assert _run(engine, [8.5, 8.9, 8.0], start=40.0) == []
+    assert _run(engine, [8.9], start=43.0) == [(RULE_HIGH_FLOW, False, None)]
+
+
+def test_low_flow_clears_when_flow_stops():
+    engine = AlertEngine(threshold_rules(0, 2.0, 0.0, 0.1, min_on_s=0, min_off_s=0, cooldown_s=0))
+    assert _run(engine, [1.0]) == [(RULE_LOW_FLOW, True, "Low flow detected: 1.00 L/min")]
+    assert _run(engine, [2.1], start=1.0) == []
+    assert _run(engine, [0.0], start=2.0) == [(RULE_LOW_FLOW, False, None)]
+
+
+def test_messages_show_the_value_in_the_display_unit():
+    # A 120 L/hr threshold evaluated against L/min rates
+    engine = AlertEngine(threshold_rules(0, 0.0, 2.0, 0.0, min_on_s=0, min_off_s=0, cooldown_s=0))
+    changes = engine.evaluate(0, 0.0, 2.5, "L/hr", scale=60.0)
+    assert changes == [(RULE_HIGH_FLOW, True, "High flow detected: 150.00 L/hr")]
+
+
+def test_cooldown_suppresses_repeated_messages():
+    engine = AlertEngine(threshold_rules(0, 0.0, 10.0, 0.0, min_on_s=0, min_off_s=0, cooldown_s=60))
+    changes = _run(engine, [11.0, 5.0, 11.0, 5.0])
+    assert [message is not None for _, active, message in changes if active] == [True, False]
+    assert engine.suppressed == 1
+
+    (change,) = _run(engine, [11.0], start=60.0)
+    assert change[2] is not None
+
+
+def test_duration_rules_only_track_when_the_condition_started():
+    engine = AlertEngine(duration_rules(0, continuous_flow_hours=2, no_flow_hours=1.5, min_off_s=0, cooldown_s=0))
+
+    # Flow for just under two hours, a short stop, then two full hours
+    assert _run(engine, [5.0] * 119, step=60.0) == []
+    assert not engine.is_active(0, RULE_CONTINUOUS_FLOW)
+    _run(engine, [0.0], start=7200.0)
+    changes = _run(engine, [5.0] * 121, start=7260.0, step=60.0)
+    assert [(kind, active) for kind, active, _ in changes] == [(RULE_CONTINUOUS_FLOW, True)]
+
+    # An hour and a half without flow raises the no-flow alert and clears the continuous flow one
+    changes = _run(engine, [0.0] * 91, start=20000.0, step=60.0)
+    assert [(kind, active) for kind, active, _ in changes] == [(RULE_CONTINUOUS_FLOW, False), (RULE_NO_FLOW, True)]
+    assert changes[1][2] == "No flow for 1.5 hours"
+
+
+def test_rules_are_grouped_by_channel():
+    rules = threshold_rules(1, 0.0, 5.0, 0.0, 0, 0, 0, "B: ") + threshold_rules(0, 0.0, 10.0, 0.0, 0, 0, 0, "A: ")
+    engine = AlertEngine(rules)
+    assert len(engine) == 2
+
+    assert _run(engine, [7.0], channel=0) == []
+    assert _run(engine, [7.0], channel=1) == [(RULE_HIGH_FLOW, True, "B: High flow detected: 7.00 L/min")]
+    assert _run(engine, [7.0], channel=2) == []
+    assert engine.active_alerts() == 1
@@ -0,0 +1,58 @@
+"""
+Tests for the app's shutdown, against a fake platform interface and tag store.
+"""
+
+import pytest
+from pydoover import config
+from pydoover.docker import Application
+
+from flow_pulse_counter.app_config import FlowPulseCounterConfig
+from flow_pulse_counter.application import FlowPulseCounterApplication
+from flow_pulse_counter.history import HISTORY_FILE
+from flow_pulse_counter.journal import TotalizerJournal
+
+from .fakes import FakePlatform, FakeTagStore
+
+
+@pytest.mark.asyncio
+async def test_close_saves_pending_state_and_stops_background_tasks(tmp_path, monkeypatch):
+    # pydoover keeps one element map per process, shared by every schema
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    closed = []
+
+    async def base_close(self):
+        closed.append(self)
+
+    # The framework's own close shuts down the device agent and cancels every task
+    monkeypatch.setattr(Application, "close", base_close)
+
+    schema = FlowPulseCounterConfig()
+    schema._inject_deployment_config(
+        {
+            "journal_directory": str(tmp_path / "journal"),
+            "history_directory": str(tmp_path / "history"),
+            "trace_file": str(tmp_path / "trace.bin"),
+        }
+    )
+    store = FakeTagStore()
+    app = FlowPulseCounterApplication(
+        config=schema, app_key="test_app", is_async=True, platform_iface=FakePlatform(), test_mode=True
+    )
+    app.get_tag = store.get_tag
+    app.tag_writer.write_tags = store.set_tags_async
+    await app.setup()
+    tasks = [app.acquisition_task, app.journal_task]
+
+    engine = app.engines[0]
+    engine.add_pulses(450, 1_700_000_000.0)
+    app.journal.update(0, engine.pulse_count, engine.total_volume)
+    app.last_tag_save_time = 1e12
+    await app.close()
+
+    assert closed == [app]
+    assert all(task.done() for task in tasks)
+    assert store.tags["total_volume"] == pytest.approx(engine.total_volume)
+    assert (tmp_path / "history" / HISTORY_FILE).exists()
+    assert (tmp_path / "trace.bin").exists()
+    restored = TotalizerJournal(tmp_path / "journal").load()
+    assert restored[0] == (450, pytest.approx(engine.total_volume))
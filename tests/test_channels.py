@@ -0,0 +1,33 @@
+"""
+Tests for meter channel settings.
+"""
+
+from pydoover import config
+
+from flow_pulse_counter.app_config import FlowPulseCounterConfig
+from flow_pulse_counter.channels import MeterChannel, build_channels
+
+
+def test_channel_tags_are_namespaced_by_key():
+    assert MeterChannel(0, "", "Main", 1).tag("total_volume") == "total_volume"
+    assert MeterChannel(1, "outlet", "Outlet", 2).tag("total_volume") == "outlet_total_volume"
+
+
+def test_meters_without_a_pin_or_on_a_used_pin_are_skipped(monkeypatch, caplog):
+    # pydoover keeps one element map per process, shared by every schema
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    schema = FlowPulseCounterConfig()
+    schema._inject_deployment_config(
+        {
+            "meters": [
+                {"meter_name": "Inlet", "input_pin": 1},
+                {"meter_name": "Unwired"},
+                {"meter_name": "Copy", "input_pin": 1},
+                {"meter_name": "Outlet", "input_pin": 2},
+            ]
+        }
+    )
+    channels = build_channels(schema)
+
+    assert [(c.index, c.name, c.pin) for c in channels] == [(0, "Inlet", 1), (1, "Outlet", 2)]
+    assert len([r for r in caplog.records if r.levelname == "ERROR"]) == 2
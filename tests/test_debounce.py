@@ -0,0 +1,76 @@
+"""
+Tests for the raw edge statistics and the self-tuning debounce.
+"""
+
+import pytest
+
+from flow_pulse_counter.acquisition import PollingBackend
+from flow_pulse_counter.channels import MeterChannel
+from flow_pulse_counter.debounce import DebounceTuner
+
+from .fakes import FakePlatform
+
+
+def _pulses(tuner, hz, count, bounce=(), start=0.0):
+    """Feed `count` pulses at `hz`, each followed by rising edges `bounce` seconds after it."""
+    period = 1.0 / hz
+    for i in range(count):
+        t = start + i * period
+        tuner.edges.rise(t)
+        for offset in bounce:
+            tuner.edges.fall(t + offset / 2)
+            tuner.edges.rise(t + offset)
+        tuner.edges.fall(t + period / 2)
+    return start + count * period
+
+
+def test_debounce_is_set_between_the_bounce_and_the_pulse_period():
+    tuner = DebounceTuner(0.05)
+    _pulses(tuner, 150.0, 1000, bounce=(0.0002, 0.0006, 0.0011))
+    debounce = tuner.tune()
+
+    assert 0.0011 < debounce < 1 / 150.0
+    assert tuner.bounce_rate == pytest.approx(0.75, abs=0.01)
+    assert tuner.max_frequency_hz > 150.0
+    assert tuner.stats()["debounce_ms"] == round(debounce * 1000.0, 3)
+
+
+def test_a_clean_input_gets_the_shortest_debounce():
+    tuner = DebounceTuner(0.05, min_s=0.0002)
+    end = _pulses(tuner, 20.0, 300)
+    # A step change in flow is not bounce
+    _pulses(tuner, 180.0, 300, start=end)
+    assert tuner.tune() == 0.0002
+    assert tuner.bounce_rate == 0.0
+
+
+def test_nothing_changes_until_enough_edges_are_seen():
+    tuner = DebounceTuner(0.05, min_edges=200)
+    _pulses(tuner, 150.0, 100, bounce=(0.0005,))
+    assert tuner.tune() == 0.05
+    assert tuner.stats()["max_frequency_hz"] == 20.0
+
+
+def test_histograms_decay_once_full():
+    tuner = DebounceTuner(0.05, max_edges=500)
+    _pulses(tuner, 100.0, 600)
+    tuner.tune()
+    assert tuner.edges.edges < 300
+
+
+@pytest.mark.asyncio
+async def test_polling_backend_reports_raw_edges():
+    platform = FakePlatform()
+    backend = PollingBackend(platform, [MeterChannel(0, "m0", "Meter 0", 1, debounce_ms=50)])
+    tuner = DebounceTuner(0.05)
+    backend.edge_stats = [tuner.edges]
+
+    counted = 0
+    for i, level in enumerate([False, True, False, True, False, True]):
+        platform.levels[1] = level
+        counted += (await backend.read(1.0 + i * 0.02))[0]
+
+    # The debounce drops the second edge, the statistics still see it
+    assert counted == 2
+    assert tuner.edges.edges == 2
+    assert sum(tuner.edges.high_widths) == 2
@@ -0,0 +1,76 @@
+"""
+Tests for the batch dosing controller and its latency learning.
+"""
+
+import pytest
+
+from flow_pulse_counter.dosing import ACTION_DONE, ACTION_STOP, BATCH_IDLE, BatchController
+
+
+def _fill(controller, target, rate_lps=0.5, latency_s=1.2, period_s=0.05, volume=100.0, start=0.0):
+    """Run one batch against a pump that keeps flowing `latency_s` after the output is shut off."""
+    now = start
+    controller.start(target, volume, now)
+    stopped_at = None
+    while True:
+        now += period_s
+        if controller.running or now < stopped_at + latency_s:
+            volume += rate_lps * period_s
+        action = controller.update(now, volume, rate_lps, period_s)
+        if action == ACTION_STOP:
+            stopped_at = now
+        elif action == ACTION_DONE:
+            return controller.last_overshoot, now
+
+
+def test_overshoot_shrinks_as_the_latency_is_learned():
+    controller = BatchController(latency_s=0.0, settle_s=1.0)
+    overshoots = []
+    now = 0.0
+    for _ in range(12):
+        overshoot, now = _fill(controller, 20.0, start=now)
+        overshoots.append(overshoot)
+
+    # Without compensation the whole latency's worth of flow overshoots
+    assert overshoots[0] == pytest.approx(0.6, abs=0.05)
+    # Within one read's worth of flow (0.025 L) of the target
+    assert abs(overshoots[-1]) <= 0.025 + 1e-9
+    assert controller.latency_s == pytest.approx(1.2, abs=0.1)
+    stats = controller.stats()
+    assert stats["batches"] == 12
+    assert stats["mean_abs_overshoot"] > abs(stats["last_overshoot"])
+
+
+def test_manual_stop_is_not_learned():
+    controller = BatchController(latency_s=0.5, settle_s=1.0)
+    controller.start(10.0, 0.0, 0.0)
+    assert controller.update(1.0, 2.0, 0.5) is None
+    controller.stop(2.0, 0.0, 1.0, manual=True)
+    assert controller.update(2.5, 2.0, 0.0) == ACTION_DONE
+    assert controller.state == BATCH_IDLE
+    assert controller.batches == 0
+    assert controller.latency_s == 0.5
+
+
+def test_settling_waits_for_the_volume_to_stop_changing():
+    controller = BatchController(latency_s=0.0, settle_s=2.0)
+    controller.start(1.0, 0.0, 0.0)
+    assert controller.update(1.0, 1.0, 1.0) == ACTION_STOP
+    assert controller.update(2.0, 1.5, 0.5) is None
+    assert controller.update(3.5, 1.5, 0.0) is None
+    assert controller.update(4.0, 1.5, 0.0) == ACTION_DONE
+    assert controller.last_overshoot == 0.5
+    assert controller.latency_s == pytest.approx(0.3 * 0.5)
+
+
+def test_restore_carries_on_from_saved_stats():
+    controller = BatchController()
+    controller.batches, controller.overshoot_sum, controller.abs_overshoot_sum = 4, 0.2, 0.4
+    controller.latency_s = 1.75
+
+    restored = BatchController(latency_s=0.5)
+    restored.restore(controller.stats())
+    assert restored.stats() == controller.stats()
+
+    with pytest.raises(ValueError):
+        restored.start(0.0, 0.0, 0.0)
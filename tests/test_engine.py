@@ -0,0 +1,88 @@
+"""
+Tests for the framework-free pulse counting engine.
+"""
+
+import pytest
+
+from flow_pulse_counter.engine import PulseEngine, convert_flow_rate
+
+
+def test_feed_counts_debounced_rising_edges():
+    engine = PulseEngine(pulses_per_litre=100.0, debounce_s=0.05)
+    samples = [(0.0, False), (0.1, True), (0.12, False), (0.13, True), (0.3, False), (0.4, True)]
+    counted = [engine.feed(t, level) for t, level in samples]
+
+    # The edge at 0.13 s is within the debounce of the edge at 0.1 s
+    assert counted == [0, 1, 0, 0, 0, 1]
+    assert engine.pulse_count == 2
+    assert engine.total_volume == 0.02
+
+
+def test_zero_calibration_counts_pulses_but_no_volume():
+    engine = PulseEngine(pulses_per_litre=0.0)
+    engine.add_pulses(7, 1.0)
+    assert engine.update(1.0) == 0.0
+    assert engine.pulse_count == 7
+    assert engine.total_volume == 0.0
+
+    engine.reset()
+    assert engine.pulse_count == 0
+
+
+def test_set_window_keeps_totals_and_rate():
+    engine = PulseEngine(pulses_per_litre=10.0, debounce_s=0.0, window_s=10.0, max_window_s=60.0)
+    for i in range(200):
+        engine.add_pulses(1, i * 0.1)
+        engine.update(i * 0.1)
+    rate = engine.flow_rate
+
+    engine.set_window(30.0, no_flow_periods=5.0)
+    assert (engine.pulse_count, engine.total_volume) == (200, 20.0)
+    assert engine.update(19.95) == pytest.approx(rate, rel=0.01)
+    assert engine.periods.no_flow_periods == 5.0
+
+    # Growing past the window's capacity starts the rate history again, not the totals
+    engine.set_window(120.0, no_flow_periods=5.0)
+    assert engine.window.max_window_s >= 120.0
+    assert engine.total_volume == 20.0
+
+
+def test_convert_flow_rate_units():
+    assert convert_flow_rate(2.0, "L/min") == 2.0
+    assert convert_flow_rate(2.0, "L/hr") == 120.0
+    assert convert_flow_rate(2.0, "m3/hr") == pytest.approx(0.12)
+
+
+def test_feed_batch_matches_scalar_feed():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(7)
+    timestamps = 1000.0 + np.cumsum(rng.choice([0.01, 0.05, 0.2, 1.5, 12.0], size=5000))
+    levels = rng.random(5000) < 0.5
+
+    scalar = PulseEngine(pulses_per_litre=7.5, debounce_s=0.05, window_s=10, max_window_s=900)
+    expected = []
+    for t, level in zip(timestamps.tolist(), levels.tolist()):
+        scalar.feed(t, level)
+        expected.append((scalar.pulse_count, scalar.total_volume, scalar.flow_rate))
+
+    batch = PulseEngine(pulses_per_litre=7.5, debounce_s=0.05, window_s=10, max_window_s=900)
+    first = batch.feed_batch(timestamps[:2000], levels[:2000])
+    second = batch.feed_batch(timestamps[2000:], levels[2000:])
+    results = list(
+        zip(
+            first.counts.tolist() + second.counts.tolist(),
+            first.volumes.tolist() + second.volumes.tolist(),
+            first.flow_rates.tolist() + second.flow_rates.tolist(),
+        )
+    )
+
+    assert results == expected
+    # The engine carries on from the batch exactly as if it had been fed sample by sample
+    assert batch.feed(timestamps[-1] + 0.5, True) == scalar.feed(timestamps[-1] + 0.5, True)
+    assert batch.flow_rate == scalar.flow_rate
+
+
+def test_feed_batch_rejects_backwards_timestamps():
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        PulseEngine().feed_batch([1.0, 0.5], [True, False])
@@ -0,0 +1,123 @@
+"""
+Tests for the tiered flow history store and its uploader.
+"""
+
+import base64
+import json
+import zlib
+
+import pytest
+
+from flow_pulse_counter.history import HistoryStore, HistoryTier, HistoryUploader
+
+
+def _decode(message):
+    return json.loads(zlib.decompress(base64.b64decode(message["data"])))
+
+
+def test_tiers_aggregate_min_max_mean_and_volume():
+    store = HistoryStore(["meter"], tier_sizes=(120, 10, 10))
+    volume = 0.0
+    # 5 readings a second for two minutes, alternating 10 and 20 L/min
+    for i in range(5 * 120 + 1):
+        now = 1020.0 + i / 5
+        volume += 0.05
+        store.record(0, now, 10.0 if i % 2 else 20.0, volume)
+
+    seconds = store.history(0, 1)
+    assert len(seconds) == 120
+    start, samples, low, high, mean, delta = seconds[-1]
+    assert (start, samples, low, high) == (1139.0, 5, 10.0, 20.0)
+    assert delta == pytest.approx(0.25)
+
+    (minute,) = store.history(0, 60)
+    assert minute[:4] == (1020.0, 300, 10.0, 20.0)
+    assert minute[4] == pytest.approx(15.0, abs=0.05)
+    # The first reading only sets the volume baseline
+    assert minute[5] == pytest.approx(299 * 0.05)
+    assert store.history(0, 3600) == []
+
+
+def test_ring_keeps_the_newest_buckets():
+    tier = HistoryTier(1, 3)
+    for t in range(6):
+        tier.add(float(t), 1, t, t, t, 0.0)
+    assert [row[0] for row in tier.buckets()] == [2.0, 3.0, 4.0]
+
+
+def test_a_totals_reset_does_not_record_negative_volume():
+    store = HistoryStore(["meter"])
+    store.record(0, 0.0, 1.0, 50.0)
+    store.record(0, 1.0, 1.0, 0.5)
+    store.record(0, 2.0, 1.0, 0.7)
+    assert [row[5] for row in store.history(0, 1)] == [0.0, 0.0]
+
+
+def test_upload_batches_hold_completed_buckets_until_acknowledged():
+    store = HistoryStore(["inlet", "outlet"], upload_from_s=60)
+    for t in range(0, 190):
+        store.record(0, float(t), 6.0, t * 0.1)
+        store.record(1, float(t), 3.0, t * 0.05)
+
+    message, count = store.upload_batch(max_rows=3)
+    assert count == 3
+    rows = _decode(message)
+    assert message["fields"] == ["start", "samples", "min", "max", "mean", "volume"]
+    assert [r[0] for r in rows["inlet"]["1m"]] == [0.0, 60.0]
+    assert rows["outlet"]["1m"][0][2:5] == [3.0, 3.0, 3.0]
+
+    store.acknowledge(count)
+    message, count = store.upload_batch()
+    assert count == 3
+    assert store.stats()["history_uploaded"] == 3
+
+
+def test_dump_and_load_round_trip():
+    store = HistoryStore(["meter"], tier_sizes=(30, 10, 10))
+    for t in range(125):
+        store.record(0, float(t), float(t % 7), t * 0.01)
+
+    restored = HistoryStore(["meter"], tier_sizes=(30, 10, 10))
+    restored.load(store.dump())
+    assert restored.history(0, 1) == store.history(0, 1)
+    assert restored.history(0, 60) == store.history(0, 60)
+    assert list(restored.outbox) == list(store.outbox)
+
+    # Carries on from the open buckets as if it had never stopped
+    store.record(0, 125.0, 1.0, 1.26)
+    restored.record(0, 125.0, 1.0, 1.26)
+    assert restored.history(0, 1) == store.history(0, 1)
+
+    with pytest.raises(ValueError):
+        HistoryStore(["a", "b"], tier_sizes=(30, 10, 10)).load(store.dump())
+
+
+@pytest.mark.asyncio
+async def test_uploader_keeps_buckets_through_failed_publishes(tmp_path):
+    published = []
+    fail = True
+
+    async def publish(channel, message):
+        if fail:
+            raise ConnectionError("offline")
+        published.append((channel, message["rows"]))
+        return True
+
+    store = HistoryStore(["meter"], upload_from_s=1)
+    for t in range(5):
+        store.record(0, float(t), 1.0, 0.0)
+    uploader = HistoryUploader(store, publish, path=str(tmp_path / "history.bin"), max_rows=2)
+
+    await uploader.upload()
+    assert uploader.stats()["history_failed_uploads"] == 1
+    assert len(store.outbox) == 4
+    await uploader.save()
+
+    # A restart while offline keeps the outbox
+    restored = HistoryStore(["meter"], upload_from_s=1)
+    uploader = HistoryUploader(restored, publish, path=str(tmp_path / "history.bin"), max_rows=2)
+    uploader.load()
+    fail = False
+    await uploader.upload()
+    assert published == [("flow_history", 2), ("flow_history", 2)]
+    assert len(restored.outbox) == 0
@@ -42,3 +42,31 @@ def test_ui_has_required_components():
     assert ui.reset_totals is not None
     assert ui.calibrate is not None
     assert ui.stop_calibration is not None
+
+
+def test_ui_per_meter_channels():
+    from flow_pulse_counter.app_ui import FlowPulseCounterUI
+    from flow_pulse_counter.channels import MeterChannel
+
+    channels = [MeterChannel(0, "inlet", "Inlet", 1), MeterChannel(1, "outlet", "Outlet", 2)]
+    ui = FlowPulseCounterUI(channels)
+    assert len(ui.meters) == 2
+    assert ui.meters[1].flow_rate.name == "outlet_flow_rate"
+    assert ui.calibration_meter is not None
+
+
+def test_import_aggregator():
+    from flow_pulse_counter.aggregator import SiteAggregatorApplication
+    assert SiteAggregatorApplication
+
+
+def test_aggregator_config(monkeypatch):
+    from pydoover import config
+    from flow_pulse_counter.aggregator_config import SiteAggregatorConfig
+
+    # pydoover keeps one element map per process, shared by every schema
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    schema = SiteAggregatorConfig().to_dict()
+    props = schema.get("properties", {})
+    assert "sources" in props
+    assert "imbalance_threshold" in props
@@ -0,0 +1,76 @@
+"""
+Tests for the latency histograms, missed-edge estimate and metrics endpoint.
+"""
+
+import asyncio
+
+import pytest
+
+from flow_pulse_counter.instrumentation import STAGE_READ, Instrumentation, LatencyHistogram, MetricsServer
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = LatencyHistogram(bounds=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.001, 0.005, 0.005, 0.5):
+        histogram.observe(value)
+
+    assert list(histogram.counts) == [2, 2, 0, 1]
+    assert histogram.count == 5
+    assert histogram.max == 0.5
+    assert histogram.quantile(0.5) == 0.01
+    # The overflow bucket reports the largest value seen
+    assert histogram.quantile(0.99) == 0.5
+    assert histogram.summary()["p50_ms"] == 10.0
+
+
+def test_histogram_prometheus_buckets_are_cumulative():
+    histogram = LatencyHistogram(bounds=(0.001, 0.01))
+    histogram.observe(0.0005)
+    histogram.observe(0.002)
+
+    lines = histogram.prometheus("stage_seconds", 'stage="read"')
+    assert lines[:3] == [
+        'stage_seconds_bucket{stage="read",le="0.001"} 1',
+        'stage_seconds_bucket{stage="read",le="0.01"} 2',
+        'stage_seconds_bucket{stage="read",le="+Inf"} 2',
+    ]
+    assert lines[-1] == 'stage_seconds_count{stage="read"} 2'
+
+
+def test_missed_edges_balance_reads_over_a_window():
+    metrics = Instrumentation(missed_window_s=1.0)
+    # 2 Hz read every 0.2 s: 0.4 pulses per read, every one is visible
+    for counted in (0, 1, 0, 0, 1):
+        metrics.estimate_missed(2.0, 0.2, counted)
+    assert metrics.missed_edges == 0
+
+    # 50 Hz: 10 pulses expected per read; reads that counted more offset those that counted fewer
+    for counted in (8, 12, 9, 11, 10):
+        metrics.estimate_missed(50.0, 0.2, counted)
+    assert metrics.missed_edges == 0
+
+    # Polling saw one pulse a read, on two channels
+    for _ in range(5):
+        metrics.estimate_missed(50.0, 0.2, 1, channel=0)
+        metrics.estimate_missed(50.0, 0.2, 12, channel=1)
+    metrics.add_missed(3)
+    assert metrics.stats()["missed_edges_estimate"] == 48
+    assert metrics.observe_cost > 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_server_serves_prometheus_text():
+    metrics = Instrumentation()
+    metrics.observe(STAGE_READ, 0.002)
+    server = MetricsServer(lambda: metrics.prometheus({"acquisition_period_ms": 200}), port=0)
+    await server.start()
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = (await reader.read()).decode()
+    writer.close()
+    await server.stop()
+
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'flow_pulse_stage_seconds_count{stage="read"} 1' in response
+    assert "flow_pulse_acquisition_period_ms 200.0" in response
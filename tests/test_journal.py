@@ -0,0 +1,93 @@
+"""
+Tests for the local totalizer journal.
+"""
+
+import os
+import stat
+import threading
+
+import pytest
+
+from flow_pulse_counter.journal import RECORD_SIZE, TotalizerJournal
+
+
+@pytest.mark.asyncio
+async def test_latest_totals_survive_a_restart(tmp_path):
+    journal = TotalizerJournal(tmp_path)
+    assert journal.load() == {}
+
+    journal.update(0, 10, 0.5)
+    journal.update(1, 4, 0.2)
+    journal.update(0, 12, 0.6)
+    await journal.sync()
+    journal.close()
+
+    assert TotalizerJournal(tmp_path).load() == {0: (12, 0.6), 1: (4, 0.2)}
+
+
+@pytest.mark.asyncio
+async def test_torn_tail_is_discarded(tmp_path):
+    journal = TotalizerJournal(tmp_path)
+    journal.load()
+    journal.update(0, 10, 0.5)
+    await journal.sync()
+    journal.update(0, 20, 1.0)
+    await journal.sync()
+    journal.close()
+
+    # Simulate power loss part way through the second record
+    path = tmp_path / "totals.journal"
+    path.write_bytes(path.read_bytes()[: RECORD_SIZE + 7])
+
+    journal = TotalizerJournal(tmp_path)
+    assert journal.load() == {0: (10, 0.5)}
+    journal.close()
+    assert path.stat().st_size == RECORD_SIZE
+
+
+@pytest.mark.asyncio
+async def test_compaction_ignores_stale_journal_records(tmp_path):
+    journal = TotalizerJournal(tmp_path, compact_records=3)
+    journal.load()
+    for pulses in (1, 2, 3):
+        journal.update(0, pulses, pulses / 10)
+        await journal.sync()
+
+    assert (tmp_path / "totals.journal").stat().st_size == 0
+    journal.update(0, 4, 0.4)
+    await journal.sync()
+    journal.close()
+
+    # A crash between writing the snapshot and truncating the journal
+    # leaves older records behind, which must not win over the snapshot
+    stale = TotalizerJournal(tmp_path / "stale")
+    stale.load()
+    stale.update(0, 1, 0.1)
+    await stale.sync()
+    stale.close()
+    journal_path = tmp_path / "totals.journal"
+    journal_path.write_bytes((tmp_path / "stale" / "totals.journal").read_bytes() + journal_path.read_bytes())
+
+    assert TotalizerJournal(tmp_path).load() == {0: (4, 0.4)}
+
+
+@pytest.mark.asyncio
+async def test_compaction_writes_and_syncs_the_snapshot_off_the_event_loop(tmp_path, monkeypatch):
+    loop_thread = threading.get_ident()
+    synced = []
+    fsync = os.fsync
+
+    def recording_fsync(fd):
+        synced.append((stat.S_ISDIR(os.fstat(fd).st_mode), threading.get_ident() != loop_thread))
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", recording_fsync)
+    journal = TotalizerJournal(tmp_path, compact_records=1)
+    journal.load()
+    journal.update(0, 7, 0.7)
+    await journal.sync()
+    journal.close()
+
+    # Journal append, snapshot file, snapshot directory, journal truncation
+    assert synced == [(False, True), (False, True), (True, True), (False, True)]
+    assert TotalizerJournal(tmp_path).load() == {0: (7, 0.7)}
@@ -0,0 +1,84 @@
+"""
+Tests for multi-point K-factor tables and segment-exact volume accounting.
+"""
+
+import pytest
+
+from flow_pulse_counter.engine import PulseEngine
+from flow_pulse_counter.kfactor import KFactorTable, format_k_factor_points, parse_k_factor_points
+
+
+def test_parse_k_factor_points():
+    assert parse_k_factor_points("") == []
+    assert parse_k_factor_points("80:447, 5:452; 20:450") == [(5.0, 452.0), (20.0, 450.0), (80.0, 447.0)]
+    assert format_k_factor_points([(5.0, 452.0), (20.5, 450.0)]) == "5:452.00, 20.5:450.00"
+    with pytest.raises(ValueError):
+        parse_k_factor_points("20=450")
+    with pytest.raises(ValueError):
+        parse_k_factor_points("20:0")
+
+
+def test_table_interpolates_and_holds_the_ends():
+    table = KFactorTable([(10.0, 400.0), (110.0, 500.0)], size=1001)
+    assert table.factor(0.0) == 400.0
+    # Frequencies round to the nearest of the 1001 entries, 0.11 Hz apart
+    assert table.factor(10.0) == pytest.approx(400.0, abs=0.1)
+    assert table.factor(60.0) == pytest.approx(450.0, abs=0.1)
+    assert table.factor(110.0) == 500.0
+    assert table.factor(1e6) == 500.0
+    assert table.nominal == 450.0
+
+    assert KFactorTable([(25.0, 450.0)]).factor(1000.0) == 450.0
+
+
+def test_with_point_replaces_nearby_points():
+    table = KFactorTable([(10.0, 400.0), (100.0, 500.0)])
+    table = table.with_point(105.0, 480.0).with_point(50.0, 440.0)
+    assert table.points == [(10.0, 400.0), (50.0, 440.0), (105.0, 480.0)]
+
+
+def test_volume_is_exact_across_factor_changes():
+    engine = PulseEngine(pulses_per_litre=3.0)
+    for _ in range(10):
+        engine.add_pulses(1, 1.0)
+    engine.pulses_per_litre = 7.0
+    engine.add_pulses(14, 2.0)
+
+    # Pulses keep the factor they were counted at
+    assert engine.total_volume == 10 / 3.0 + 2.0
+    engine.total_volume = 5.0
+    engine.add_pulses(7, 3.0)
+    assert engine.total_volume == 6.0
+
+
+def test_k_factor_corrects_rate_and_volume():
+    table = KFactorTable([(1.0, 100.0), (10.0, 50.0)])
+    engine = PulseEngine(pulses_per_litre=1.0, debounce_s=0.0, window_s=10, k_factor=table)
+
+    # A steady 10 Hz for 20 s
+    for i in range(400):
+        engine.feed(1000.0 + i * 0.05, i % 2 == 1)
+    assert engine.pulse_hz == pytest.approx(10.0)
+    assert engine.flow_rate == pytest.approx(10.0 / 50.0 * 60.0)
+    assert engine.average_rate(10) == pytest.approx(engine.flow_rate)
+    # The first pulses were counted before the rate was known, at the lowest point's factor
+    assert 200 / 100.0 < engine.total_volume < 200 / 50.0 + 0.1
+
+
+def test_feed_batch_with_k_factor_matches_scalar_feed():
+    np = pytest.importorskip("numpy")
+    timestamps = 1000.0 + np.arange(2000) * 0.013
+    levels = (np.arange(2000) // 3) % 2 == 1
+
+    def engine():
+        return PulseEngine(debounce_s=0.0, window_s=10, k_factor=KFactorTable([(1.0, 100.0), (30.0, 80.0)]))
+
+    scalar = engine()
+    for t, level in zip(timestamps.tolist(), levels.tolist()):
+        scalar.feed(t, level)
+    result = engine().feed_batch(timestamps, levels)
+    assert (result.counts[-1], result.volumes[-1], result.flow_rates[-1]) == (
+        scalar.pulse_count,
+        scalar.total_volume,
+        scalar.flow_rate,
+    )
@@ -0,0 +1,93 @@
+"""
+Tests for the scripted pulse load generator.
+"""
+
+import json
+
+import pytest
+
+from flow_pulse_counter.acquisition import ACQUISITION_STREAM, ACQUISITION_EVENTS, ACQUISITION_POLLING
+from flow_pulse_counter.loadgen import Scenario, Segment, run_load
+
+
+def _scenario(*segments, pin=1, seed=3):
+    return Scenario.from_dict({"name": "test", "seed": seed, "pins": {str(pin): list(segments)}})
+
+
+def test_constant_ramp_and_burst_pulse_counts():
+    schedule = _scenario(
+        {"type": "idle", "duration": 1},
+        {"type": "constant", "rate_hz": 100, "duration": 2},
+        {"type": "ramp", "from_hz": 0, "to_hz": 100, "duration": 2},
+        {"type": "burst", "rate_hz": 1000, "on": 0.1, "off": 0.4, "duration": 1},
+    ).schedule()
+
+    assert schedule.pulses[1] == 200 + 100 + 2 * 100
+    assert schedule.edges(1) == schedule.pulses[1]
+    assert schedule.end == 6.0
+
+    times = list(schedule.times[1])
+    assert times == sorted(times)
+    assert times[:2] == [1.0, 1.005]
+    assert schedule.level(1, 1.001) and not schedule.level(1, 1.007)
+
+
+def test_jitter_and_bounce_are_deterministic_and_bounce_is_not_truth():
+    scenario = _scenario(
+        {"type": "constant", "rate_hz": 50, "duration": 2, "jitter": 0.2, "bounce": {"probability": 1, "edges": 2}}
+    )
+    first, second = scenario.schedule(), scenario.schedule()
+
+    assert list(first.times[1]) == list(second.times[1])
+    assert first.pulses[1] == 100
+    assert first.edges(1) == 3 * 100
+
+
+def test_multi_pin_transitions_are_merged_in_time_order(tmp_path):
+    schedule = Scenario.from_dict(
+        {
+            "pins": {
+                "1": [{"type": "constant", "rate_hz": 10, "duration": 1}],
+                "2": [{"type": "constant", "rate_hz": 7, "duration": 1}],
+            }
+        }
+    ).schedule()
+
+    transitions = list(schedule.transitions())
+    assert [t for t, _, _ in transitions] == sorted(t for t, _, _ in transitions)
+    assert {pin for _, pin, _ in transitions} == {1, 2}
+
+    schedule.write_truth(tmp_path / "truth.json")
+    truth = json.loads((tmp_path / "truth.json").read_text())
+    assert truth["pins"] == {"1": {"pulses": 10, "edges": 10}, "2": {"pulses": 7, "edges": 7}}
+
+
+def test_invalid_segments_are_rejected():
+    with pytest.raises(ValueError):
+        Segment("sawtooth", 1)
+    with pytest.raises(ValueError):
+        Segment("constant", 1, rate_hz=10, jitter=0.5)
+
+
+@pytest.mark.asyncio
+async def test_run_load_measures_loss_per_mode():
+    schedule = _scenario({"type": "constant", "rate_hz": 2000, "duration": 2}).schedule(start=1000.0)
+
+    counter = await run_load(schedule, ACQUISITION_STREAM, debounce_ms=0)
+    events = await run_load(schedule, ACQUISITION_EVENTS, debounce_ms=0)
+    polling = await run_load(schedule, ACQUISITION_POLLING, debounce_ms=0)
+
+    assert counter["channels"][0]["loss_rate"] == 0.0
+    assert events["channels"][0]["count_error"] == 0
+    assert polling["channels"][0]["loss_rate"] > 0.9
+
+
+@pytest.mark.asyncio
+async def test_event_debounce_filters_contact_bounce():
+    schedule = _scenario(
+        {"type": "constant", "rate_hz": 5, "duration": 4, "bounce": {"probability": 0.5, "edges": 3}}
+    ).schedule(start=1000.0)
+    assert schedule.edges(1) > schedule.pulses[1]
+
+    report = await run_load(schedule, ACQUISITION_EVENTS, debounce_ms=20)
+    assert report["channels"][0]["pulses"] == schedule.pulses[1]
@@ -0,0 +1,49 @@
+"""
+Tests for the inter-pulse period flow estimator.
+"""
+
+from flow_pulse_counter.period_estimator import PeriodEstimator
+
+
+def test_rate_follows_each_pulse_period():
+    est = PeriodEstimator(no_flow_periods=3, max_period_s=10)
+    est.record(0.0, 1)
+    # The first pulse has no period yet
+    assert est.pulses_per_second(0.1) == 0.0
+
+    est.record(0.5, 1)
+    assert est.pulses_per_second(0.6) == 2.0
+    est.record(1.5, 2)
+    assert est.pulses_per_second(1.6) == 2.0
+
+    # Waiting longer than the period bounds the rate from above
+    assert est.pulses_per_second(2.5) == 1.0
+
+
+def test_no_flow_timeout_and_restart():
+    est = PeriodEstimator(no_flow_periods=3, max_period_s=10)
+    est.record(0.0, 1)
+    est.record(1.0, 1)
+    assert not est.timed_out(3.9)
+    assert est.timed_out(4.1)
+    assert est.estimate(4.1, 5.0, 10) == 0.0
+
+    # The first pulse after a stop doesn't report the stop as a period
+    est.record(20.0, 1)
+    assert est.period is None
+    est.record(20.25, 1)
+    assert est.period == 0.25
+
+
+def test_estimate_switches_on_pulses_per_window():
+    est = PeriodEstimator(no_flow_periods=3, max_period_s=10)
+    est.record(0.0, 1)
+    assert est.estimate(0.1, 0.7, 10) == 0.7
+
+    est.record(1.0, 1)
+    # One pulse per second is 10 per window, too coarse to count
+    assert est.estimate(1.1, 0.7, 10, max_pulses=20) == 1.0
+
+    est.record(1.1, 10)
+    # A hundred per second is well above the switch point
+    assert est.estimate(1.1, 99.0, 10, max_pulses=20) == 99.0
@@ -0,0 +1,142 @@
+"""
+Tests for the long-lived platform interface client.
+"""
+
+import asyncio
+import logging
+
+import pytest
+
+from flow_pulse_counter.acquisition import PollingBackend
+from flow_pulse_counter.channels import MeterChannel
+from flow_pulse_counter.platform_client import PlatformClient, PlatformUnavailable
+
+from .fakes import FakePlatform
+
+
+@pytest.mark.asyncio
+async def test_outage_backs_off_and_logs_once_per_interval(caplog):
+    platform = FakePlatform()
+    now = [0.0]
+    client = PlatformClient(
+        platform, initial_backoff_s=0.5, max_backoff_s=4.0, log_interval_s=60.0, clock=lambda: now[0]
+    )
+    platform.levels[1] = True
+    assert await client.get_di_async([1]) == [True]
+
+    platform.connected = False
+    caplog.set_level(logging.WARNING, logger="flow_pulse_counter.platform_client")
+    attempts = 0
+    # 5 reads a second for two minutes
+    for tick in range(600):
+        now[0] = tick * 0.2
+        requests = platform.di_requests
+        with pytest.raises(PlatformUnavailable):
+            await client.get_di_async([1])
+        attempts += platform.di_requests - requests
+
+    # Retries at 0, 0.6, 1.6 and 3.6 s, then every 4 s; the other reads fail without a request
+    assert attempts == 4 + len(range(76, 1200, 40))
+    assert client.refused == 600 - attempts
+    # The first failure, then one reminder a minute
+    assert len(caplog.records) == 2
+    assert not client.available
+
+    platform.connected = True
+    now[0] = 200.0
+    assert await client.set_do_async(2, 1) == [True]
+    assert client.available and client.reconnects == 1
+    assert await client.get_di_async([1]) == [True]
+    assert client.stats()["platform_failures"] == attempts
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("steps", range(5))
+async def test_cancelling_a_request_loop_stops_it(steps):
+    client = PlatformClient(FakePlatform())
+
+    async def acquire():
+        while True:
+            await client.get_di_async([1])
+            await asyncio.sleep(0.01)
+
+    task = asyncio.create_task(acquire())
+    for _ in range(steps):
+        await asyncio.sleep(0)
+    # However far the request has got, the cancellation isn't lost
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await asyncio.wait_for(task, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_polling_resyncs_missed_pulses_from_the_counters():
+    platform = FakePlatform()
+    backend = PollingBackend(
+        PlatformClient(platform, initial_backoff_s=0.0),
+        [MeterChannel(0, "m0", "Meter 0", 1, debounce_ms=0)],
+        resync_counters=True,
+    )
+    await backend.start()
+    counter = platform.counters[1]
+
+    for now, level in ((0.0, False), (0.2, True), (0.4, False)):
+        platform.levels[1] = level
+        counter.count += level
+        assert await backend.read(now) == [int(level)]
+
+    # 40 pulses while the platform interface restarts, ending on a high level
+    platform.connected = False
+    with pytest.raises(PlatformUnavailable):
+        await backend.read(0.6)
+    counter.count += 40
+    platform.connected = True
+    platform.levels[1] = True
+    assert await backend.read(5.0) == [40]
+    assert backend.last_edge_time[0] == 5.0
+
+    # Back to edge detection
+    platform.levels[1] = False
+    assert await backend.read(5.2) == [0]
+    platform.levels[1] = True
+    assert await backend.read(5.4) == [1]
+    assert backend.stats() == {"resynced_pulses": 40}
+
+
+@pytest.mark.asyncio
+async def test_grpc_requests_share_one_connection():
+    grpc = pytest.importorskip("grpc")
+    from pydoover.docker.platform import PlatformInterface
+    from pydoover.docker.platform.grpc_stubs import platform_iface_pb2, platform_iface_pb2_grpc
+
+    peers = []
+
+    class Servicer(platform_iface_pb2_grpc.platformIfaceServicer):
+        async def getDI(self, request, context):
+            peers.append(context.peer())
+            header = platform_iface_pb2.ResponseHeader(success=True)
+            return platform_iface_pb2.getDIResponse(response_header=header, di=[p == 2 for p in request.di])
+
+        async def setDO(self, request, context):
+            peers.append(context.peer())
+            header = platform_iface_pb2.ResponseHeader(success=False, message="no outputs")
+            return platform_iface_pb2.setDOResponse(response_header=header)
+
+    server = grpc.aio.server()
+    platform_iface_pb2_grpc.add_platformIfaceServicer_to_server(Servicer(), server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    client = PlatformClient(PlatformInterface("test", f"127.0.0.1:{port}", is_async=True), initial_backoff_s=0.0)
+    try:
+        assert client.persistent
+        assert await client.get_di_async([1, 2]) == [False, True]
+        assert await client.get_di_async([2]) is True
+        # A rejected request is a failure, but the connection stays up
+        with pytest.raises(PlatformUnavailable, match="no outputs"):
+            await client.set_do_async(1, 1)
+        assert await client.get_di_async([1]) is False
+        assert client.reconnects == 1
+        assert len(peers) == 4 and len(set(peers)) == 1
+    finally:
+        await client.close()
+        await server.stop(None)
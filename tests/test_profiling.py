@@ -0,0 +1,64 @@
+"""
+Tests for the on-demand profiling hooks.
+"""
+
+import marshal
+import os
+
+import pytest
+
+from flow_pulse_counter.profiling import (
+    DEFAULT_PROFILE_ITERATIONS,
+    PROFILE_CPROFILE,
+    PROFILE_TRACEMALLOC,
+    Profiler,
+    ProfileStore,
+    parse_profile_spec,
+)
+
+
+def test_parse_profile_spec():
+    assert parse_profile_spec(None) == {}
+    assert parse_profile_spec("0") == {}
+    assert parse_profile_spec("1")[PROFILE_CPROFILE] == DEFAULT_PROFILE_ITERATIONS
+    assert parse_profile_spec("cprofile:20, tracemalloc:5") == {PROFILE_CPROFILE: 20, PROFILE_TRACEMALLOC: 5.0}
+    with pytest.raises(ValueError):
+        parse_profile_spec("perf:10")
+
+
+def test_store_rotates_oldest_reports(tmp_path):
+    store = ProfileStore(tmp_path / "profiles", max_bytes=250, max_files=3)
+    for i in range(5):
+        path = store.write(f"report-{i}.txt", "x" * 100)
+        os.utime(path, (i, i))
+        store.rotate()
+
+    assert sorted(name for _, name, _ in store.files()) == ["report-3.txt", "report-4.txt"]
+
+
+def test_cprofile_runs_for_the_requested_iterations(tmp_path):
+    profiler = Profiler(ProfileStore(tmp_path))
+    profiler.start_cprofile(3)
+    for _ in range(2):
+        sum(range(1000))
+        profiler.tick()
+    assert profiler.active
+    assert list(tmp_path.iterdir()) == []
+
+    profiler.tick()
+    assert not profiler.active
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert [n.rsplit(".", 1)[1] for n in names] == ["prof", "txt"]
+    assert isinstance(marshal.loads((tmp_path / names[0]).read_bytes()), dict)
+
+
+@pytest.mark.asyncio
+async def test_tracemalloc_diff_is_written_after_the_span(tmp_path):
+    profiler = Profiler(ProfileStore(tmp_path))
+    profiler.start_tracemalloc(0.01)
+    assert profiler.active
+    await profiler._tracemalloc_task
+
+    (report,) = tmp_path.iterdir()
+    assert report.name.startswith("tracemalloc-")
+    assert report.read_text().startswith("tracemalloc diff over")
@@ -0,0 +1,38 @@
+"""
+Tests for the deadband / staleness filter used for UI updates.
+"""
+
+from flow_pulse_counter.publisher import ChangeFilter
+
+
+def test_first_value_is_always_published():
+    assert ChangeFilter().should_publish("flow_rate", 10.0, 0.0)
+
+
+def test_relative_deadband_suppresses_small_moves():
+    f = ChangeFilter(max_staleness_s=60)
+    f.should_publish("flow_rate", 10.0, 0.0)
+
+    assert not f.should_publish("flow_rate", 10.1, 1.0, relative=0.02)
+    assert f.should_publish("flow_rate", 10.5, 2.0, relative=0.02)
+    # The deadband is measured from the last published value
+    assert not f.should_publish("flow_rate", 10.6, 3.0, relative=0.02)
+
+
+def test_zero_transitions_and_staleness_force_a_publish():
+    f = ChangeFilter(max_staleness_s=60)
+    f.should_publish("flow_rate", 0.005, 0.0)
+    assert f.should_publish("flow_rate", 0.0, 1.0, absolute=0.01)
+
+    assert not f.should_publish("flow_rate", 0.0, 30.0)
+    assert f.should_publish("flow_rate", 0.0, 61.0)
+
+
+def test_text_values_publish_on_change_and_invalidate():
+    f = ChangeFilter()
+    f.should_publish("status", "Running", 0.0)
+    assert not f.should_publish("status", "Running", 1.0)
+    assert f.should_publish("status", "No Flow", 2.0)
+
+    f.invalidate()
+    assert f.should_publish("status", "No Flow", 3.0)
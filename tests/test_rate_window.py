@@ -0,0 +1,58 @@
+"""
+Tests for the constant-memory rolling rate window.
+"""
+
+import pytest
+
+from flow_pulse_counter.rate_window import RateWindow
+
+
+def feed(window, start, stop, period, rate_hz, count=0):
+    t = start
+    while t < stop:
+        window.record(t, int(count))
+        count += rate_hz * period
+        t += period
+    return count
+
+
+def test_memory_is_fixed_at_construction():
+    window = RateWindow(3600, bucket_s=1.0)
+    size = window.size
+    feed(window, 0.0, 7200.0, 0.2, 10)
+    assert window.size == size == 3601
+
+
+def test_steady_rate_over_several_windows():
+    window = RateWindow(900, bucket_s=1.0)
+    feed(window, 1000.0, 2000.0, 0.2, 75)
+
+    for window_s in (10, 60, 900):
+        assert window.pulses_per_second(window_s) == pytest.approx(75, rel=0.02)
+
+
+def test_windows_see_a_rate_change_at_different_speeds():
+    window = RateWindow(900, bucket_s=1.0)
+    count = feed(window, 0.0, 600.0, 0.2, 20)
+    feed(window, 600.0, 660.0, 0.2, 0, count)
+
+    assert window.pulses_per_second(10) == 0.0
+    assert window.pulses_per_second(900) > 0.0
+
+
+def test_gap_between_samples_keeps_the_previous_count():
+    window = RateWindow(60, bucket_s=1.0)
+    window.record(0.0, 0)
+    window.record(30.0, 300)
+    assert window.pulses_per_second(10) == pytest.approx(10.0)
+
+
+def test_rate_available_after_two_samples_and_clear():
+    window = RateWindow(10, bucket_s=1.0)
+    assert window.pulses_per_second(10) == 0.0
+    window.record(5.0, 0)
+    window.record(5.5, 5)
+    assert window.pulses_per_second(10) == pytest.approx(10.0)
+
+    window.clear()
+    assert window.pulses_per_second(10) == 0.0
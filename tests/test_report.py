@@ -0,0 +1,169 @@
+"""
+Tests for the bulk offline volume report.
+"""
+
+import csv
+import io
+import json
+import warnings
+
+import pytest
+
+from flow_pulse_counter.history import HistoryStore
+from flow_pulse_counter.report import REPORT_FIELDS, build_report, main, period_starts, report_file
+from flow_pulse_counter.trace import TraceWriter
+
+np = pytest.importorskip("numpy")
+
+DAY = 86400.0
+# 2026-01-31 00:00 UTC
+START = 1769817600.0
+
+
+def _report(rows):
+    return {(row[0], row[1]): dict(zip(REPORT_FIELDS[2:], row[2:])) for row in rows}
+
+
+def _write_history(path, hours, rate):
+    """Minute and hour buckets of one meter at a steady rate, uploaded as JSON lines."""
+    store = HistoryStore(["inlet"], upload_from_s=60, max_outbox=100000)
+    for second in range(int(hours * 3600) + 1):
+        store.record(0, START + second, rate, second * rate / 60.0)
+    with open(path, "w") as f:
+        while True:
+            message, count = store.upload_batch(500)
+            if message is None:
+                break
+            f.write(json.dumps(message) + "\n")
+            store.acknowledge(count)
+
+
+def test_period_starts_follow_calendar_months_and_local_time():
+    t = np.array([START, START + DAY - 1, START + DAY, START + 40 * DAY])
+    assert period_starts(t, "day").tolist() == [START, START, START + DAY, START + 40 * DAY]
+    assert period_starts(t, "month").tolist() == [START - 30 * DAY, START - 30 * DAY, START + DAY, START + 29 * DAY]
+    # Ten hours ahead of UTC, a day starts at 14:00 UTC the day before
+    assert period_starts(np.array([START]), "day", utc_offset_s=36000).tolist() == [START - 36000]
+
+
+def test_history_report_counts_only_the_finest_tier(tmp_path):
+    path = tmp_path / "pump_shed.jsonl"
+    _write_history(path, hours=26, rate=12.0)
+
+    report = _report(build_report([path], workers=1, period="day", threshold=10.0))
+    first, second = report[("pump_shed/inlet", START)], report[("pump_shed/inlet", START + DAY)]
+    assert first["covered_s"] == DAY
+    assert first["volume"] == pytest.approx(12.0 * 60 * 24, rel=1e-4)
+    # The last minute is still open, so it hasn't been uploaded
+    assert second["volume"] == pytest.approx(12.0 * 119)
+    assert first["peak_rate"] == first["min_rate"] == first["mean_rate"] == 12.0
+    assert first["exceedance_s"] == DAY
+    assert first["no_flow_s"] == 0.0
+
+
+def test_history_as_a_json_list_is_read_a_message_at_a_time(tmp_path, monkeypatch):
+    lines = tmp_path / "lines.jsonl"
+    _write_history(lines, hours=2, rate=12.0)
+    messages = [json.loads(line) for line in lines.read_text().splitlines()]
+    path = tmp_path / "pump_shed.json"
+    path.write_text(" [\n" + ",\n".join(json.dumps(m) for m in messages) + "\n]\n")
+
+    (expected,) = build_report([lines], workers=1, period="day")
+    monkeypatch.setattr("flow_pulse_counter.report.json.load", None)
+    # Smaller than a message, so messages are read across several reads
+    monkeypatch.setattr("flow_pulse_counter.report.JSON_READ_SIZE", 256)
+    (row,) = build_report([path], workers=1, period="day")
+    assert row == ("pump_shed/inlet",) + expected[1:]
+    assert row[2] == 119 * 60.0
+
+
+def test_csv_report_in_chunks_handles_gaps_and_resets(tmp_path):
+    path = tmp_path / "site.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "inlet_flow_rate", "inlet_total_volume", "outlet_flow_rate", "outlet_total_volume"])
+        total = 0.0
+        for second in range(7200):
+            rate = 30.0 if second < 3600 else 0.0
+            total += rate / 60.0
+            # The outlet's totals are reset half way through
+            outlet = total / 2 if second < 3600 else 0.0
+            writer.writerow([START + second, rate, total, rate / 2, outlet])
+        # Two hours offline, then one more reading
+        writer.writerow([START + 7200 + 7200, 0.0, total, 0.0, 0.0])
+
+    rows = build_report([path], workers=1, period="hour", threshold=20.0, chunk_rows=1000, max_gap_s=60.0)
+    report = _report(rows)
+    flowing, stopped = report[("site/inlet", START)], report[("site/inlet", START + 3600)]
+    # Each row adds the volume up to the next reading, which is 0 once the flow stops
+    assert flowing["volume"] == pytest.approx(3599 * 0.5)
+    assert flowing["exceedance_s"] == 3600.0
+    assert stopped["volume"] == 0.0
+    # The last reading before the outage only covers the longest gap
+    assert stopped["covered_s"] == 3600.0 - 1 + 60.0
+    assert stopped["no_flow_s"] == stopped["covered_s"]
+    assert report[("site/outlet", START + 3600)]["volume"] == 0.0
+    assert report[("site/outlet", START)]["mean_rate"] == 15.0
+
+
+def test_iso_times_and_trace_files(tmp_path):
+    path = tmp_path / "iso.csv"
+    path.write_text(
+        "timestamp,flow_rate,total_volume\n"
+        "2026-01-31T00:00:00,6.0,100.0\n"
+        "2026-01-31T00:00:10,6.0,101.0\n"
+        "2026-01-31T00:00:20,0.0,101.0\n"
+    )
+    (row,) = build_report([path], workers=1)
+    assert row[:4] == ("iso/meter", START, 20.0, 1.0)
+
+    # Offsets are applied rather than passed to NumPy, which would warn about them
+    path.write_text(
+        "timestamp,flow_rate,total_volume\n"
+        "2026-01-31T10:00:00+10:00,6.0,100.0\n"
+        "2026-01-31T00:00:10Z,6.0,101.0\n"
+        "2026-01-30T19:00:20-0500,0.0,101.0\n"
+    )
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        (row,) = build_report([path], workers=1)
+    assert row[:4] == ("iso/meter", START, 20.0, 1.0)
+
+    trace = tmp_path / "trace.bin"
+    writer = TraceWriter(trace)
+    writer.sample(START - 0.1, 3, False)
+    for i in range(450):
+        writer.sample(START + i * 0.2, 3, True)
+        writer.sample(START + i * 0.2 + 0.1, 3, False)
+    for i in range(90):
+        writer.edge(START + i, 5)
+    writer.close()
+
+    report = _report(build_report([trace], workers=1, pulses_per_litre=450.0, debounce_ms=0))
+    # The first pulse is counted in the row of the reading before it, the day before
+    assert report[("trace/pin3", START - DAY)]["volume"] == pytest.approx(1 / 450.0, abs=1e-4)
+    assert report[("trace/pin3", START)]["volume"] == pytest.approx(449 / 450.0, abs=1e-4)
+    # Edge-only pins count every edge but the first, which has no low level before it
+    assert report[("trace/pin5", START)]["volume"] == pytest.approx(89 / 450.0, abs=1e-4)
+
+
+def test_files_in_a_process_pool_merge_by_meter(tmp_path, capsys):
+    paths = []
+    for day in range(3):
+        path = tmp_path / f"day{day}" / "meter.csv"
+        path.parent.mkdir()
+        t0 = START + day * DAY
+        path.write_text(f"time,flow_rate,total_volume\n{t0},1.0,{day * 10.0}\n{t0 + 60},1.0,{day * 10.0 + 1.0}\n")
+        paths.append(path)
+
+    rows = build_report(paths, workers=3, period="month")
+    assert len(rows) == 2
+    january, february = _report(rows).values()
+    assert (january["volume"], february["volume"]) == (1.0, 2.0)
+    single = report_file(paths[0], period="month")
+    assert list(single) == ["meter/meter"]
+
+    main([str(p) for p in paths] + ["--period", "day", "--workers", "2"])
+    output = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+    assert output[0] == list(REPORT_FIELDS)
+    assert len(output) == 4
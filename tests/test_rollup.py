@@ -0,0 +1,150 @@
+"""
+Tests for the site rollup of many counters' totals and the flow balance.
+"""
+
+import pytest
+
+from flow_pulse_counter.alert_rules import AlertEngine
+from flow_pulse_counter.rollup import (
+    BALANCE_CHANNEL,
+    ROLE_INLET,
+    ROLE_MONITOR,
+    ROLE_OUTLET,
+    RULE_GAIN,
+    RULE_LOSS,
+    SiteRollup,
+    Source,
+    imbalance_rules,
+)
+
+from .fakes import FakeTagBus
+
+SOURCES = [
+    Source("pump_shed", "inlet_a", ROLE_INLET, "Inlet A"),
+    Source("pump_shed", "inlet_b", ROLE_INLET, "Inlet B"),
+    Source("tank", "", ROLE_OUTLET, "Outlet"),
+    Source("yard", "", ROLE_MONITOR, "Yard"),
+]
+
+
+def _meter(prefix, flow_rate, total_volume, pulse_count=0):
+    tag = (lambda n: f"{prefix}_{n}") if prefix else (lambda n: n)
+    return {tag("flow_rate"): flow_rate, tag("total_volume"): total_volume, tag("pulse_count"): pulse_count}
+
+
+def _bus(rollup):
+    bus = FakeTagBus()
+    bus.add_subscription("tag_values", lambda _, tag_values: rollup.apply(tag_values))
+    return bus
+
+
+def test_rollup_sums_increments_from_each_source():
+    rollup = SiteRollup(SOURCES)
+    bus = _bus(rollup)
+
+    # First totals only set the baselines
+    bus.publish("pump_shed", {**_meter("inlet_a", 10.0, 1000.0, 450000), **_meter("inlet_b", 5.0, 200.0)})
+    bus.publish("yard", _meter("", 1.0, 50.0))
+    assert not rollup.balanced
+    assert rollup.imbalance == 0.0
+
+    bus.publish("tank", _meter("", 14.0, 5000.0))
+    assert rollup.balanced
+    assert rollup.total_volume == 0.0
+    assert rollup.inlet_rate == pytest.approx(15.0)
+    assert rollup.outlet_rate == pytest.approx(14.0)
+    assert rollup.total_rate == pytest.approx(30.0)
+
+    bus.publish("pump_shed", _meter("inlet_a", 12.0, 1010.0, 454500))
+    bus.publish("tank", _meter("", 14.0, 5008.0))
+    bus.publish("yard", _meter("", 0.0, 52.0))
+    assert rollup.inlet_volume == pytest.approx(10.0)
+    assert rollup.outlet_volume == pytest.approx(8.0)
+    assert rollup.unaccounted_volume == pytest.approx(2.0)
+    assert rollup.total_volume == pytest.approx(20.0)
+    assert rollup.total_pulses == 4500
+    assert rollup.inlet_rate == pytest.approx(17.0)
+    assert rollup.imbalance == pytest.approx(3.0 / 17.0 * 100.0)
+
+
+def test_reset_counter_only_moves_its_baseline():
+    rollup = SiteRollup(SOURCES[:1])
+    rollup.update(0, 1.0, 100.0)
+    rollup.update(0, 1.0, 110.0)
+    # Counter totals were reset from its UI
+    rollup.update(0, 1.0, 0.0)
+    rollup.update(0, 1.0, 4.0)
+    assert rollup.inlet_volume == pytest.approx(14.0)
+    assert rollup.stats()["source_resets"] == 1
+
+
+def test_unrelated_apps_and_tags_are_ignored():
+    rollup = SiteRollup(SOURCES)
+    bus = _bus(rollup)
+    bus.publish("other_app", _meter("", 99.0, 1.0))
+    bus.publish("pump_shed", {"diagnostics": {}, "inlet_a_status": "Running"})
+    assert rollup.total_rate == 0.0
+    assert rollup.stats()["sources_reporting"] == 0
+
+
+def test_only_sources_with_changed_tags_are_updated():
+    rollup = SiteRollup(SOURCES)
+    bus = _bus(rollup)
+    bus.publish("pump_shed", {**_meter("inlet_a", 10.0, 100.0), **_meter("inlet_b", 5.0, 200.0)})
+    bus.publish("tank", _meter("", 14.0, 500.0))
+    assert rollup.stats()["source_updates"] == 3
+
+    # Every message carries every app's tags; only Inlet B and the tank changed here
+    bus.publish("pump_shed", {"inlet_b_total_volume": 201.0, "inlet_a_status": "Running"})
+    bus.publish("tank", {"flow_rate": 15.0})
+    bus.publish("yard", {"status": "Running"})
+    assert rollup.stats()["source_updates"] == 5
+    assert rollup.inlet_volume == pytest.approx(1.0)
+    assert rollup.outlet_rate == pytest.approx(15.0)
+
+
+def test_rate_sums_are_resummed_exactly():
+    rollup = SiteRollup(SOURCES)
+    rollup.RESUM_INTERVAL = 100
+    for i in range(996):
+        rollup.update(i % 4, 0.1 * (i % 7) + 1e9 * (i % 2))
+    for index in range(4):
+        rollup.update(index, 0.0)
+    assert rollup.total_rate == 0.0
+    assert rollup.inlet_rate == 0.0
+
+
+def test_imbalance_is_flagged_after_the_on_delay():
+    rollup = SiteRollup(SOURCES[:3])
+    engine = AlertEngine(imbalance_rules(5.0, 0.2, 300.0, 60.0, 3600.0))
+    bus = _bus(rollup)
+    bus.publish("pump_shed", {**_meter("inlet_a", 10.0, 0.0), **_meter("inlet_b", 10.0, 0.0)})
+    bus.publish("tank", _meter("", 18.0, 0.0))
+
+    assert rollup.imbalance == pytest.approx(10.0)
+    assert engine.evaluate(BALANCE_CHANNEL, 0.0, rollup.imbalance) == ()
+    (kind, active, message), = engine.evaluate(BALANCE_CHANNEL, 300.0, rollup.imbalance)
+    assert (kind, active) == (RULE_LOSS, True)
+    assert "10.0% below" in message
+
+    # Back within the threshold but not the hysteresis band, so the loss stays flagged
+    bus.publish("tank", _meter("", 19.1, 0.0))
+    assert engine.evaluate(BALANCE_CHANNEL, 400.0, rollup.imbalance) == ()
+    assert engine.evaluate(BALANCE_CHANNEL, 500.0, rollup.imbalance) == ()
+    assert engine.is_active(BALANCE_CHANNEL, RULE_LOSS)
+
+    bus.publish("tank", _meter("", 21.5, 0.0))
+    engine.evaluate(BALANCE_CHANNEL, 600.0, rollup.imbalance)
+    changes = engine.evaluate(BALANCE_CHANNEL, 660.0, rollup.imbalance)
+    assert (RULE_LOSS, False, None) in changes
+    engine.evaluate(BALANCE_CHANNEL, 960.0, rollup.imbalance)
+    assert engine.is_active(BALANCE_CHANNEL, RULE_GAIN)
+
+
+def test_no_balance_without_flow():
+    rollup = SiteRollup(SOURCES[:3])
+    for index in range(3):
+        rollup.update(index, 0.0, 0.0)
+    assert rollup.balanced
+    assert rollup.imbalance == 0.0
+    assert imbalance_rules(0.0, 0.2, 1.0, 1.0, 1.0) == []
@@ -0,0 +1,56 @@
+"""
+Tests for the adaptive acquisition scheduler.
+"""
+
+import pytest
+
+from flow_pulse_counter.scheduler import AdaptiveScheduler
+
+
+def test_backs_off_gradually_to_the_idle_period_without_flow():
+    scheduler = AdaptiveScheduler(base_period_s=0.2, idle_period_s=1.0, idle_after_s=10.0, sampled=False)
+    scheduler.update(0.0, 5.0, 0.001)
+    assert scheduler.period == 0.2
+
+    # Flow stopped recently, stay at the base period
+    assert scheduler.update(5.0, 0.0, 0.001) == 0.2
+
+    periods = [scheduler.update(10.0 + i, 0.0, 0.001) for i in range(6)]
+    assert periods[0] == pytest.approx(0.3)
+    assert periods == sorted(periods)
+    assert periods[-1] == 1.0
+
+    # Flow resuming tightens straight back
+    assert scheduler.update(20.0, 2.0, 0.001) == 0.2
+
+
+def test_tightens_with_pulse_frequency_when_polling():
+    scheduler = AdaptiveScheduler(base_period_s=0.2, min_period_s=0.01, samples_per_pulse=4)
+    assert scheduler.update(0.0, 10.0, 0.0) == pytest.approx(0.025)
+    assert scheduler.aliasing_risk == pytest.approx(0.5)
+    assert not scheduler.sampling_limited
+
+    # Counters and edge events don't alias, so there's no need to read faster
+    counter = AdaptiveScheduler(base_period_s=0.2, sampled=False)
+    assert counter.update(0.0, 1000.0, 0.0) == 0.2
+    assert counter.aliasing_risk == 0.0
+
+
+def test_cpu_budget_limits_the_period_and_flags_sampling_limited():
+    scheduler = AdaptiveScheduler(base_period_s=0.2, min_period_s=0.01, cpu_budget=0.2)
+    scheduler.read_time = 0.01
+    # 50 Hz needs 5 ms reads, but 10 ms reads at 20% budget allow no less than 50 ms
+    assert scheduler.update(0.0, 50.0, 0.01) == pytest.approx(0.05)
+    assert scheduler.sampling_limited
+    assert scheduler.aliasing_risk == 1.0
+    assert scheduler.stats()["sampling_limited"] is True
+
+    scheduler.update(1.0, 2.0, 0.01)
+    assert not scheduler.sampling_limited
+
+
+def test_rejects_inconsistent_periods():
+    with pytest.raises(ValueError):
+        AdaptiveScheduler(base_period_s=0.2, min_period_s=0.5)
+    with pytest.raises(ValueError):
+        AdaptiveScheduler(cpu_budget=0)
@@ -0,0 +1,68 @@
+"""
+Tests for the compiled runtime settings snapshot.
+"""
+
+import pytest
+from pydoover import config
+
+from flow_pulse_counter.acquisition import ACQUISITION_STREAM
+from flow_pulse_counter.app_config import FlowPulseCounterConfig
+from flow_pulse_counter.channels import MeterChannel
+from flow_pulse_counter.scheduler import MIN_ACQUISITION_PERIOD, AdaptiveScheduler
+from flow_pulse_counter.settings import RuntimeSettings, compile_settings
+
+
+def _settings(**values):
+    defaults = {name: 0 for name in RuntimeSettings.__slots__}
+    defaults["channels"] = (MeterChannel(0, "", "Main", 1),)
+    defaults["batch_output_pin"] = -1
+    return RuntimeSettings(**{**defaults, **values})
+
+
+def test_settings_are_immutable():
+    settings = _settings(flow_rate_factor=60.0)
+    with pytest.raises(AttributeError):
+        settings.flow_rate_factor = 1.0
+    with pytest.raises(TypeError):
+        RuntimeSettings(flow_rate_factor=1.0)
+    assert not settings.batching
+    assert _settings(batch_output_pin=2).batching
+
+
+def test_changed_and_replace():
+    settings = _settings(flow_rate_unit="L/min", flow_rate_factor=1.0)
+    updated = settings.replace(flow_rate_unit="L/hr", flow_rate_factor=60.0)
+    assert settings.changed(updated) == {"flow_rate_unit", "flow_rate_factor"}
+    assert settings.flow_rate_factor == 1.0
+    assert updated.replace(flow_rate_unit="L/min", flow_rate_factor=1.0) == settings
+
+    # Channels compare by value, so recompiling an unchanged config changes nothing
+    same = _settings(flow_rate_unit="L/min", flow_rate_factor=1.0)
+    assert same == settings
+    assert settings.same_meters(settings.replace(channels=(MeterChannel(0, "", "Main", 1, pulses_per_litre=5.0),)))
+    assert not settings.same_meters(settings.replace(channels=(MeterChannel(0, "", "Main", 2),)))
+
+
+def test_out_of_range_scheduler_settings_are_clamped(monkeypatch, caplog):
+    # pydoover keeps one element map per process, shared by every schema
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    schema = FlowPulseCounterConfig()
+    schema._inject_deployment_config(
+        {"min_acquisition_period": 0, "idle_acquisition_period": 2.0, "acquisition_cpu_budget": 250}
+    )
+    settings = compile_settings(schema)
+
+    assert settings.min_acquisition_period == MIN_ACQUISITION_PERIOD
+    assert settings.idle_acquisition_period == 2.0
+    assert settings.acquisition_cpu_budget == 1.0
+    assert len([r for r in caplog.records if r.levelname == "WARNING"]) == 2
+    # What the app would otherwise crash-loop on
+    AdaptiveScheduler(min_period_s=settings.min_acquisition_period, cpu_budget=settings.acquisition_cpu_budget)
+
+
+def test_counter_mode_is_read_as_pulse_stream(monkeypatch, caplog):
+    monkeypatch.setattr(config.Schema, "_Schema__element_map", {})
+    schema = FlowPulseCounterConfig()
+    schema._inject_deployment_config({"acquisition_mode": "Counter"})
+    assert compile_settings(schema).acquisition_mode == ACQUISITION_STREAM
+    assert "renamed" in caplog.text
@@ -0,0 +1,87 @@
+"""
+Tests for sharded acquisition in worker processes over shared memory.
+"""
+
+import asyncio
+import functools
+import time
+
+import pytest
+
+from flow_pulse_counter.acquisition import ACQUISITION_STREAM
+from flow_pulse_counter.channels import MeterChannel
+from flow_pulse_counter.sharding import SharedCounters, ShardedBackend, shard_groups
+
+from .fakes import ClockPlatform
+
+SCHEDULE = {"base_period_s": 0.02, "min_period_s": 0.02, "idle_period_s": 0.02}
+
+
+def test_shard_groups_split_channels_evenly():
+    assert shard_groups(5, 2) == [(0, 3), (3, 5)]
+    assert shard_groups(4, 4) == [(0, 1), (1, 2), (2, 3), (3, 4)]
+    # Never more shards than channels
+    assert shard_groups(2, 8) == [(0, 1), (1, 2)]
+
+
+def test_shared_counters_are_visible_across_attachments():
+    owner = SharedCounters(3, 2)
+    try:
+        attached = SharedCounters(3, 2, name=owner.name)
+        attached.counts[1] += 7
+        attached.edge_times[1] = 12.5
+        assert list(owner.counts) == [0, 7, 0]
+        assert owner.edge_times[1] == 12.5
+        attached.close()
+    finally:
+        owner.close()
+        owner.unlink()
+
+
+async def _wait_for(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+@pytest.mark.asyncio
+async def test_restarted_worker_carries_on_from_the_shared_counts():
+    channels = [MeterChannel(i, f"m{i}", f"Meter {i}", pin=i) for i in range(4)]
+    backend = ShardedBackend(
+        ACQUISITION_STREAM,
+        functools.partial(ClockPlatform, 1000.0),
+        channels,
+        shards=2,
+        schedule=SCHEDULE,
+        supervise_interval_s=3600.0,
+    )
+    await backend.start()
+    totals = [0] * 4
+
+    async def read():
+        for i, pulses in enumerate(await backend.read(time.time())):
+            totals[i] += pulses
+
+    try:
+        shared = backend.shared
+        await _wait_for(lambda: min(shared.counts) > 0)
+        await read()
+        started = time.time()
+
+        backend.workers[0].kill()
+        await asyncio.to_thread(backend.workers[0].join)
+        await asyncio.sleep(0.2)
+        stalled = shared.counts[0]
+        await backend.supervise(time.time())
+        assert backend.stats() == {"shards": 2, "shard_restarts": 1}
+
+        await _wait_for(lambda: shared.counts[0] > stalled + 200)
+        await read()
+        # The new worker's counter starts from zero: it adds to the total, and
+        # pulses while the shard was down are missed rather than read as a wrap
+        assert stalled + 200 < totals[0] < stalled + 1000.0 * (time.time() - started)
+        assert totals[2] > totals[0]
+        assert backend.last_edge_time[0] > 0
+    finally:
+        await backend.stop()
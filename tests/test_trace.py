@@ -0,0 +1,81 @@
+"""
+Tests for pulse trace recording and replay.
+"""
+
+import pytest
+
+from flow_pulse_counter.replay import replay
+from flow_pulse_counter.trace import KIND_EDGE, KIND_SAMPLE, RecordingPlatform, TraceReader, TraceWriter
+
+from .fakes import FakePlatform
+
+
+def _write_pulse_train(path, pulses, period=1.0, sample_period=0.2):
+    writer = TraceWriter(path)
+    t = 1000.0
+    # Polling needs to see the input low before it can count the first edge
+    writer.sample(t - sample_period, 3, False)
+    for i in range(pulses):
+        edge = t + i * period
+        writer.edge(edge, 3)
+        for step in range(int(period / sample_period)):
+            writer.sample(edge + step * sample_period, 3, step * sample_period < period / 2)
+    writer.close()
+
+
+def test_trace_round_trip_and_size_limit(tmp_path):
+    path = tmp_path / "trace.bin"
+    writer = TraceWriter(path, max_bytes=12 + 12 * 3)
+    writer.sample(1.0, 1, True)
+    writer.edge(1.5, 1)
+    writer.sample(2.0, 1, False)
+    writer.sample(3.0, 1, True)
+    writer.close()
+
+    with TraceReader(path) as reader:
+        assert len(reader) == 3
+        assert list(reader) == [(1.0, 1, KIND_SAMPLE, 1), (1.5, 1, KIND_EDGE, 1), (2.0, 1, KIND_SAMPLE, 0)]
+
+
+@pytest.mark.asyncio
+async def test_recording_platform_records_di_reads(tmp_path):
+    platform = FakePlatform()
+    platform.levels = {1: True, 2: False}
+    writer = TraceWriter(tmp_path / "trace.bin")
+    recording = RecordingPlatform(platform, writer)
+
+    assert await recording.get_di_async([1, 2]) == [True, False]
+    writer.close()
+
+    with TraceReader(tmp_path / "trace.bin") as reader:
+        assert [(pin, kind, level) for _, pin, kind, level in reader] == [(1, KIND_SAMPLE, 1), (2, KIND_SAMPLE, 0)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["Polling", "Events", None])
+async def test_replay_reports_count_accuracy(tmp_path, mode):
+    path = tmp_path / "trace.bin"
+    _write_pulse_train(path, pulses=120)
+
+    report = await replay(path, mode=mode, pulses_per_litre=10.0)
+
+    assert report["mode"] == (mode or "Polling")
+    assert report["edges"] == 120
+    channel = report["channels"][0]
+    assert channel["pin"] == 3
+    assert channel["expected_pulses"] == 120
+    assert channel["count_error"] == 0
+    assert channel["flow_rate_max_error"] is not None
+
+
+@pytest.mark.asyncio
+async def test_replay_keeps_up_with_fast_edge_bursts(tmp_path):
+    path = tmp_path / "trace.bin"
+    writer = TraceWriter(path)
+    # 10 kHz, so each 0.2 s read sees 2000 edges, more than the event queue holds
+    for i in range(6000):
+        writer.edge(1000.0 + i * 1e-4, 3)
+    writer.close()
+
+    report = await replay(path, mode="Events", debounce_ms=0)
+    assert report["channels"][0]["count_error"] == 0
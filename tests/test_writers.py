@@ -0,0 +1,128 @@
+"""
+Tests for the background tag writer and alert dispatcher.
+"""
+
+import asyncio
+
+import pytest
+
+from flow_pulse_counter.writers import AlertDispatcher, TagWriter
+
+
+@pytest.mark.asyncio
+async def test_writes_are_coalesced_into_one_batch():
+    batches = []
+
+    async def write_tags(tags):
+        batches.append(dict(tags))
+
+    writer = TagWriter(write_tags, batch_delay_s=0.01)
+    writer.start()
+    writer.write("total_volume", 1.0)
+    writer.write("pulse_count", 10)
+    writer.write("total_volume", 2.0)
+    assert writer.queue_depth == 2
+
+    await asyncio.sleep(0.05)
+    await writer.stop()
+
+    assert batches == [{"total_volume": 2.0, "pulse_count": 10}]
+    assert writer.queue_depth == 0
+    assert writer.flushes == 1
+
+
+@pytest.mark.asyncio
+async def test_bounded_queue_and_failed_flush_keeps_newer_values():
+    async def fail(tags):
+        writer.write("a", 3)
+        raise RuntimeError("agent unavailable")
+
+    writer = TagWriter(fail, max_pending=2)
+    writer.write("a", 1)
+    writer.write("b", 2)
+    assert not writer.write("c", 3)
+    assert writer.dropped_writes == 1
+
+    with pytest.raises(RuntimeError):
+        await writer.flush()
+
+    # The failed batch is retried, but the write made during the flush wins
+    assert writer._pending == {"a": 3, "b": 2}
+    assert writer.failed_flushes == 1
+
+
+@pytest.mark.asyncio
+async def test_stop_lets_a_flush_in_progress_finish():
+    written = []
+    started = asyncio.Event()
+
+    async def slow_write(tags):
+        started.set()
+        await asyncio.sleep(0.05)
+        written.append(dict(tags))
+
+    writer = TagWriter(slow_write, batch_delay_s=0.0)
+    writer.start()
+    writer.write("total_volume", 5.0)
+    await started.wait()
+    writer.write("pulse_count", 50)
+    await writer.stop()
+
+    # The batch being written isn't lost to a cancellation, and later writes follow it
+    assert written == [{"total_volume": 5.0}, {"pulse_count": 50}]
+    assert writer.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_flush_keeps_its_batch():
+    async def hang(tags):
+        await asyncio.Event().wait()
+
+    writer = TagWriter(hang)
+    writer.write("total_volume", 1.0)
+    flush = asyncio.create_task(writer.flush())
+    await asyncio.sleep(0)
+    writer.write("pulse_count", 10)
+    flush.cancel()
+    await asyncio.gather(flush, return_exceptions=True)
+    assert writer._pending == {"total_volume": 1.0, "pulse_count": 10}
+
+
+@pytest.mark.asyncio
+async def test_alerts_are_rate_limited_and_bounded():
+    sent = []
+
+    async def send_alert(message):
+        sent.append(message)
+
+    alerts = AlertDispatcher(send_alert, max_pending=2, min_interval_s=0.05)
+    assert alerts.send("one")
+    assert alerts.send("two")
+    assert not alerts.send("three")
+    assert alerts.dropped == 1
+
+    alerts.start()
+    await asyncio.sleep(0.01)
+    assert sent == ["one"]
+    await asyncio.sleep(0.06)
+    await alerts.stop()
+    assert sent == ["one", "two"]
+    assert alerts.stats()["alerts_sent"] == 2
+
+
+@pytest.mark.asyncio
+async def test_stop_lets_an_alert_being_sent_finish():
+    sent = []
+    started = asyncio.Event()
+
+    async def send_alert(message):
+        started.set()
+        await asyncio.sleep(0.05)
+        sent.append(message)
+
+    alerts = AlertDispatcher(send_alert)
+    alerts.start()
+    alerts.send("high flow")
+    await started.wait()
+    await alerts.stop()
+    assert sent == ["high flow"]